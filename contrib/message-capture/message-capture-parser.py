@@ -15,7 +15,7 @@ from typing import Any, Optional
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '../../test/functional'))
 
-from test_framework.messages import ser_uint256     # noqa: E402
+from test_framework.messages import deserialize_message, ser_uint256     # noqa: E402
 from test_framework.p2p import MESSAGEMAP           # noqa: E402
 
 TIME_SIZE = 8
@@ -76,6 +76,9 @@ def to_jsonable(obj: Any) -> Any:
     elif hasattr(obj, "__slots__"):
         ret = {}    # type: Any
         for slot in obj.__slots__:
+            if slot.startswith("_"):
+                # Skip internal caches
+                continue
             val = getattr(obj, slot, None)
             if slot in HASH_INTS and isinstance(val, int):
                 ret[slot] = ser_uint256(val).hex()
@@ -119,7 +122,7 @@ def process_file(path: str, messages: list[Any], recv: bool, progress_bar: Optio
             msg_dict["time"] = time
             msg_dict["size"] = length   # "size" is less readable here, but more readable in the output
 
-            msg_ser = BytesIO(f_in.read(length))
+            msg_ser = f_in.read(length)
 
             # Determine message type
             if msgtype not in MESSAGEMAP:
@@ -131,7 +134,7 @@ def process_file(path: str, messages: list[Any], recv: bool, progress_bar: Optio
                     msg_dict["msgtype"] = msgtype_tmp
                 except UnicodeDecodeError:
                     msg_dict["msgtype"] = "UNREADABLE"
-                msg_dict["body"] = msg_ser.read().hex()
+                msg_dict["body"] = msg_ser.hex()
                 msg_dict["error"] = "Unrecognized message type."
                 messages.append(msg_dict)
                 print(f"WARNING - Unrecognized message type {msgtype} in {path}", file=sys.stderr)
@@ -142,13 +145,12 @@ def process_file(path: str, messages: list[Any], recv: bool, progress_bar: Optio
             msg_dict["msgtype"] = msgtype.decode()
 
             try:
-                msg.deserialize(msg_ser)
+                deserialize_message(msg, msg_ser)
             except KeyboardInterrupt:
                 raise
             except Exception:
                 # Unable to deserialize message body
-                msg_ser.seek(0, os.SEEK_SET)
-                msg_dict["body"] = msg_ser.read().hex()
+                msg_dict["body"] = msg_ser.hex()
                 msg_dict["error"] = "Unable to deserialize message."
                 messages.append(msg_dict)
                 print(f"WARNING - Unable to deserialize message in {path}", file=sys.stderr)
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# Copyright (c) 2025-present The Bitcoin Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""Tool to compute the MuHash of a compact-serialized UTXO set.
+
+The input UTXO set can be generated by Bitcoin Core with the `dumptxoutset` RPC:
+$ bitcoin-cli dumptxoutset ~/utxos.dat latest
+
+The printed hash is computed independently of the node and can be compared
+with the `muhash` field of `gettxoutsetinfo muhash` at the snapshot block.
+Hashing is spread over all CPU cores by default (see --jobs); installing the
+`cryptography` package speeds it up considerably.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from utxo_to_sqlite import (
+    NET_MAGIC_BYTES,
+    UTXO_DUMP_MAGIC,
+    UTXO_DUMP_VERSION,
+    decompress_amount,
+    decompress_script,
+    read_compactsize,
+    read_varint,
+)
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../test/functional'))
+
+from test_framework.crypto.muhash import MUHASH_SHARD_SIZE, MuHash3072  # noqa: E402
+from test_framework.messages import ser_compact_size  # noqa: E402
+
+
+def read_coins(f, num_utxos):
+    """Yield every coin of the dump as serialized for MuHash (see `TxOutSer` in the coinstats module)."""
+    coins_per_hash_left = 0
+    prevout_hash = None
+    for _ in range(num_utxos):
+        if coins_per_hash_left == 0:  # read next prevout hash
+            prevout_hash = f.read(32)
+            coins_per_hash_left = read_compactsize(f)
+        prevout_index = read_compactsize(f)
+        code = read_varint(f)
+        amount = decompress_amount(read_varint(f))
+        scriptpubkey = decompress_script(f)
+        yield (prevout_hash + prevout_index.to_bytes(4, 'little') + code.to_bytes(4, 'little') +
+               amount.to_bytes(8, 'little', signed=True) + ser_compact_size(len(scriptpubkey)) + scriptpubkey)
+        coins_per_hash_left -= 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('infile', help='filename of compact-serialized UTXO set (input)')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='number of worker processes used for hashing (default: %(default)s)')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.infile):
+        print(f"Error: provided input file '{args.infile}' doesn't exist.")
+        sys.exit(1)
+
+    # read metadata (magic bytes, version, network magic, block hash, UTXO count)
+    f = open(args.infile, 'rb')
+    magic_bytes = f.read(5)
+    version = int.from_bytes(f.read(2), 'little')
+    network_magic = f.read(4)
+    block_hash = f.read(32)
+    num_utxos = int.from_bytes(f.read(8), 'little')
+    if magic_bytes != UTXO_DUMP_MAGIC:
+        print(f"Error: provided input file '{args.infile}' is not an UTXO dump.")
+        sys.exit(1)
+    if version != UTXO_DUMP_VERSION:
+        print(f"Error: provided input file '{args.infile}' has unknown UTXO dump version {version} "
+              f"(only version {UTXO_DUMP_VERSION} supported)")
+        sys.exit(1)
+    network_string = NET_MAGIC_BYTES.get(network_magic, f"unknown network ({network_magic.hex()})")
+    print(f"UTXO Snapshot for {network_string} at block hash "
+          f"{block_hash[::-1].hex()[:32]}..., contains {num_utxos} coins", file=sys.stderr)
+
+    start_time = time.time()
+    muhash = MuHash3072()
+    executor = ProcessPoolExecutor(args.jobs) if args.jobs > 1 else None
+    batch_size = MUHASH_SHARD_SIZE * max(args.jobs, 1) * 4
+    batch = []
+    for coin_idx, coin in enumerate(read_coins(f, num_utxos), start=1):
+        batch.append(coin)
+        if len(batch) == batch_size or coin_idx == num_utxos:
+            muhash.insert_many(batch, executor)
+            batch.clear()
+            elapsed = time.time() - start_time
+            print(f"{coin_idx} coins hashed [{coin_idx/num_utxos*100:.2f}%], "
+                  f"{elapsed:.3f}s passed since start", file=sys.stderr)
+    if executor is not None:
+        executor.shutdown()
+
+    if f.read(1) != b'':  # EOF should be reached by now
+        print(f"WARNING: input file {args.infile} has not reached EOF yet!")
+        sys.exit(1)
+    print(muhash.digest()[::-1].hex())
+
+
+if __name__ == '__main__':
+    main()
@@ -8,6 +8,8 @@ import hashlib
 import struct
 import time
 
+from genesis_mining import HeaderTemplate, mine_header
+
 def create_genesis_block():
     # IndiCoin parameters
     name = "IndiCoin"
@@ -145,44 +147,21 @@ def calculate_transaction_id(tx):
     tx_hash = hashlib.sha256(tx_data.encode()).hexdigest()
     return tx_hash
 
-def mine_genesis_block(block, target_bits):
-    """Simple genesis block mining - find a nonce that produces a valid hash"""
-    target = (1 << (256 - target_bits.bit_length() + 1)) - 1
-    
-    for nonce in range(1000000):  # Try up to 1 million nonces
-        block['nNonce'] = nonce
-        
-        # Create block header
-        header = create_block_header(block)
-        
-        # Calculate hash
-        block_hash = double_sha256(header)
-        
-        # Check if hash is less than target
-        if int(block_hash, 16) < target:
-            block['hash'] = block_hash
-            print(f"Genesis block found with nonce: {nonce}")
-            return block
-    
-    raise Exception("Failed to find valid genesis block nonce")
-
-def create_block_header(block):
-    """Create serialized block header"""
-    # Bitcoin block header format
-    version = struct.pack('<I', block['version'])
-    prev_hash = bytes.fromhex(block['hashPrevBlock'])
-    merkle_root = bytes.fromhex(block['hashMerkleRoot'])
-    timestamp = struct.pack('<I', block['nTime'])
-    bits = struct.pack('<I', block['nBits'])
-    nonce = struct.pack('<I', block['nNonce'])
-    
-    return version + prev_hash + merkle_root + timestamp + bits + nonce
-
-def double_sha256(data):
-    """Calculate double SHA256 hash"""
-    first_hash = hashlib.sha256(data).digest()
-    second_hash = hashlib.sha256(first_hash).digest()
-    return second_hash.hex()
+def mine_genesis_block(block, target_bits, jobs=None):
+    """Mine the genesis block on all cores - find a nonce that produces a valid hash"""
+    template = HeaderTemplate(block['version'], bytes.fromhex(block['hashPrevBlock']),
+                              bytes.fromhex(block['hashMerkleRoot']), target_bits)
+    
+    # Roll nTime forward for up to an hour once the nonce space is exhausted
+    result = mine_header(template, block['nTime'], ntime_count=3600, jobs=jobs)
+    if result is None:
+        raise Exception("Failed to find valid genesis block nonce")
+    
+    block['nTime'] = result['ntime']
+    block['nNonce'] = result['nonce']
+    block['hash'] = result['hash']
+    print(f"Genesis block found with nonce: {result['nonce']}")
+    return block
 
 if __name__ == "__main__":
     genesis_block = create_genesis_block()
\ No newline at end of file
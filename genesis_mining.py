@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Parallel Header Mining Engine for IndiCoin
+Shared by the genesis generators to grind block headers on every core
+
+The search space is enumerated as (extraNonce, nTime, nonce range) work units
+that are handed out to a process pool. Each work unit hashes the first 64
+header bytes once and reuses that SHA-256 midstate for every nonce, so only
+the final 16 bytes are hashed per attempt. Progress can be checkpointed to a
+JSON file so that long runs can be resumed.
+"""
+
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import struct
+import time
+
+NONCE_SPACE = 1 << 32
+DEFAULT_CHUNK_SIZE = 1 << 20
+CHECKPOINT_VERSION = 1
+
+_U32 = struct.Struct('<I')
+_TAIL = struct.Struct('<4sII')
+
+
+def bits_to_target(nbits):
+    """Expand a compact nBits value into the full 256-bit target"""
+    exponent = nbits >> 24
+    mantissa = nbits & 0x007fffff
+    if exponent <= 3:
+        return mantissa >> (8 * (3 - exponent))
+    return mantissa << (8 * (exponent - 3))
+
+
+def block_hash_hex(digest):
+    """Render a raw double-SHA256 digest the way the node displays block hashes"""
+    return digest[::-1].hex()
+
+
+class HeaderTemplate:
+    """Fixed part of a block header being mined
+
+    prev_hash and merkle_root are 32-byte values in serialization order. When
+    merkle_root_fn is given it must be a picklable callable (a module-level
+    function or functools.partial) mapping an extraNonce to the merkle root of
+    the block built with that extraNonce.
+    """
+
+    def __init__(self, version, prev_hash, merkle_root, nbits, merkle_root_fn=None):
+        if len(prev_hash) != 32 or len(merkle_root) != 32:
+            raise ValueError("prev_hash and merkle_root must be 32 bytes")
+        self.version = version
+        self.prev_hash = bytes(prev_hash)
+        self.merkle_root = bytes(merkle_root)
+        self.nbits = nbits
+        self.merkle_root_fn = merkle_root_fn
+
+    def get_merkle_root(self, extra_nonce):
+        if self.merkle_root_fn is None:
+            return self.merkle_root
+        return self.merkle_root_fn(extra_nonce)
+
+    def serialize(self, extra_nonce, ntime, nonce):
+        """Return the full 80-byte header"""
+        return (_U32.pack(self.version) + self.prev_hash + self.get_merkle_root(extra_nonce) +
+                _U32.pack(ntime) + _U32.pack(self.nbits) + _U32.pack(nonce))
+
+    def fingerprint(self):
+        """Identify the job in checkpoint files"""
+        return {
+            'version': self.version,
+            'prev_hash': self.prev_hash.hex(),
+            'merkle_root': self.merkle_root.hex(),
+            'nbits': self.nbits,
+        }
+
+
+def iter_work_units(ntime_start, ntime_count=1, extra_nonce_count=1, chunk_size=DEFAULT_CHUNK_SIZE, start_index=0):
+    """Enumerate work units as (index, extra_nonce, ntime, nonce_start, nonce_end)
+
+    The order is deterministic so that a checkpointed index identifies exactly
+    which part of the search space has already been covered.
+    """
+    chunks_per_time = (NONCE_SPACE + chunk_size - 1) // chunk_size
+    total = extra_nonce_count * ntime_count * chunks_per_time
+    for index in range(start_index, total):
+        rest, chunk = divmod(index, chunks_per_time)
+        extra_nonce, time_offset = divmod(rest, ntime_count)
+        nonce_start = chunk * chunk_size
+        nonce_end = min(nonce_start + chunk_size, NONCE_SPACE)
+        yield index, extra_nonce, ntime_start + time_offset, nonce_start, nonce_end
+
+
+def scan_work_unit(template, target, extra_nonce, ntime, nonce_start, nonce_end):
+    """Grind one nonce range, returning (nonce, digest) of the first hit or None"""
+    header = _U32.pack(template.version) + template.prev_hash + template.get_merkle_root(extra_nonce)
+    midstate = hashlib.sha256(header[:64])
+    tail = _TAIL.pack(header[64:68], ntime, template.nbits)
+    # Any hash at or below the target has at least this many zero bytes at
+    # the (little-endian) top, which lets us skip most integer conversions.
+    zero_suffix = bytes((256 - target.bit_length()) // 8)
+    copy = midstate.copy
+    sha256 = hashlib.sha256
+    pack_nonce = _U32.pack
+    for nonce in range(nonce_start, nonce_end):
+        inner = copy()
+        inner.update(tail + pack_nonce(nonce))
+        digest = sha256(inner.digest()).digest()
+        if digest.endswith(zero_suffix) and int.from_bytes(digest, 'little') <= target:
+            return nonce, digest
+    return None
+
+
+_worker_job = None
+
+
+def _init_worker(template, target):
+    global _worker_job
+    _worker_job = (template, target)
+
+
+def _run_work_unit(unit):
+    index, extra_nonce, ntime, nonce_start, nonce_end = unit
+    template, target = _worker_job
+    return index, unit, nonce_end - nonce_start, scan_work_unit(template, target, extra_nonce, ntime, nonce_start, nonce_end)
+
+
+def load_checkpoint(path):
+    """Return the saved checkpoint dict, or None if there is none"""
+    if path is None or not os.path.exists(path):
+        return None
+    with open(path, encoding='utf8') as f:
+        checkpoint = json.load(f)
+    if checkpoint.get('checkpoint_version') != CHECKPOINT_VERSION:
+        raise ValueError(f"Unsupported checkpoint format in {path}")
+    return checkpoint
+
+
+def _write_checkpoint(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf8') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def mine_header(template, ntime_start, *, ntime_count=1, extra_nonce_count=1, jobs=None,
+                chunk_size=DEFAULT_CHUNK_SIZE, checkpoint_path=None, checkpoint_interval=30,
+                progress=None):
+    """Search for a header at or below the template's target
+
+    Work units are spread over `jobs` processes (default: all cores). When
+    `checkpoint_path` is set, the index below which every work unit has been
+    completed is saved every `checkpoint_interval` seconds and a matching
+    checkpoint is resumed from. `progress`, if given, is called with
+    (hashes_done, elapsed_seconds) after every completed work unit.
+
+    Returns a dict with the winning extra_nonce, ntime, nonce, header, hash and
+    merkle_root, or None if the whole search space was exhausted.
+    """
+    target = bits_to_target(template.nbits)
+    job = dict(template.fingerprint(), ntime_start=ntime_start, ntime_count=ntime_count,
+               extra_nonce_count=extra_nonce_count, chunk_size=chunk_size)
+
+    start_index = 0
+    hashes_done = 0
+    checkpoint = load_checkpoint(checkpoint_path)
+    if checkpoint is not None:
+        if checkpoint['job'] != job:
+            raise ValueError(f"Checkpoint {checkpoint_path} belongs to a different mining job")
+        start_index = checkpoint['next_unit']
+        hashes_done = checkpoint['hashes_done']
+
+    units = iter_work_units(ntime_start, ntime_count, extra_nonce_count, chunk_size, start_index)
+    # Results arrive out of order; only advance the checkpoint once every unit
+    # below it has finished.
+    pending = set()
+    next_unit = start_index
+    last_checkpoint = time.monotonic()
+    start_time = time.monotonic()
+
+    def save():
+        if checkpoint_path is not None:
+            _write_checkpoint(checkpoint_path, {
+                'checkpoint_version': CHECKPOINT_VERSION,
+                'job': job,
+                'next_unit': next_unit,
+                'hashes_done': hashes_done,
+            })
+
+    jobs = jobs or os.cpu_count() or 1
+    results = queue.SimpleQueue()
+    in_flight = 0
+    with multiprocessing.Pool(jobs, initializer=_init_worker, initargs=(template, target)) as pool:
+        # Keep a bounded number of work units queued so that huge search
+        # spaces do not get materialized up front.
+        for unit in itertools.chain(units, [None]):
+            if unit is not None:
+                pool.apply_async(_run_work_unit, (unit,), callback=results.put, error_callback=results.put)
+                in_flight += 1
+                if in_flight < jobs * 4:
+                    continue
+            while in_flight > (0 if unit is None else jobs * 4 - 1):
+                result = results.get()
+                in_flight -= 1
+                if isinstance(result, BaseException):
+                    raise result
+                index, done_unit, count, found = result
+                hashes_done += count
+                pending.add(index)
+                while next_unit in pending:
+                    pending.remove(next_unit)
+                    next_unit += 1
+                if progress is not None:
+                    progress(hashes_done, time.monotonic() - start_time)
+                if found is not None:
+                    pool.terminate()
+                    _, extra_nonce, ntime, _, _ = done_unit
+                    nonce, digest = found
+                    return {
+                        'extra_nonce': extra_nonce,
+                        'ntime': ntime,
+                        'nonce': nonce,
+                        'header': template.serialize(extra_nonce, ntime, nonce),
+                        'hash': block_hash_hex(digest),
+                        'merkle_root': template.get_merkle_root(extra_nonce),
+                        'hashes_done': hashes_done,
+                    }
+                if time.monotonic() - last_checkpoint >= checkpoint_interval:
+                    save()
+                    last_checkpoint = time.monotonic()
+    save()
+    return None
@@ -4,17 +4,24 @@ Enhanced Genesis Block Generator for IndiCoin
 Creates a proper genesis block with efficient mining
 """
 
+import argparse
 import hashlib
 import struct
 import time
 import os
 
-def create_enhanced_genesis_block():
+from genesis_mining import HeaderTemplate, bits_to_target, load_checkpoint, mine_header
+
+def create_enhanced_genesis_block(jobs=None, checkpoint_path=None, ntime_count=3600):
     """Create an enhanced genesis block for IndiCoin"""
     
     # IndiCoin parameters
     timestamp_msg = "The Times 03/Jan/2025 - IndiCoin: Controlled Inflation Digital Currency"
     nTime = int(time.time())
+    checkpoint = load_checkpoint(checkpoint_path)
+    if checkpoint is not None:
+        # Resume the interrupted run with the block time it was started with
+        nTime = checkpoint['job']['ntime_start']
     nNonce = 0
     nBits = 0x1d00ffff  # Same difficulty as Bitcoin (compact format)
     genesis_reward = 50 * 100000000  # 50 INDI in satoshis
@@ -32,102 +39,95 @@ def create_enhanced_genesis_block():
     print()
     
     # Create block header components
-    version = struct.pack('<I', 1)
     hashPrevBlock = bytes.fromhex('0000000000000000000000000000000000000000000000000000000000000000')
     
     # Create coinbase transaction
     coinbase_tx = create_coinbase_transaction(timestamp_msg, genesis_reward)
     merkle_root = coinbase_tx['txid']  # It's already a string
     
-    # Target calculation for difficulty 1
-    target = (1 << (256 - 32)) - 1  # Difficulty 1 target
+    target = bits_to_target(nBits)
     
-    print(f"🔍 Starting genesis block mining...")
+    print(f"🔍 Starting genesis block mining on {jobs or os.cpu_count()} cores...")
     print(f"🎯 Target: {target:x}")
+    if checkpoint is not None:
+        print(f"♻️  Resuming from {checkpoint_path} ({checkpoint['hashes_done']:,} hashes already done)")
     print()
     
-    # Try different nonces until we find one that works
-    for nonce in range(5000000):  # Try 5 million nonces
-        if nonce % 100000 == 0:
-            print(f"⏱️  Tried {nonce:,} nonces...")
-        
-        # Create block header
-        nTime_bytes = struct.pack('<I', nTime)
-        nBits_bytes = struct.pack('<I', nBits)
-        nNonce_bytes = struct.pack('<I', nonce)
-        merkle_root_bytes = bytes.fromhex(merkle_root)
+    def report(hashes_done, elapsed):
+        if report.last + 10 <= elapsed:
+            report.last = elapsed
+            print(f"⏱️  Tried {hashes_done:,} hashes ({hashes_done / max(elapsed, 1e-9) / 1e6:.2f} MH/s)...")
+    report.last = 0
+    
+    # Grind nonces, rolling nTime forward once a nonce range is exhausted
+    template = HeaderTemplate(1, hashPrevBlock, bytes.fromhex(merkle_root), nBits)
+    result = mine_header(template, nTime, ntime_count=ntime_count, jobs=jobs,
+                         checkpoint_path=checkpoint_path, progress=report)
+    if result is not None:
+        nonce = result['nonce']
+        nTime = result['ntime']
+        block_hash = result['hash']
+        print()
+        print("🎉 GENESIS BLOCK FOUND!")
+        print("=" * 60)
+        print(f"🔢 Nonce: {nonce:,}")
+        print(f"🏷️  Block Hash: {block_hash}")
+        print(f"🌳 Merkle Root: {merkle_root}")
+        print(f"⏰ Timestamp: {nTime}")
+        print(f"🎯 Difficulty: 0x{nBits:08x}")
+        print()
         
-        header = version + hashPrevBlock + merkle_root_bytes + nTime_bytes + nBits_bytes + nNonce_bytes
+        # Generate C++ code for chainparams.cpp
+        print("📝 C++ CODE FOR chainparams.cpp:")
+        print("=" * 60)
+        print("genesis = CreateGenesisBlock(")
+        print(f"    \"{timestamp_msg}\", // timestamp")
+        print(f"    CScript() << \"{genesis_pubkey}\" << OP_CHECKSIG, // scriptPubKey")
+        print(f"    {nTime}, // nTime")
+        print(f"    {nonce}, // nNonce")
+        print(f"    0x{nBits:08x}, // nBits")
+        print("    1, // nVersion")
+        print(f"    {genesis_reward} * COIN); // genesisReward")
+        print()
+        print("consensus.hashGenesisBlock = genesis.GetHash();")
+        print(f"assert(consensus.hashGenesisBlock == uint256{{\"{block_hash}\"}});")
+        print(f"assert(genesis.hashMerkleRoot == uint256{{\"{merkle_root}\"}});")
+        print()
         
-        # Calculate double SHA256 hash
-        hash1 = hashlib.sha256(header).digest()
-        hash2 = hashlib.sha256(hash1).digest()
-        block_hash = hash2.hex()
+        # Save to file
+        with open('/workspace/IndiCoin/genesis_results.txt', 'w') as f:
+            f.write("IndiCoin Genesis Block Parameters\n")
+            f.write("=" * 40 + "\n\n")
+            f.write(f"Timestamp: {nTime}\n")
+            f.write(f"Nonce: {nonce}\n")
+            f.write(f"Block Hash: {block_hash}\n")
+            f.write(f"Merkle Root: {merkle_root}\n")
+            f.write(f"Bits: 0x{nBits:08x}\n")
+            f.write(f"Genesis Reward: {genesis_reward} satoshis\n\n")
+            f.write("C++ Code:\n")
+            f.write("genesis = CreateGenesisBlock(\n")
+            f.write(f"    \"{timestamp_msg}\",\n")
+            f.write(f"    CScript() << \"{genesis_pubkey}\" << OP_CHECKSIG,\n")
+            f.write(f"    {nTime},\n")
+            f.write(f"    {nonce},\n")
+            f.write(f"    0x{nBits:08x},\n")
+            f.write("    1,\n")
+            f.write(f"    {genesis_reward} * COIN);\n\n")
+            f.write(f"consensus.hashGenesisBlock = genesis.GetHash();\n")
+            f.write(f"assert(consensus.hashGenesisBlock == uint256{{\"{block_hash}\"}});\n")
+            f.write(f"assert(genesis.hashMerkleRoot == uint256{{\"{merkle_root}\"}});\n")
         
-        # Check if hash meets difficulty target
-        hash_int = int(block_hash, 16)
-        if hash_int < target:
-            print()
-            print("🎉 GENESIS BLOCK FOUND!")
-            print("=" * 60)
-            print(f"🔢 Nonce: {nonce:,}")
-            print(f"🏷️  Block Hash: {block_hash}")
-            print(f"🌳 Merkle Root: {merkle_root}")
-            print(f"⏰ Timestamp: {nTime}")
-            print(f"🎯 Difficulty: 0x{nBits:08x}")
-            print()
-            
-            # Generate C++ code for chainparams.cpp
-            print("📝 C++ CODE FOR chainparams.cpp:")
-            print("=" * 60)
-            print("genesis = CreateGenesisBlock(")
-            print(f"    \"{timestamp_msg}\", // timestamp")
-            print(f"    CScript() << \"{genesis_pubkey}\" << OP_CHECKSIG, // scriptPubKey")
-            print(f"    {nTime}, // nTime")
-            print(f"    {nonce}, // nNonce")
-            print(f"    0x{nBits:08x}, // nBits")
-            print("    1, // nVersion")
-            print(f"    {genesis_reward} * COIN); // genesisReward")
-            print()
-            print("consensus.hashGenesisBlock = genesis.GetHash();")
-            print(f"assert(consensus.hashGenesisBlock == uint256{{\"{block_hash}\"}});")
-            print(f"assert(genesis.hashMerkleRoot == uint256{{\"{merkle_root}\"}});")
-            print()
-            
-            # Save to file
-            with open('/workspace/IndiCoin/genesis_results.txt', 'w') as f:
-                f.write("IndiCoin Genesis Block Parameters\n")
-                f.write("=" * 40 + "\n\n")
-                f.write(f"Timestamp: {nTime}\n")
-                f.write(f"Nonce: {nonce}\n")
-                f.write(f"Block Hash: {block_hash}\n")
-                f.write(f"Merkle Root: {merkle_root}\n")
-                f.write(f"Bits: 0x{nBits:08x}\n")
-                f.write(f"Genesis Reward: {genesis_reward} satoshis\n\n")
-                f.write("C++ Code:\n")
-                f.write("genesis = CreateGenesisBlock(\n")
-                f.write(f"    \"{timestamp_msg}\",\n")
-                f.write(f"    CScript() << \"{genesis_pubkey}\" << OP_CHECKSIG,\n")
-                f.write(f"    {nTime},\n")
-                f.write(f"    {nonce},\n")
-                f.write(f"    0x{nBits:08x},\n")
-                f.write("    1,\n")
-                f.write(f"    {genesis_reward} * COIN);\n\n")
-                f.write(f"consensus.hashGenesisBlock = genesis.GetHash();\n")
-                f.write(f"assert(consensus.hashGenesisBlock == uint256{{\"{block_hash}\"}});\n")
-                f.write(f"assert(genesis.hashMerkleRoot == uint256{{\"{merkle_root}\"}});\n")
-            
-            print(f"💾 Results saved to: /workspace/IndiCoin/genesis_results.txt")
-            return {
-                'hash': block_hash,
-                'merkle_root': merkle_root,
-                'nonce': nonce,
-                'time': nTime,
-                'bits': nBits,
-                'reward': genesis_reward,
-                'timestamp_msg': timestamp_msg,
-                'pubkey': genesis_pubkey
-            }
+        print(f"💾 Results saved to: /workspace/IndiCoin/genesis_results.txt")
+        return {
+            'hash': block_hash,
+            'merkle_root': merkle_root,
+            'nonce': nonce,
+            'time': nTime,
+            'bits': nBits,
+            'reward': genesis_reward,
+            'timestamp_msg': timestamp_msg,
+            'pubkey': genesis_pubkey
+        }
     
     print("❌ Failed to find valid genesis block in search range")
     return None
@@ -167,7 +167,12 @@ def create_coinbase_script_sig(timestamp_msg):
     return script
 
 if __name__ == "__main__":
-    result = create_enhanced_genesis_block()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--jobs', '-j', type=int, default=None, help='number of mining processes (default: all cores)')
+    parser.add_argument('--checkpoint', default=None, help='save progress to this file and resume from it if it exists')
+    parser.add_argument('--ntime-count', type=int, default=3600, help='number of nTime values to roll through once the nonce space is exhausted')
+    args = parser.parse_args()
+    result = create_enhanced_genesis_block(jobs=args.jobs, checkpoint_path=args.checkpoint, ntime_count=args.ntime_count)
     if result:
         print()
         print("✅ Genesis block generation completed successfully!")
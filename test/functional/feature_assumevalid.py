@@ -176,8 +176,7 @@ class AssumeValidTest(BitcoinTestFramework):
             p2p1.send_header_for_blocks(self.blocks[0:2000])
             p2p1.send_header_for_blocks(self.blocks[2000:])
             # Send all blocks to node1. All blocks will be accepted.
-            for i in range(2202):
-                p2p1.send_without_ping(msg_block(self.blocks[i]))
+            p2p1.send_many_without_ping([msg_block(self.blocks[i]) for i in range(2202)])
             # Syncing 2200 blocks can take a while on slow systems. Give it plenty of time to sync.
             p2p1.sync_with_ping(timeout=960)
             assert_equal(self.nodes[1].getblock(self.nodes[1].getbestblockhash())['height'], 2202)
@@ -16,6 +16,7 @@ from test_framework.test_framework import TEST_EXIT_PASSED, TEST_EXIT_FAILED
 # the output of `git grep unittest.TestCase ./test/functional/test_framework`
 TEST_FRAMEWORK_MODULES = [
     "address",
+    "authproxy",
     "crypto.bip324_cipher",
     "blocktools",
     "compressor",
@@ -24,12 +25,14 @@ TEST_FRAMEWORK_MODULES = [
     "key",
     "messages",
     "crypto.muhash",
+    "p2p",
     "crypto.poly1305",
     "crypto.ripemd160",
     "crypto.secp256k1",
     "script",
     "script_util",
     "segwit_addr",
+    "util",
     "wallet_util",
 ]
 
@@ -4,11 +4,14 @@
 # file COPYING or http://www.opensource.org/licenses/mit-license.php.
 """Tests some generic aspects of the RPC interface."""
 
+import asyncio
 import json
 import os
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
+from test_framework.authproxy import JSONRPCException, RPCBatch
 from test_framework.test_framework import BitcoinTestFramework
-from test_framework.util import assert_equal, assert_greater_than_or_equal
+from test_framework.util import assert_equal, assert_greater_than_or_equal, assert_raises_rpc_error
 from threading import Thread
 from typing import Optional
 import subprocess
@@ -226,6 +229,67 @@ class RPCInterfaceTest(BitcoinTestFramework):
         # Sanity check: command was not executed
         assert_equal(block_count + 1, self.nodes[0].getblockcount())
 
+    def test_rpc_pool(self):
+        self.log.info("Testing AuthServiceProxyPool from multiple threads...")
+        pool = self.nodes[0].get_rpc_pool(size=4)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            heights = list(executor.map(lambda height: pool.getblockhash(height), [0] * 100))
+        assert_equal(heights, [self.nodes[0].getblockhash(0)] * 100)
+        assert_greater_than_or_equal(4, pool.idle_connections)
+
+        # An RPC error leaves the connection usable
+        assert_raises_rpc_error(RPC_INVALID_PARAMETER, "Block height out of range", pool.getblockhash, 1000)
+        assert_equal(pool.getblockcount(), self.nodes[0].getblockcount())
+
+        stats = pool.get_latency_stats()
+        assert_equal(stats["getblockhash"].count, 101)
+        assert_equal(stats["getblockcount"].count, 1)
+        assert_greater_than_or_equal(stats["getblockhash"].max, stats["getblockhash"].mean)
+        pool.log_latency_stats(self.log)
+
+    def test_async_rpc(self):
+        self.log.info("Testing AsyncAuthServiceProxy...")
+        node = self.nodes[0]
+
+        async def run():
+            async with node.get_async_rpc(max_concurrency=4) as proxy:
+                hashes = await asyncio.gather(*[proxy.getblockhash(0) for _ in range(20)])
+                assert_equal(hashes, [node.getblockhash(0)] * 20)
+                assert_greater_than_or_equal(4, proxy.idle_connections)
+                batch = await proxy.batch([proxy.getblockcount.get_request(), proxy.getblockhash.get_request(1000)])
+                assert_equal(batch[0]["result"], node.getblockcount())
+                assert_equal(batch[1]["error"]["code"], RPC_INVALID_PARAMETER)
+                try:
+                    await proxy.getblockhash(1000)
+                    raise AssertionError("No exception raised")
+                except JSONRPCException as e:
+                    assert_equal(e.error["code"], RPC_INVALID_PARAMETER)
+
+        asyncio.run(run())
+
+    def test_rpc_batch_context(self):
+        self.log.info("Testing RPCBatch...")
+        node = self.nodes[0]
+        with RPCBatch(node) as batch:
+            blockhash = batch.getblockhash(0)
+            count = batch.getblockcount()
+            invalid = batch.getblockhash(1000)
+        assert_equal(blockhash.result(), node.getblockhash(0))
+        assert_equal(count.result(), node.getblockcount())
+        assert_raises_rpc_error(RPC_INVALID_PARAMETER, "Block height out of range", invalid.result)
+
+    def test_stream(self):
+        self.log.info("Testing streamed RPC responses...")
+        node = self.nodes[0]
+        blockhash = node.getblockhash(0)
+        assert_equal(list(node.getblock.stream(blockhash, 2, path=("tx",))), node.getblock(blockhash, 2)["tx"])
+        assert_equal(dict(node.getblockchaininfo.stream()), node.getblockchaininfo())
+        assert_equal(list(node.getblock.stream(blockhash, 1, path=("tx",), parse_float=float)), node.getblock(blockhash)["tx"])
+        assert_raises_rpc_error(RPC_INVALID_PARAMETER, "Block height out of range", lambda: list(node.getblockhash.stream(1000)))
+        # Abandoning a stream midway leaves the proxy usable
+        next(iter(node.getblockchaininfo.stream()))
+        assert_equal(node.getblockhash(0), blockhash)
+
     def test_work_queue_exceeded(self):
         self.log.info("Testing work queue exceeded...")
         self.restart_node(0, ['-rpcworkqueue=1', '-rpcthreads=1'])
@@ -242,6 +306,10 @@ class RPCInterfaceTest(BitcoinTestFramework):
         self.test_getrpcinfo()
         self.test_batch_requests()
         self.test_http_status_codes()
+        self.test_rpc_pool()
+        self.test_async_rpc()
+        self.test_stream()
+        self.test_rpc_batch_context()
         self.test_work_queue_exceeded()
 
 
@@ -31,21 +31,46 @@ ServiceProxy class:
 - sends Basic HTTP authentication headers
 - parses all JSON numbers that look like floats as Decimal
 - uses standard Python json lib
+
+AuthServiceProxyPool shares a set of keep-alive connections between threads
+and records the latency of every call per RPC method.
+
+AsyncAuthServiceProxy is the asyncio counterpart of AuthServiceProxy, for
+fanning out calls to many nodes at once.
+
+AuthServiceProxy.stream() decodes large results incrementally with
+JSONStreamReader, yielding one element at a time.
+
+RPCBatch collects the calls made within a `with` block and sends them as a
+single JSON-RPC batch.
 """
 
+import asyncio
 import base64
+import codecs
+from concurrent.futures import Future
 import decimal
 from http import HTTPStatus
 import http.client
+import io
+import itertools
 import json
 import logging
 import pathlib
+import re
 import socket
+import threading
 import time
+import unittest
 import urllib.parse
 
 HTTP_TIMEOUT = 30
 USER_AGENT = "AuthServiceProxy/0.1"
+# Number of bytes read from the socket at a time when streaming a response
+STREAM_CHUNK_SIZE = 1 << 16
+# Error codes raised by the client itself rather than returned by the server.
+# The connection is in an unknown state after any of these.
+CLIENT_ERROR_CODES = (-342, -343, -344)
 
 log = logging.getLogger("BitcoinRPC")
 
@@ -67,8 +92,80 @@ def serialization_fallback(o):
         return str(o)
     raise TypeError(repr(o) + " is not JSON serializable")
 
+# itertools.count is safe to advance from multiple threads
+_request_ids = itertools.count(1)
+
+
+def get_rpc_request(method, args, argsn):
+    if args and argsn:
+        params = dict(args=args, **argsn)
+    else:
+        params = args or argsn
+    return {'jsonrpc': '2.0',
+            'method': method,
+            'params': params,
+            'id': next(_request_ids)}
+
+
+def get_rpc_result(response, status):
+    """Return the result of a decoded JSON-RPC response or raise its error."""
+    # For backwards compatibility tests, accept JSON RPC 1.1 responses
+    if 'jsonrpc' not in response:
+        if response['error'] is not None:
+            raise JSONRPCException(response['error'], status)
+        elif 'result' not in response:
+            raise JSONRPCException({
+                'code': -343, 'message': 'missing JSON-RPC result'}, status)
+        elif status != HTTPStatus.OK:
+            raise JSONRPCException({
+                'code': -342, 'message': 'non-200 HTTP status code but no JSON-RPC error'}, status)
+        else:
+            return response['result']
+    else:
+        assert response['jsonrpc'] == '2.0'
+        if status != HTTPStatus.OK:
+            raise JSONRPCException({
+                'code': -342, 'message': 'non-200 HTTP status code'}, status)
+        if 'error' in response:
+            raise JSONRPCException(response['error'], status)
+        elif 'result' not in response:
+            raise JSONRPCException({
+                'code': -343, 'message': 'missing JSON-RPC 2.0 result and error'}, status)
+        return response['result']
+
+
+def decode_http_response(status, reason, content_type, data, elapsed, json_dumps):
+    """Decode the body of an HTTP response from the RPC server.
+
+    Returns (response, status), where response is None for a no-content reply."""
+    # Check for no-content HTTP status code, which can be returned when an
+    # RPC client requests a JSON-RPC 2.0 "notification" with no response.
+    # Currently this is only possible if clients call the _request() method
+    # directly to send a raw request.
+    if status == HTTPStatus.NO_CONTENT:
+        if len(data) != 0:
+            raise JSONRPCException({'code': -342, 'message': 'Content received with NO CONTENT status code'})
+        return None, status
+
+    if content_type != 'application/json':
+        raise JSONRPCException(
+            {'code': -342, 'message': 'non-JSON HTTP response with \'%i %s\' from server' % (status, reason)},
+            status)
+
+    try:
+        responsedata = data.decode('utf8')
+    except UnicodeDecodeError as e:
+        raise JSONRPCException({
+            'code': -342, 'message': f'Cannot decode response in utf8 format, content: {data}, exception: {e}'})
+    response = json.loads(responsedata, parse_float=decimal.Decimal)
+    if "error" in response and response["error"] is None:
+        log.debug("<-%s- [%.6f] %s" % (response["id"], elapsed, json_dumps(response["result"])))
+    else:
+        log.debug("<-- [%.6f] %s" % (elapsed, responsedata))
+    return response, status
+
+
 class AuthServiceProxy():
-    __id_count = 0
 
     # ensure_ascii: escape unicode as \uXXXX, passed to json.dumps
     def __init__(self, service_url, service_name=None, timeout=HTTP_TIMEOUT, connection=None, ensure_ascii=True):
@@ -101,6 +198,10 @@ class AuthServiceProxy():
         '''
         Do a HTTP request.
         '''
+        self._send_request(method, path, postdata)
+        return self._get_response()
+
+    def _send_request(self, method, path, postdata):
         headers = {'Host': self.__url.hostname,
                    'User-Agent': USER_AGENT,
                    'Authorization': self.__auth_header,
@@ -108,56 +209,24 @@ class AuthServiceProxy():
         if not self.reuse_http_connections:
             self._set_conn()
         self.__conn.request(method, path, postdata, headers)
-        return self._get_response()
 
     def _json_dumps(self, obj):
         return json.dumps(obj, default=serialization_fallback, ensure_ascii=self.ensure_ascii)
 
     def get_request(self, *args, **argsn):
-        AuthServiceProxy.__id_count += 1
-
+        request = get_rpc_request(self._service_name, args, argsn)
         log.debug("-{}-> {} {} {}".format(
-            AuthServiceProxy.__id_count,
+            request['id'],
             self._service_name,
             self._json_dumps(args),
             self._json_dumps(argsn),
         ))
-
-        if args and argsn:
-            params = dict(args=args, **argsn)
-        else:
-            params = args or argsn
-        return {'jsonrpc': '2.0',
-                'method': self._service_name,
-                'params': params,
-                'id': AuthServiceProxy.__id_count}
+        return request
 
     def __call__(self, *args, **argsn):
         postdata = self._json_dumps(self.get_request(*args, **argsn))
         response, status = self._request('POST', self.__url.path, postdata.encode('utf-8'))
-        # For backwards compatibility tests, accept JSON RPC 1.1 responses
-        if 'jsonrpc' not in response:
-            if response['error'] is not None:
-                raise JSONRPCException(response['error'], status)
-            elif 'result' not in response:
-                raise JSONRPCException({
-                    'code': -343, 'message': 'missing JSON-RPC result'}, status)
-            elif status != HTTPStatus.OK:
-                raise JSONRPCException({
-                    'code': -342, 'message': 'non-200 HTTP status code but no JSON-RPC error'}, status)
-            else:
-                return response['result']
-        else:
-            assert response['jsonrpc'] == '2.0'
-            if status != HTTPStatus.OK:
-                raise JSONRPCException({
-                    'code': -342, 'message': 'non-200 HTTP status code'}, status)
-            if 'error' in response:
-                raise JSONRPCException(response['error'], status)
-            elif 'result' not in response:
-                raise JSONRPCException({
-                    'code': -343, 'message': 'missing JSON-RPC 2.0 result and error'}, status)
-            return response['result']
+        return get_rpc_result(response, status)
 
     def batch(self, rpc_call_list):
         postdata = self._json_dumps(list(rpc_call_list))
@@ -168,8 +237,64 @@ class AuthServiceProxy():
                 'code': -342, 'message': 'non-200 HTTP status code'}, status)
         return response
 
+    def stream(self, *args, path=(), parse_float=decimal.Decimal, **argsn):
+        """Call the RPC method and iterate over its result as it is received.
+
+        Yields the elements of the array, or the (key, value) items of the
+        object, found under the keys in `path` within the result, e.g.
+        node.getblock.stream(blockhash, 3, path=("tx",)) or
+        node.getrawmempool.stream(True). Only one element is held in memory at
+        a time. Pass parse_float=float to skip building Decimals where
+        exactness is not needed.
+        """
+        postdata = self._json_dumps(self.get_request(*args, **argsn))
+        self._send_request('POST', self.__url.path, postdata.encode('utf-8'))
+        req_start_time = time.time()
+        http_response = self._get_http_response()
+        if http_response.getheader('Content-Type') != 'application/json':
+            # Not a JSON-RPC reply; let the regular decoder report the error
+            data = http_response.read()
+            decode_http_response(http_response.status, http_response.reason, http_response.getheader('Content-Type'),
+                                 data, time.time() - req_start_time, self._json_dumps)
+            raise JSONRPCException({'code': -342, 'message': 'missing JSON-RPC result'}, http_response.status)
+
+        reader = JSONStreamReader(http_response, parse_float)
+        complete = False
+        count = 0
+        try:
+            error = None
+            for key in reader.iter_keys():
+                if key == 'result' and reader.peek() != 'n':
+                    for element in reader.iter_path(path):
+                        count += 1
+                        yield element
+                elif key == 'error':
+                    error = reader.read_value()
+                else:
+                    reader.read_value()
+            complete = True
+        finally:
+            if complete:
+                http_response.read()
+            else:
+                # The rest of the response was not read, so the connection
+                # cannot be reused.
+                self.__conn.close()
+        log.debug("<-- [%.6f] %i elements streamed" % (time.time() - req_start_time, count))
+        if error is not None:
+            raise JSONRPCException(error, http_response.status)
+        if http_response.status != HTTPStatus.OK:
+            raise JSONRPCException({
+                'code': -342, 'message': 'non-200 HTTP status code'}, http_response.status)
+
     def _get_response(self):
         req_start_time = time.time()
+        http_response = self._get_http_response()
+        data = http_response.read()
+        return decode_http_response(http_response.status, http_response.reason, http_response.getheader('Content-Type'),
+                                    data, time.time() - req_start_time, self._json_dumps)
+
+    def _get_http_response(self):
         try:
             http_response = self.__conn.getresponse()
         except socket.timeout:
@@ -182,35 +307,7 @@ class AuthServiceProxy():
         if http_response is None:
             raise JSONRPCException({
                 'code': -342, 'message': 'missing HTTP response from server'})
-
-        # Check for no-content HTTP status code, which can be returned when an
-        # RPC client requests a JSON-RPC 2.0 "notification" with no response.
-        # Currently this is only possible if clients call the _request() method
-        # directly to send a raw request.
-        if http_response.status == HTTPStatus.NO_CONTENT:
-            if len(http_response.read()) != 0:
-                raise JSONRPCException({'code': -342, 'message': 'Content received with NO CONTENT status code'})
-            return None, http_response.status
-
-        content_type = http_response.getheader('Content-Type')
-        if content_type != 'application/json':
-            raise JSONRPCException(
-                {'code': -342, 'message': 'non-JSON HTTP response with \'%i %s\' from server' % (http_response.status, http_response.reason)},
-                http_response.status)
-
-        data = http_response.read()
-        try:
-            responsedata = data.decode('utf8')
-        except UnicodeDecodeError as e:
-            raise JSONRPCException({
-                'code': -342, 'message': f'Cannot decode response in utf8 format, content: {data}, exception: {e}'})
-        response = json.loads(responsedata, parse_float=decimal.Decimal)
-        elapsed = time.time() - req_start_time
-        if "error" in response and response["error"] is None:
-            log.debug("<-%s- [%.6f] %s" % (response["id"], elapsed, self._json_dumps(response["result"])))
-        else:
-            log.debug("<-- [%.6f] %s" % (elapsed, responsedata))
-        return response, http_response.status
+        return http_response
 
     def __truediv__(self, relative_uri):
         return AuthServiceProxy("{}/{}".format(self.__service_url, relative_uri), self._service_name, connection=self.__conn)
@@ -224,3 +321,464 @@ class AuthServiceProxy():
             self.__conn = http.client.HTTPSConnection(self.__url.hostname, port, timeout=self.timeout)
         else:
             self.__conn = http.client.HTTPConnection(self.__url.hostname, port, timeout=self.timeout)
+
+
+class JSONStreamReader():
+    """Incremental parser for a JSON document read in chunks from a file-like object.
+
+    Containers are walked token by token with iter_keys(), iter_array() and
+    iter_path(). Every other value is decoded whole by read_value(), so memory
+    use is bounded by the largest single element rather than by the document.
+    """
+    WHITESPACE = re.compile(r'[ \t\n\r]*')
+    NUMBER_CHARS = frozenset('.eE+-0123456789')
+
+    def __init__(self, fp, parse_float=decimal.Decimal, chunk_size=STREAM_CHUNK_SIZE):
+        self.fp = fp
+        self.decoder = json.JSONDecoder(parse_float=parse_float)
+        self.utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        """Append the next chunk to the buffer, dropping what was consumed.
+
+        Reads at least as much as is buffered, so that decoding a value
+        spanning many chunks takes linear rather than quadratic time."""
+        data = self.fp.read(max(self.chunk_size, len(self.buf) - self.pos))
+        self.eof = not data
+        self.buf = self.buf[self.pos:] + self.utf8.decode(data, final=self.eof)
+        self.pos = 0
+
+    def peek(self):
+        """Skip whitespace and return the next character, or '' at the end."""
+        while True:
+            self.pos = self.WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf) or self.eof:
+                return self.buf[self.pos:self.pos + 1]
+            self._fill()
+
+    def _expect(self, chars):
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError("Expected one of %r at offset %i of the JSON stream, got %r" % (chars, self.pos, char))
+        self.pos += 1
+        return char
+
+    def read_value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+                # A number may continue in the next chunk, and a chunk boundary
+                # within it (e.g. after "12." or "1e") decodes as a shorter number
+                if self.eof or (end < len(self.buf) and not (
+                        self.buf[self.pos] in self.NUMBER_CHARS and self.buf[end] in self.NUMBER_CHARS)):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+    def iter_array(self):
+        """Yield the elements of the array at the current position."""
+        self._expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.read_value()
+            if self._expect(',]') == ']':
+                return
+
+    def iter_keys(self):
+        """Yield the keys of the object at the current position.
+
+        The caller must consume each value (with read_value() or by walking
+        into it) before advancing to the next key."""
+        self._expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.read_value()
+            self._expect(':')
+            yield key
+            if self._expect(',}') == '}':
+                return
+
+    def iter_path(self, path=()):
+        """Yield the elements of the array, or the (key, value) items of the
+        object, found by following the object keys in `path`."""
+        if path:
+            found = False
+            for key in self.iter_keys():
+                if key == path[0] and not found:
+                    found = True
+                    yield from self.iter_path(path[1:])
+                else:
+                    self.read_value()
+            if not found:
+                raise KeyError(path[0])
+        elif self.peek() == '[':
+            yield from self.iter_array()
+        else:
+            for key in self.iter_keys():
+                yield key, self.read_value()
+
+
+class RPCBatch():
+    """Queue RPC calls and send them in one round trip as a JSON-RPC batch.
+
+    Calls made on the batch return futures, which are resolved when the `with`
+    block exits (or on flush()):
+
+        with RPCBatch(node) as batch:
+            txs = [batch.getrawtransaction(txid, True) for txid in txids]
+        txs = [tx.result() for tx in txs]
+
+    `proxy` can be anything offering per-method get_request() and batch(), such
+    as an AuthServiceProxy, a TestNode or a TestNodeCLI. An RPC error is raised
+    as JSONRPCException by the result() of the failed call only.
+    """
+    def __init__(self, proxy):
+        self._proxy = proxy
+        self._calls = []
+
+    def __getattr__(self, name):
+        if name.startswith('__') and name.endswith('__'):
+            # Python internal stuff
+            raise AttributeError
+
+        def queue_call(*args, **argsn):
+            future = Future()
+            self._calls.append((getattr(self._proxy, name).get_request(*args, **argsn), future))
+            return future
+        return queue_call
+
+    def flush(self):
+        calls, self._calls = self._calls, []
+        if not calls:
+            return
+        responses = self._proxy.batch([request for request, _ in calls])
+        assert len(responses) == len(calls)
+        if isinstance(calls[0][0], dict):
+            # Responses to a JSON-RPC batch may come in any order
+            by_id = {response['id']: response for response in responses}
+            responses = [by_id[request['id']] for request, _ in calls]
+        for (_, future), response in zip(calls, responses):
+            error = response.get('error')
+            if error is None:
+                future.set_result(response['result'])
+            elif isinstance(error, Exception):
+                future.set_exception(error)
+            else:
+                future.set_exception(JSONRPCException(error))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+
+
+class RPCLatencyStats():
+    """Number, total and worst-case duration of the calls to one RPC method."""
+    __slots__ = ("count", "total", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, elapsed):
+        self.count += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+
+    def copy(self):
+        stats = RPCLatencyStats()
+        stats.count, stats.total, stats.max = self.count, self.total, self.max
+        return stats
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def __repr__(self):
+        return "RPCLatencyStats(count=%i total=%.6f mean=%.6f max=%.6f)" % (self.count, self.total, self.mean, self.max)
+
+
+class AuthServiceProxyPool():
+    """Thread-safe RPC client keeping up to `size` keep-alive connections to one server.
+
+    Each call borrows an idle connection (or opens a new one while fewer than
+    `size` are in use) and hands it back when the response has been read, so
+    any number of threads can issue calls concurrently. Connections left in an
+    unknown state by a transport error are dropped instead of being reused.
+    """
+    def __init__(self, service_url, size=8, timeout=HTTP_TIMEOUT, ensure_ascii=True):
+        assert size >= 1
+        self._service_url = service_url
+        self._timeout = timeout
+        self._ensure_ascii = ensure_ascii
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = []
+        self._lock = threading.Lock()
+        self._latency = {}
+
+    def __getattr__(self, name):
+        if name.startswith('__') and name.endswith('__'):
+            # Python internal stuff
+            raise AttributeError
+        return lambda *args, **argsn: self._call(name, lambda proxy: proxy.__getattr__(name)(*args, **argsn))
+
+    def batch(self, rpc_call_list):
+        return self._call("batch", lambda proxy: proxy.batch(rpc_call_list))
+
+    def _call(self, method, fn):
+        with self._slots:
+            with self._lock:
+                proxy = self._idle.pop() if self._idle else None
+            if proxy is None:
+                proxy = AuthServiceProxy(self._service_url, timeout=self._timeout, ensure_ascii=self._ensure_ascii)
+            reusable = False
+            start = time.perf_counter()
+            try:
+                result = fn(proxy)
+                reusable = True
+                return result
+            except JSONRPCException as e:
+                reusable = e.error.get('code') not in CLIENT_ERROR_CODES
+                raise
+            finally:
+                elapsed = time.perf_counter() - start
+                with self._lock:
+                    self._latency.setdefault(method, RPCLatencyStats()).add(elapsed)
+                    if reusable:
+                        self._idle.append(proxy)
+
+    @property
+    def idle_connections(self):
+        """Number of open connections waiting to be reused (at most `size`)."""
+        with self._lock:
+            return len(self._idle)
+
+    def get_latency_stats(self):
+        """Return a snapshot of the call latencies, keyed by RPC method."""
+        with self._lock:
+            return {method: stats.copy() for method, stats in self._latency.items()}
+
+    def reset_latency_stats(self):
+        with self._lock:
+            self._latency = {}
+
+    def log_latency_stats(self, logger=log):
+        for method, stats in sorted(self.get_latency_stats().items(), key=lambda item: -item[1].total):
+            logger.info("%s: %i calls, mean %.3f ms, max %.3f ms, total %.3f s" % (
+                method, stats.count, stats.mean * 1e3, stats.max * 1e3, stats.total))
+
+
+class StaleConnectionError(ConnectionError):
+    """The server closed a connection without responding to the request."""
+
+
+class AsyncHTTPConnectionPool():
+    """Keep-alive HTTP/1.1 connections to one server, used by AsyncAuthServiceProxy.
+
+    At most `size` requests are in flight at once, each on its own connection.
+    """
+    def __init__(self, url, size):
+        assert size >= 1
+        self.host = url.hostname
+        self.ssl = url.scheme == 'https'
+        self.port = url.port if url.port is not None else (443 if self.ssl else 80)
+        self.slots = asyncio.Semaphore(size)
+        self.idle = []
+
+    @property
+    def idle_connections(self):
+        """Number of open connections waiting to be reused (at most `size`)."""
+        return len(self.idle)
+
+    async def request(self, path, headers, body):
+        """Send a POST request. Returns (status, reason, headers, data)."""
+        async with self.slots:
+            while self.idle:
+                reader, writer = self.idle.pop()
+                try:
+                    return await self._exchange(reader, writer, path, headers, body)
+                except StaleConnectionError:
+                    # The server closed the idle connection before reading
+                    # the request; retry on another one.
+                    pass
+            reader, writer = await asyncio.open_connection(self.host, self.port, ssl=self.ssl or None)
+            try:
+                return await self._exchange(reader, writer, path, headers, body)
+            except StaleConnectionError:
+                raise JSONRPCException({'code': -342, 'message': 'missing HTTP response from server'})
+
+    async def _exchange(self, reader, writer, path, headers, body):
+        reusable = False
+        try:
+            head = "POST {} HTTP/1.1\r\n".format(path)
+            head += "".join("{}: {}\r\n".format(k, v) for k, v in headers.items())
+            head += "Content-Length: {}\r\n\r\n".format(len(body))
+            writer.write(head.encode('latin-1') + body)
+            await writer.drain()
+
+            status_line = await reader.readline()
+            if not status_line:
+                raise StaleConnectionError()
+            _, status, reason = (status_line.decode('latin-1').rstrip('\r\n') + ' ').split(' ', 2)
+            response_headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, value = line.decode('latin-1').split(':', 1)
+                response_headers[name.strip().lower()] = value.strip()
+
+            keep_alive = response_headers.get('connection', '').lower() != 'close'
+            if response_headers.get('transfer-encoding', '').lower() == 'chunked':
+                chunks = []
+                while True:
+                    size = int((await reader.readline()).split(b';')[0], 16)
+                    if size == 0:
+                        while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                            pass  # Skip trailers
+                        break
+                    chunks.append(await reader.readexactly(size))
+                    await reader.readexactly(2)
+                data = b''.join(chunks)
+            elif 'content-length' in response_headers:
+                data = await reader.readexactly(int(response_headers['content-length']))
+            else:
+                data = await reader.read()
+                keep_alive = False
+            # Only a connection whose response was read completely can be reused
+            reusable = keep_alive
+            return int(status), reason.strip(), response_headers, data
+        finally:
+            if reusable:
+                self.idle.append((reader, writer))
+            else:
+                writer.close()
+
+    async def close(self):
+        idle, self.idle = self.idle, []
+        for _, writer in idle:
+            writer.close()
+            await writer.wait_closed()
+
+
+class AsyncAuthServiceProxy():
+    """asyncio counterpart of AuthServiceProxy, with the same calling convention:
+
+        async with AsyncAuthServiceProxy(url, max_concurrency=16) as proxy:
+            block = await proxy.getblock(await proxy.getbestblockhash())
+            hashes = await proxy.batch([proxy.getblockhash.get_request(h) for h in range(10)])
+
+    Proxies derived from one another (by attribute access or `/`) share a pool
+    of up to `max_concurrency` keep-alive connections.
+    """
+    def __init__(self, service_url, service_name=None, timeout=HTTP_TIMEOUT, ensure_ascii=True, max_concurrency=8, connections=None):
+        self._service_url = service_url
+        self._service_name = service_name
+        self.ensure_ascii = ensure_ascii  # can be toggled on the fly by tests
+        self.timeout = timeout
+        self._url = urllib.parse.urlparse(service_url)
+        authpair = self._url.username.encode('utf8') + b':' + self._url.password.encode('utf8')
+        self._auth_header = 'Basic ' + base64.b64encode(authpair).decode('ascii')
+        self._connections = connections or AsyncHTTPConnectionPool(self._url, max_concurrency)
+
+    def __getattr__(self, name):
+        if name.startswith('__') and name.endswith('__'):
+            # Python internal stuff
+            raise AttributeError
+        if self._service_name is not None:
+            name = "%s.%s" % (self._service_name, name)
+        return AsyncAuthServiceProxy(self._service_url, name, self.timeout, self.ensure_ascii, connections=self._connections)
+
+    def __truediv__(self, relative_uri):
+        return AsyncAuthServiceProxy("{}/{}".format(self._service_url, relative_uri), self._service_name, self.timeout,
+                                     self.ensure_ascii, connections=self._connections)
+
+    @property
+    def idle_connections(self):
+        """Number of open connections, shared by all proxies derived from this one, waiting to be reused."""
+        return self._connections.idle_connections
+
+    def _json_dumps(self, obj):
+        return json.dumps(obj, default=serialization_fallback, ensure_ascii=self.ensure_ascii)
+
+    def get_request(self, *args, **argsn):
+        request = get_rpc_request(self._service_name, args, argsn)
+        log.debug("-{}-> {} {} {}".format(
+            request['id'],
+            self._service_name,
+            self._json_dumps(args),
+            self._json_dumps(argsn),
+        ))
+        return request
+
+    async def __call__(self, *args, **argsn):
+        postdata = self._json_dumps(self.get_request(*args, **argsn))
+        response, status = await self._request(postdata.encode('utf-8'))
+        return get_rpc_result(response, status)
+
+    async def batch(self, rpc_call_list):
+        postdata = self._json_dumps(list(rpc_call_list))
+        log.debug("--> " + postdata)
+        response, status = await self._request(postdata.encode('utf-8'))
+        if status != HTTPStatus.OK:
+            raise JSONRPCException({
+                'code': -342, 'message': 'non-200 HTTP status code'}, status)
+        return response
+
+    async def _request(self, postdata):
+        headers = {'Host': self._url.hostname,
+                   'User-Agent': USER_AGENT,
+                   'Authorization': self._auth_header,
+                   'Content-type': 'application/json'}
+        req_start_time = time.time()
+        try:
+            status, reason, response_headers, data = await asyncio.wait_for(
+                self._connections.request(self._url.path or '/', headers, postdata), self.timeout)
+        except asyncio.TimeoutError:
+            raise JSONRPCException({
+                'code': -344,
+                'message': '%r RPC took longer than %f seconds. Consider '
+                           'using larger timeout for calls that take '
+                           'longer to return.' % (self._service_name, self.timeout)})
+        return decode_http_response(status, reason, response_headers.get('content-type'), data,
+                                    time.time() - req_start_time, self._json_dumps)
+
+    async def close(self):
+        await self._connections.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+class TestFrameworkAuthproxy(unittest.TestCase):
+    def test_json_stream_reader(self):
+        doc = {"a": [1, -2, 12.5, 4.656542373906925e-05, 1E+30, 0, 10, True, None, "x\u00e9"],
+               "b": {"c": [{"d": 100000000}, [], {}], "e": -0.0}}
+        data = json.dumps(doc, separators=(',', ':'), ensure_ascii=False).encode()
+        for chunk_size in range(1, 12):
+            reader = JSONStreamReader(io.BytesIO(data), parse_float=float, chunk_size=chunk_size)
+            self.assertEqual(list(reader.iter_path(("a",))), doc["a"])
+            reader = JSONStreamReader(io.BytesIO(data), parse_float=float, chunk_size=chunk_size)
+            self.assertEqual(dict(reader.iter_path()), doc)
+            reader = JSONStreamReader(io.BytesIO(data), parse_float=float, chunk_size=chunk_size)
+            self.assertEqual(list(reader.iter_path(("b", "c"))), doc["b"]["c"])
+        self.assertEqual(JSONStreamReader(io.BytesIO(b"12.5"), chunk_size=1).read_value(), decimal.Decimal("12.5"))
+        self.assertRaises(KeyError, list, JSONStreamReader(io.BytesIO(data), chunk_size=1).iter_path(("f",)))
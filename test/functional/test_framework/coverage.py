@@ -67,6 +67,10 @@ class AuthServiceProxyWrapper():
         self._log_call()
         return self.auth_service_proxy_instance.get_request(*args, **kwargs)
 
+    def stream(self, *args, **kwargs):
+        self._log_call()
+        return self.auth_service_proxy_instance.stream(*args, **kwargs)
+
 def get_filename(dirname, n_node):
     """
     Get a filename unique to the test process ID and node.
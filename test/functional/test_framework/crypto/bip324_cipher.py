@@ -5,17 +5,24 @@
 
 """Test-only implementation of ChaCha20 Poly1305 AEAD Construction in RFC 8439 and FSChaCha20Poly1305 for BIP 324
 
-It is designed for ease of understanding, not performance.
+It is designed for ease of understanding, not performance. When the `cryptography` package
+is available, its native ChaCha20Poly1305 is used instead; the pure Python implementation is
+kept as the reference and cross-checked against it.
 
 WARNING: This code is slow and trivially vulnerable to side channel attacks. Do not use for
 anything but tests.
 """
 
+import os
 import unittest
 
-from .chacha20 import chacha20_block, REKEY_INTERVAL
+from .chacha20 import chacha20_block, HAVE_CRYPTOGRAPHY, REKEY_INTERVAL
 from .poly1305 import Poly1305
 
+if HAVE_CRYPTOGRAPHY:
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives.ciphers.aead import ChaCha20Poly1305
+
 
 def pad16(x):
     if len(x) % 16 == 0:
@@ -23,7 +30,7 @@ def pad16(x):
     return b'\x00' * (16 - (len(x) % 16))
 
 
-def aead_chacha20_poly1305_encrypt(key, nonce, aad, plaintext):
+def aead_chacha20_poly1305_encrypt_python(key, nonce, aad, plaintext):
     """Encrypt a plaintext using ChaCha20Poly1305."""
     if plaintext is None:
         return None
@@ -42,7 +49,7 @@ def aead_chacha20_poly1305_encrypt(key, nonce, aad, plaintext):
     return bytes(ret)
 
 
-def aead_chacha20_poly1305_decrypt(key, nonce, aad, ciphertext):
+def aead_chacha20_poly1305_decrypt_python(key, nonce, aad, ciphertext):
     """Decrypt a ChaCha20Poly1305 ciphertext."""
     if ciphertext is None or len(ciphertext) < 16:
         return None
@@ -62,6 +69,31 @@ def aead_chacha20_poly1305_decrypt(key, nonce, aad, ciphertext):
     return bytes(ret)
 
 
+def aead_chacha20_poly1305_encrypt_native(key, nonce, aad, plaintext):
+    """Like aead_chacha20_poly1305_encrypt_python, using the cryptography package."""
+    if plaintext is None:
+        return None
+    return ChaCha20Poly1305(key).encrypt(nonce, plaintext, aad)
+
+
+def aead_chacha20_poly1305_decrypt_native(key, nonce, aad, ciphertext):
+    """Like aead_chacha20_poly1305_decrypt_python, using the cryptography package."""
+    if ciphertext is None or len(ciphertext) < 16:
+        return None
+    try:
+        return ChaCha20Poly1305(key).decrypt(nonce, ciphertext, aad)
+    except InvalidTag:
+        return None
+
+
+if HAVE_CRYPTOGRAPHY:
+    aead_chacha20_poly1305_encrypt = aead_chacha20_poly1305_encrypt_native
+    aead_chacha20_poly1305_decrypt = aead_chacha20_poly1305_decrypt_native
+else:
+    aead_chacha20_poly1305_encrypt = aead_chacha20_poly1305_encrypt_python
+    aead_chacha20_poly1305_decrypt = aead_chacha20_poly1305_decrypt_python
+
+
 class FSChaCha20Poly1305:
     """Rekeying wrapper AEAD around ChaCha20Poly1305."""
     def __init__(self, initial_key):
@@ -87,6 +119,9 @@ class FSChaCha20Poly1305:
     def encrypt(self, aad, plaintext):
         return self._crypt(aad, plaintext, False)
 
+    def encrypt_many(self, aad, plaintexts):
+        return [self._crypt(aad, plaintext, False) for plaintext in plaintexts]
+
 
 # Test vectors from RFC8439 consisting of plaintext, aad, 32 byte key, 12 byte nonce and ciphertext
 AEAD_TESTS = [
@@ -181,6 +216,29 @@ class TestFrameworkAEAD(unittest.TestCase):
             plaintext = aead_chacha20_poly1305_decrypt(key, nonce, aad, ciphertext)
             self.assertEqual(plain, plaintext)
 
+    @unittest.skipIf(not HAVE_CRYPTOGRAPHY, "cryptography package not available")
+    def test_aead_native(self):
+        """Cross-check the native AEAD against the Python implementation."""
+        for test_vector in AEAD_TESTS:
+            hex_plain, hex_aad, hex_key, hex_nonce, hex_cipher = test_vector
+            plain = bytes.fromhex(hex_plain)
+            aad = bytes.fromhex(hex_aad)
+            key = bytes.fromhex(hex_key)
+            nonce = hex_nonce[0].to_bytes(4, 'little') + hex_nonce[1].to_bytes(8, 'little')
+
+            ciphertext = aead_chacha20_poly1305_encrypt_native(key, nonce, aad, plain)
+            self.assertEqual(hex_cipher, ciphertext.hex())
+            self.assertEqual(plain, aead_chacha20_poly1305_decrypt_native(key, nonce, aad, ciphertext))
+        for size in (0, 1, 63, 64, 65, 1000):
+            key, nonce, aad, plain = os.urandom(32), os.urandom(12), os.urandom(size % 20), os.urandom(size)
+            ciphertext = aead_chacha20_poly1305_encrypt_native(key, nonce, aad, plain)
+            self.assertEqual(ciphertext, aead_chacha20_poly1305_encrypt_python(key, nonce, aad, plain))
+            self.assertEqual(plain, aead_chacha20_poly1305_decrypt_python(key, nonce, aad, ciphertext))
+            # Both reject a tampered ciphertext
+            tampered = bytes([ciphertext[0] ^ 1]) + ciphertext[1:]
+            self.assertIsNone(aead_chacha20_poly1305_decrypt_native(key, nonce, aad, tampered))
+            self.assertIsNone(aead_chacha20_poly1305_decrypt_python(key, nonce, aad, tampered))
+
     def test_fschacha20poly1305aead(self):
         "FSChaCha20Poly1305 AEAD test vectors."
         for test_vector in FSAEAD_TESTS:
@@ -5,14 +5,23 @@
 
 """Test-only implementation of ChaCha20 cipher and FSChaCha20 for BIP 324
 
-It is designed for ease of understanding, not performance.
+It is designed for ease of understanding, not performance. When the `cryptography` package
+is available, keystream generation is done by its native ChaCha20 instead; the pure Python
+implementation is kept as the reference and cross-checked against it.
 
 WARNING: This code is slow and trivially vulnerable to side channel attacks. Do not use for
 anything but tests.
 """
 
+import os
 import unittest
 
+try:
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms
+    HAVE_CRYPTOGRAPHY = True
+except ImportError:
+    HAVE_CRYPTOGRAPHY = False
+
 CHACHA20_INDICES = (
     (0, 4, 8, 12), (1, 5, 9, 13), (2, 6, 10, 14), (3, 7, 11, 15),
     (0, 5, 10, 15), (1, 6, 11, 12), (2, 7, 8, 13), (3, 4, 9, 14)
@@ -20,6 +29,7 @@ CHACHA20_INDICES = (
 
 CHACHA20_CONSTANTS = (0x61707865, 0x3320646e, 0x79622d32, 0x6b206574)
 REKEY_INTERVAL = 224 # packets
+KEYSTREAM_BLOCKS = 16 # enough for the length fields and rekey of a whole BIP324 rekey interval
 
 
 def rotl32(v, bits):
@@ -63,34 +73,88 @@ def chacha20_block(key, nonce, cnt):
     # Produce byte output
     return b''.join(state[i].to_bytes(4, 'little') for i in range(16))
 
+
+def chacha20_keystream_python(key, nonce, cnt, nblocks):
+    """Compute nblocks consecutive ChaCha20 blocks, starting at block counter cnt."""
+    return b''.join(chacha20_block(key, nonce, cnt + i) for i in range(nblocks))
+
+
+def chacha20_keystream_native(key, nonce, cnt, nblocks):
+    """Like chacha20_keystream_python, using the cryptography package."""
+    cipher = Cipher(algorithms.ChaCha20(key, cnt.to_bytes(4, 'little') + nonce), mode=None)
+    return cipher.encryptor().update(bytes(64 * nblocks))
+
+
+chacha20_keystream = chacha20_keystream_native if HAVE_CRYPTOGRAPHY else chacha20_keystream_python
+
+
+def xor_bytes(a, b):
+    """XOR two byte strings of equal length."""
+    return (int.from_bytes(a, 'little') ^ int.from_bytes(b, 'little')).to_bytes(len(a), 'little')
+
+
 class FSChaCha20:
-    """Rekeying wrapper stream cipher around ChaCha20."""
-    def __init__(self, initial_key, rekey_interval=REKEY_INTERVAL):
+    """Rekeying wrapper stream cipher around ChaCha20.
+
+    Keystream is generated keystream_blocks blocks at a time, so that the small chunks of the
+    BIP324 length cipher, and the key of the next rekey, usually come from keystream computed
+    in bulk ahead of time."""
+    def __init__(self, initial_key, rekey_interval=REKEY_INTERVAL, keystream_blocks=KEYSTREAM_BLOCKS):
         self._key = initial_key
         self._rekey_interval = rekey_interval
+        self._keystream_blocks = keystream_blocks
         self._block_counter = 0
         self._chunk_counter = 0
         self._keystream = b''
+        self._keystream_pos = 0
 
     def _get_keystream_bytes(self, nbytes):
-        while len(self._keystream) < nbytes:
+        end = self._keystream_pos + nbytes
+        if end > len(self._keystream):
             nonce = ((0).to_bytes(4, 'little') + (self._chunk_counter // self._rekey_interval).to_bytes(8, 'little'))
-            self._keystream += chacha20_block(self._key, nonce, self._block_counter)
-            self._block_counter += 1
-        ret = self._keystream[:nbytes]
-        self._keystream = self._keystream[nbytes:]
+            nblocks = max(self._keystream_blocks, (end - len(self._keystream) + 63) // 64)
+            self._keystream = (self._keystream[self._keystream_pos:] +
+                               chacha20_keystream(self._key, nonce, self._block_counter, nblocks))
+            self._block_counter += nblocks
+            self._keystream_pos, end = 0, nbytes
+        ret = self._keystream[self._keystream_pos:end]
+        self._keystream_pos = end
         return ret
 
+    def _rekey(self):
+        self._key = self._get_keystream_bytes(32)
+        self._block_counter = 0
+        self._keystream = b''
+        self._keystream_pos = 0
+
     def crypt(self, chunk):
         ks = self._get_keystream_bytes(len(chunk))
-        ret = bytes([ks[i] ^ chunk[i] for i in range(len(chunk))])
+        ret = xor_bytes(chunk, ks)
         if ((self._chunk_counter + 1) % self._rekey_interval) == 0:
-            self._key = self._get_keystream_bytes(32)
-            self._block_counter = 0
-            self._keystream = b''
+            self._rekey()
         self._chunk_counter += 1
         return ret
 
+    def crypt_many(self, chunks):
+        """Encrypt/decrypt a list of chunks, equivalent to calling crypt on each in turn."""
+        ret = []
+        pos = 0
+        while pos < len(chunks):
+            # All chunks up to the next rekey use the same key and are processed together.
+            n = min(len(chunks) - pos, self._rekey_interval - self._chunk_counter % self._rekey_interval)
+            batch = chunks[pos:pos + n]
+            data = b''.join(batch)
+            out = xor_bytes(data, self._get_keystream_bytes(len(data)))
+            offset = 0
+            for chunk in batch:
+                ret.append(out[offset:offset + len(chunk)])
+                offset += len(chunk)
+            if ((self._chunk_counter + n) % self._rekey_interval) == 0:
+                self._rekey()
+            self._chunk_counter += n
+            pos += n
+        return ret
+
 
 # Test vectors from RFC7539/8439 consisting of 32 byte key, 12 byte nonce, block counter
 # and 64 byte output after applying `chacha20_block` function
@@ -148,6 +212,19 @@ class TestFrameworkChacha(unittest.TestCase):
             keystream = chacha20_block(key, nonce_bytes, counter)
             self.assertEqual(hex_output, keystream.hex())
 
+    @unittest.skipIf(not HAVE_CRYPTOGRAPHY, "cryptography package not available")
+    def test_chacha20_native(self):
+        """Cross-check the native keystream against the Python implementation."""
+        for test_vector in CHACHA20_TESTS:
+            hex_key, nonce, counter, hex_output = test_vector
+            nonce_bytes = nonce[0].to_bytes(4, 'little') + nonce[1].to_bytes(8, 'little')
+            keystream = chacha20_keystream_native(bytes.fromhex(hex_key), nonce_bytes, counter, 1)
+            self.assertEqual(hex_output, keystream.hex())
+        for nblocks in (1, 2, 7):
+            key, nonce, counter = os.urandom(32), os.urandom(12), int.from_bytes(os.urandom(2), 'little')
+            self.assertEqual(chacha20_keystream_native(key, nonce, counter, nblocks),
+                             chacha20_keystream_python(key, nonce, counter, nblocks))
+
     def test_fschacha20(self):
         """FSChaCha20 test vectors."""
         for test_vector in FSCHACHA20_TESTS:
@@ -160,3 +237,18 @@ class TestFrameworkChacha(unittest.TestCase):
 
             ciphertext = fsc20.crypt(plaintext)
             self.assertEqual(hex_ciphertext_after_rotation, ciphertext.hex())
+
+            fsc20 = FSChaCha20(key, rekey_interval)
+            ciphertexts = fsc20.crypt_many([plaintext] * (rekey_interval + 1))
+            self.assertEqual(hex_ciphertext_after_rotation, ciphertexts[-1].hex())
+
+    def test_fschacha20_crypt_many(self):
+        """crypt_many matches crypt across rekeys, for any batching and keystream buffering."""
+        key = bytes(range(32))
+        chunks = [bytes([i]) * (i % 70) for i in range(40)]
+        fsc20 = FSChaCha20(key, 7)
+        expected = [fsc20.crypt(chunk) for chunk in chunks]
+        for keystream_blocks in (1, 3, 16):
+            fsc20 = FSChaCha20(key, 7, keystream_blocks)
+            self.assertEqual(fsc20.crypt_many(chunks[:5]) + fsc20.crypt_many(chunks[5:20]) +
+                             [fsc20.crypt(chunk) for chunk in chunks[20:23]] + fsc20.crypt_many(chunks[23:]), expected)
@@ -3,17 +3,36 @@
 # file COPYING or http://www.opensource.org/licenses/mit-license.php.
 """Native Python MuHash3072 implementation."""
 
+import functools
 import hashlib
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 
-from .chacha20 import chacha20_block
+from .chacha20 import chacha20_keystream
+
+# Number of elements per task when insert_many/remove_many distribute work over an executor.
+MUHASH_SHARD_SIZE = 4096
 
 def data_to_num3072(data):
     """Hash a 32-byte array data to a 3072-bit number using 6 Chacha20 operations."""
-    bytes384 = b""
-    for counter in range(6):
-        bytes384 += chacha20_block(data, bytes(12), counter)
-    return int.from_bytes(bytes384, 'little')
+    return int.from_bytes(chacha20_keystream(data, bytes(12), 0, 6), 'little')
+
+def mulmod3072(a, b):
+    """Compute a*b modulo MuHash3072.MODULUS, for a and b below 2**3072.
+
+    As the modulus is 2**3072 - C for a small C, the reduction can use
+    x = lo + hi*2**3072 == lo + hi*C instead of a much slower long division."""
+    x = a * b
+    x = (x & MuHash3072.MASK) + (x >> 3072) * MuHash3072.C
+    x = (x & MuHash3072.MASK) + (x >> 3072) * MuHash3072.C
+    return x - MuHash3072.MODULUS if x >= MuHash3072.MODULUS else x
+
+def num3072_product(items):
+    """Compute the product of the 3072-bit numbers of a list of byte arrays, modulo MuHash3072.MODULUS."""
+    ret = 1
+    for data in items:
+        ret = mulmod3072(ret, data_to_num3072(hashlib.sha256(data).digest()))
+    return ret
 
 class MuHash3072:
     """Class representing the MuHash3072 computation of a set.
@@ -21,7 +40,9 @@ class MuHash3072:
     See https://cseweb.ucsd.edu/~mihir/papers/inchash.pdf and https://lists.linuxfoundation.org/pipermail/bitcoin-dev/2017-May/014337.html
     """
 
-    MODULUS = 2**3072 - 1103717
+    C = 1103717
+    MODULUS = 2**3072 - C
+    MASK = 2**3072 - 1
 
     def __init__(self):
         """Initialize for an empty set."""
@@ -31,12 +52,31 @@ class MuHash3072:
     def insert(self, data):
         """Insert a byte array data in the set."""
         data_hash = hashlib.sha256(data).digest()
-        self.numerator = (self.numerator * data_to_num3072(data_hash)) % self.MODULUS
+        self.numerator = mulmod3072(self.numerator, data_to_num3072(data_hash))
 
     def remove(self, data):
         """Remove a byte array from the set."""
         data_hash = hashlib.sha256(data).digest()
-        self.denominator = (self.denominator * data_to_num3072(data_hash)) % self.MODULUS
+        self.denominator = mulmod3072(self.denominator, data_to_num3072(data_hash))
+
+    @staticmethod
+    def _product(items, executor):
+        if executor is None:
+            return num3072_product(items)
+        items = list(items)
+        shards = [items[i:i + MUHASH_SHARD_SIZE] for i in range(0, len(items), MUHASH_SHARD_SIZE)]
+        return functools.reduce(mulmod3072, executor.map(num3072_product, shards), 1)
+
+    def insert_many(self, items, executor=None):
+        """Insert all byte arrays in items in the set.
+
+        If a concurrent.futures executor is given (typically a ProcessPoolExecutor),
+        the elements are hashed and multiplied in shards of MUHASH_SHARD_SIZE on it."""
+        self.numerator = mulmod3072(self.numerator, self._product(items, executor))
+
+    def remove_many(self, items, executor=None):
+        """Remove all byte arrays in items from the set, see insert_many."""
+        self.denominator = mulmod3072(self.denominator, self._product(items, executor))
 
     def digest(self):
         """Extract the final hash. Does not modify this object."""
@@ -53,3 +93,24 @@ class TestFrameworkMuhash(unittest.TestCase):
         finalized = muhash.digest()
         # This mirrors the result in the C++ MuHash3072 unit test
         self.assertEqual(finalized[::-1].hex(), "10d312b100cbd32ada024a6646e40d3482fcff103668d2625f10002a607d5863")
+
+    def test_muhash_many(self):
+        items = [i.to_bytes(4, 'little') * 9 for i in range(2 * MUHASH_SHARD_SIZE + 10)]
+        muhash = MuHash3072()
+        for data in items:
+            muhash.insert(data)
+        muhash.remove(items[5])
+        muhash_many = MuHash3072()
+        muhash_many.insert_many(items)
+        muhash_many.remove_many([items[5]])
+        self.assertEqual(muhash_many.digest(), muhash.digest())
+        with ThreadPoolExecutor(2) as executor:
+            muhash_many = MuHash3072()
+            muhash_many.insert_many(iter(items), executor)
+            muhash_many.remove_many(items[5:6], executor)
+        self.assertEqual(muhash_many.digest(), muhash.digest())
+
+    def test_mulmod3072(self):
+        M = MuHash3072.MODULUS
+        for a, b in [(M - 1, M - 1), (2**3072 - 1, 2**3072 - 1), (M, 5), (0, 7), (3, 2**3071)]:
+            self.assertEqual(mulmod3072(a, b), a * b % M)
@@ -4,7 +4,9 @@
 
 """Test-only implementation of low-level secp256k1 field and group arithmetic
 
-It is designed for ease of understanding, not performance.
+It is designed for ease of understanding, not performance. The one exception is scalar
+multiplication, which internally uses Jacobian coordinates on plain integers and wNAF-based
+Strauss multi-scalar multiplication, as signing and verification dominate many tests.
 
 WARNING: This code is slow and trivially vulnerable to side channel attacks. Do not use for
 anything but tests.
@@ -15,7 +17,10 @@ Exports:
 * G: the secp256k1 generator point
 """
 
+import random
+import threading
 import unittest
+from collections import OrderedDict
 from hashlib import sha256
 from test_framework.util import assert_not_equal
 
@@ -151,6 +156,109 @@ class FE:
         return f"FE(0x{int(self):x})"
 
 
+# Internal Jacobian-coordinate arithmetic used for scalar multiplication. Points are (X, Y, Z)
+# tuples of integers modulo FE.SIZE representing the affine point (X/Z^2, Y/Z^3); Z == 0 is
+# infinity. Affine points are (x, y) tuples of integers.
+
+# Window size for the wNAF representation of scalars in GE.mul.
+WNAF_WINDOW = 5
+
+JACOBIAN_INFINITY = (1, 1, 0)
+
+
+def _jacobian_double(p):
+    """Double a point in Jacobian coordinates."""
+    X, Y, Z = p
+    if Z == 0 or Y == 0:
+        return JACOBIAN_INFINITY
+    P = FE.SIZE
+    Y2 = Y * Y % P
+    S = 4 * X * Y2 % P
+    M = 3 * X * X % P
+    X3 = (M * M - 2 * S) % P
+    return (X3, (M * (S - X3) - 8 * Y2 * Y2) % P, 2 * Y * Z % P)
+
+
+def _jacobian_add_affine(p, q):
+    """Add a Jacobian point p and an affine point q."""
+    X1, Y1, Z1 = p
+    x2, y2 = q
+    if Z1 == 0:
+        return (x2, y2, 1)
+    P = FE.SIZE
+    Z1Z1 = Z1 * Z1 % P
+    H = (x2 * Z1Z1 - X1) % P
+    R = (y2 * Z1Z1 * Z1 - Y1) % P
+    if H == 0:
+        return _jacobian_double(p) if R == 0 else JACOBIAN_INFINITY
+    HH = H * H % P
+    HHH = H * HH % P
+    V = X1 * HH % P
+    X3 = (R * R - HHH - 2 * V) % P
+    return (X3, (R * (V - X3) - Y1 * HHH) % P, Z1 * H % P)
+
+
+def _jacobian_add(p, q):
+    """Add two points in Jacobian coordinates."""
+    X1, Y1, Z1 = p
+    X2, Y2, Z2 = q
+    if Z1 == 0:
+        return q
+    if Z2 == 0:
+        return p
+    P = FE.SIZE
+    Z1Z1 = Z1 * Z1 % P
+    Z2Z2 = Z2 * Z2 % P
+    U1 = X1 * Z2Z2 % P
+    S1 = Y1 * Z2Z2 * Z2 % P
+    H = (X2 * Z1Z1 - U1) % P
+    R = (Y2 * Z1Z1 * Z1 - S1) % P
+    if H == 0:
+        return _jacobian_double(p) if R == 0 else JACOBIAN_INFINITY
+    HH = H * H % P
+    HHH = H * HH % P
+    V = U1 * HH % P
+    X3 = (R * R - HHH - 2 * V) % P
+    return (X3, (R * (V - X3) - S1 * HHH) % P, Z1 * Z2 * H % P)
+
+
+def _jacobian_to_affine_batch(points):
+    """Convert a list of finite Jacobian points to affine, using a single inversion."""
+    P = FE.SIZE
+    # Montgomery's trick: invert the product of all Z coordinates, then peel off each one.
+    prefix = [1]
+    for _, _, Z in points:
+        prefix.append(prefix[-1] * Z % P)
+    inv = pow(prefix[-1], -1, P)
+    ret = [None] * len(points)
+    for i in range(len(points) - 1, -1, -1):
+        X, Y, Z = points[i]
+        zi = inv * prefix[i] % P
+        inv = inv * Z % P
+        zi2 = zi * zi % P
+        ret[i] = (X * zi2 % P, Y * zi2 * zi % P)
+    return ret
+
+
+def _wnaf(a, w):
+    """Compute the width-w NAF of a non-negative integer, least significant digit first.
+
+    All nonzero digits are odd, in range -(2^(w-1)-1)..2^(w-1)-1, and followed by at least
+    w-1 zeros."""
+    digits = []
+    while a:
+        if a & 1:
+            d = a & ((1 << w) - 1)
+            if d >= 1 << (w - 1):
+                d -= 1 << w
+            a -= d
+        else:
+            d = 0
+        digits.append(d)
+        a >>= 1
+    return digits
+
+
 class GE:
     """Objects of this class represent secp256k1 group elements (curve points or infinity)
 
@@ -184,6 +292,27 @@ class GE:
             self.x = fx
             self.y = fy
 
+    @staticmethod
+    def _from_trusted(x, y):
+        """Construct a group element from coordinates known to be on the curve, skipping the check."""
+        r = GE.__new__(GE)
+        r.infinity = False
+        r.x = FE(x)
+        r.y = FE(y)
+        return r
+
+    def _to_affine(self):
+        """Get the (x, y) integer coordinates of a non-infinite group element."""
+        return (int(self.x), int(self.y))
+
+    @staticmethod
+    def _from_jacobian(p):
+        """Convert a point in Jacobian coordinates to a group element."""
+        if p[2] == 0:
+            return GE()
+        [(x, y)] = _jacobian_to_affine_batch([p])
+        return GE._from_trusted(x, y)
+
     def __add__(self, a):
         """Add two group elements together."""
         # Deal with infinity: a + infinity == infinity + a == a.
@@ -205,39 +334,69 @@ class GE:
         # Determine point opposite to the intersection of that line with the curve.
         x = lam**2 - (self.x + a.x)
         y = lam * (self.x - x) - self.y
-        return GE(x, y)
+        return GE._from_trusted(x, y)
+
+    def _odd_multiples(self, n):
+        """Compute the affine coordinates of [1*self, 3*self, ..., (2n-1)*self]."""
+        p = self._to_affine()
+        p2 = _jacobian_double(p + (1,))
+        multiples = [p + (1,)]
+        for _ in range(n - 1):
+            multiples.append(_jacobian_add(multiples[-1], p2))
+        return _jacobian_to_affine_batch(multiples)
 
     @staticmethod
     def mul(*aps):
         """Compute a (batch) scalar group element multiplication.
 
         GE.mul((a1, p1), (a2, p2), (a3, p3)) is identical to a1*p1 + a2*p2 + a3*p3,
-        but more efficient."""
-        # Reduce all the scalars modulo order first (so we can deal with negatives etc).
-        naps = [(a % GE.ORDER, p) for a, p in aps]
-        # Start with point at infinity.
-        r = GE()
-        # Iterate over all bit positions, from high to low.
-        for i in range(255, -1, -1):
-            # Double what we have so far.
-            r = r + r
-            # Add then add the points for which the corresponding scalar bit is set.
-            for (a, p) in naps:
-                if (a >> i) & 1:
-                    r += p
-        return r
+        but more efficient.
+
+        A term can be given as (a, p, True) to mark p as likely to be multiplied again (e.g. a
+        public key being verified against), which makes it eligible for a cached fixed-base
+        table (see fixed_base_table). Terms with G, or with a point that has such a table, are
+        computed from the table. The others use Strauss' algorithm: the scalars are written in
+        wNAF form, and a single sequence of doublings is shared by all terms, adding or
+        subtracting a precomputed odd multiple of each point wherever its wNAF has a nonzero
+        digit."""
+        P = FE.SIZE
+        fixed = JACOBIAN_INFINITY
+        terms = []
+        for a, p, *reusable in aps:
+            # Reduce all the scalars modulo order first (so we can deal with negatives etc).
+            a %= GE.ORDER
+            if a == 0 or p.infinity:
+                continue
+            if p is G:
+                table = FAST_G
+            elif reusable and reusable[0]:
+                table = fixed_base_table(p)
+            else:
+                table = None
+            if table is not None:
+                fixed = _jacobian_add(fixed, table.mul_jacobian(a))
+                continue
+            terms.append((_wnaf(a, WNAF_WINDOW), p._odd_multiples(1 << (WNAF_WINDOW - 2))))
+        r = JACOBIAN_INFINITY
+        # Iterate over all digit positions, from high to low.
+        for i in range(max((len(digits) for digits, _ in terms), default=0) - 1, -1, -1):
+            r = _jacobian_double(r)
+            for digits, table in terms:
+                if i < len(digits) and digits[i]:
+                    d = digits[i]
+                    x, y = table[abs(d) >> 1]
+                    r = _jacobian_add_affine(r, (x, y) if d > 0 else (x, P - y))
+        return GE._from_jacobian(_jacobian_add(r, fixed))
 
     def __rmul__(self, a):
         """Multiply an integer with a group element."""
-        if self == G:
-            return FAST_G.mul(a)
         return GE.mul((a, self))
 
     def __neg__(self):
         """Compute the negation of a group element."""
         if self.infinity:
             return self
-        return GE(self.x, -self.y)
+        return GE._from_trusted(self.x, -self.y)
 
     def to_bytes_compressed(self):
         """Convert a non-infinite group element to 33-byte compressed encoding."""
@@ -322,34 +481,158 @@ G = GE.lift_x(0x79BE667EF9DCBBAC55A06295CE870B07029BFCDB2DCE28D959F2815B16F81798
 class FastGEMul:
     """Table for fast multiplication with a constant group element.
 
-    Speed up scalar multiplication with a fixed point P by using a precomputed lookup table with
-    its powers of 2:
+    Speed up scalar multiplication with a fixed point P by using a precomputed fixed-window
+    lookup table. The scalar is split into windows of `window` bits, and for every window
+    position i the table holds all nonzero multiples of P that window can select:
 
-        table = [P, 2*P, 4*P, (2^3)*P, (2^4)*P, ..., (2^255)*P]
+        table[i] = [1*(2^(window*i))*P, 2*(2^(window*i))*P, ..., (2^window-1)*(2^(window*i))*P]
 
-    During multiplication, the points corresponding to each bit set in the scalar are added up,
-    i.e. on average ~128 point additions take place.
+    During multiplication, one table entry is added per nonzero window of the scalar, i.e. at
+    most 256/window point additions and no doublings take place. These are done in Jacobian
+    coordinates, with a single inversion at the end. The table is only built on first use.
     """
 
-    def __init__(self, p):
-        self.table = [p]  # table[i] = (2^i) * p
-        for _ in range(255):
-            p = p + p
-            self.table.append(p)
-
-    def mul(self, a):
-        result = GE()
+    def __init__(self, p, window=4):
+        self.point = p
+        self.window = window
+        self._table = None
+
+    @property
+    def table(self):
+        if self._table is None:
+            row_size = (1 << self.window) - 1
+            base = self.point._to_affine() + (1,)
+            multiples = []
+            for _ in range((256 + self.window - 1) // self.window):
+                row = [base]
+                for _ in range(row_size - 1):
+                    row.append(_jacobian_add(row[-1], base))
+                multiples += row
+                base = _jacobian_add(row[-1], base)
+            affine = _jacobian_to_affine_batch(multiples)
+            self._table = [affine[i:i + row_size] for i in range(0, len(affine), row_size)]
+        return self._table
+
+    def mul_jacobian(self, a):
+        """Compute a*P, in Jacobian coordinates."""
+        result = JACOBIAN_INFINITY
         a = a % GE.ORDER
-        for bit in range(a.bit_length()):
-            if a & (1 << bit):
-                result += self.table[bit]
+        mask = (1 << self.window) - 1
+        for row in self.table:
+            if a & mask:
+                result = _jacobian_add_affine(result, row[(a & mask) - 1])
+            a >>= self.window
         return result
 
+    def mul(self, a):
+        return GE._from_jacobian(self.mul_jacobian(a))
+
 # Precomputed table with multiples of G for fast multiplication
-FAST_G = FastGEMul(G)
+FAST_G = FastGEMul(G, window=8)
+
+# Points other than G that GE.mul is told are reusable, and that are multiplied at least
+# FIXED_BASE_MIN_USES times, get their own FastGEMul table; tables are kept for the
+# FIXED_BASE_CACHE_SIZE most recently used points.
+FIXED_BASE_MIN_USES = 4
+FIXED_BASE_CACHE_SIZE = 32
+
+_fixed_base_cache: OrderedDict[tuple[int, int], list] = OrderedDict()  # (x, y) -> [number of uses, FastGEMul or None]
+_fixed_base_cache_lock = threading.Lock()
+
+
+def fixed_base_table(p):
+    """Get the FastGEMul table to use for multiplying the non-infinite point p, if any.
+
+    Returns FAST_G for G, and a table for p once it has been multiplied often enough to make
+    building one worthwhile (about as expensive as 5 multiplications without it)."""
+    key = p._to_affine()
+    if p is G or key == G._to_affine():
+        return FAST_G
+    with _fixed_base_cache_lock:
+        entry = _fixed_base_cache.get(key)
+        if entry is None:
+            entry = _fixed_base_cache[key] = [0, None]
+            # Use counts are tracked for twice as many points as there are tables.
+            if len(_fixed_base_cache) > 2 * FIXED_BASE_CACHE_SIZE:
+                _fixed_base_cache.popitem(last=False)
+        else:
+            _fixed_base_cache.move_to_end(key)
+        entry[0] += 1
+        if entry[1] is None and entry[0] >= FIXED_BASE_MIN_USES:
+            entry[1] = FastGEMul(p)
+            # Drop the least recently used table beyond the cache size.
+            tables = [k for k, (_, table) in _fixed_base_cache.items() if table is not None]
+            for k in tables[:-FIXED_BASE_CACHE_SIZE]:
+                _fixed_base_cache[k][1] = None
+        return entry[1]
+
+
+def _naive_mul(a, p):
+    """Multiply p by a using affine double-and-add, independently of GE.mul and FastGEMul."""
+    r = GE()
+    for i in range(255, -1, -1):
+        r = r + r
+        if ((a % GE.ORDER) >> i) & 1:
+            r = r + p
+    return r
+
+
+def _same(p, q):
+    return p.infinity == q.infinity and (p.infinity or (p.x == q.x and p.y == q.y))
+
 
 class TestFrameworkSecp256k1(unittest.TestCase):
     def test_H(self):
         H = sha256(G.to_bytes_uncompressed()).digest()
         assert GE.lift_x(FE.from_bytes(H)) is not None
         self.assertEqual(H.hex(), "50929b74c1a04954b78b4b6035e97a5e078a5a0f28ec96d547bfee9ace803ac0")
+
+    def test_mul(self):
+        """Compare GE.mul and FAST_G against affine double-and-add."""
+        rng = random.Random(0)
+        P, Q = [GE.lift_x(FE(x)) for x in range(1, 10) if GE.is_valid_x(FE(x))][:2]
+        scalars = [0, 1, 2, 3, 15, 16, 17, GE.ORDER - 1, GE.ORDER, GE.ORDER + 5, -7, 2**255, 2**256 - 1]
+        scalars += [rng.randrange(2**256) for _ in range(5)]
+        for a in scalars:
+            expected = _naive_mul(a, P)
+            self.assertTrue(_same(GE.mul((a, P)), expected))
+            self.assertTrue(_same(FastGEMul(P).mul(a), expected))
+            self.assertTrue(_same(a * G, _naive_mul(a, G)))
+        for _ in range(5):
+            a, b, c = (rng.randrange(GE.ORDER) for _ in range(3))
+            self.assertTrue(_same(GE.mul((a, P), (b, Q), (c, G)), _naive_mul(a, P) + _naive_mul(b, Q) + _naive_mul(c, G)))
+        # Terms that cancel or coincide
+        self.assertTrue(GE.mul((5, P), (-5, P)).infinity)
+        self.assertTrue(GE.mul((5, P), (5, -P)).infinity)
+        self.assertTrue(_same(GE.mul((5, P), (6, P)), _naive_mul(11, P)))
+        self.assertTrue(GE.mul().infinity)
+        self.assertTrue(GE.mul((3, GE())).infinity)
+
+    def test_fast_mul(self):
+        """FastGEMul tables of any window size, and the fixed-base table cache."""
+        P = GE.lift_x(FE(1))
+        rng = random.Random(1)
+        for window in (1, 3, 5, 8):
+            table = FastGEMul(P, window)
+            for a in [0, 1, GE.ORDER - 1, 2**256 - 1] + [rng.randrange(GE.ORDER) for _ in range(3)]:
+                self.assertTrue(_same(table.mul(a), _naive_mul(a, P)))
+
+        self.assertIs(fixed_base_table(G), FAST_G)
+        self.assertIs(fixed_base_table(GE.from_bytes(G.to_bytes_compressed())), FAST_G)
+        Q = 7 * P
+        for _ in range(FIXED_BASE_MIN_USES - 1):
+            self.assertIsNone(fixed_base_table(Q))
+        table = fixed_base_table(Q)
+        self.assertIsNotNone(table)
+        self.assertIs(fixed_base_table(-(-Q)), table)
+        self.assertTrue(_same(GE.mul((5, Q, True)), _naive_mul(35, P)))
+        self.assertTrue(_same(GE.mul((5, Q, True), (3, P), (2, G)), _naive_mul(38, P) + _naive_mul(2, G)))
+
+        # Points not marked as reusable do not touch the cache
+        R = 11 * P
+        for _ in range(FIXED_BASE_MIN_USES + 1):
+            self.assertTrue(_same(GE.mul((3, R)), _naive_mul(33, P)))
+        self.assertNotIn(R._to_affine(), _fixed_base_cache)
+        for _ in range(FIXED_BASE_MIN_USES):
+            self.assertTrue(_same(GE.mul((3, R, True)), _naive_mul(33, P)))
+        self.assertIsNotNone(_fixed_base_cache[R._to_affine()][1])
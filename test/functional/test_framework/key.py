@@ -12,6 +12,7 @@ import hmac
 import os
 import random
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 
 from test_framework.crypto import secp256k1
 from test_framework.util import assert_not_equal, random_bitflip
@@ -105,11 +106,32 @@ class ECPubKey:
 
         # Run verifier algorithm on r, s
         w = pow(s, -1, ORDER)
-        R = secp256k1.GE.mul((z * w, secp256k1.G), (r * w, self.p))
+        R = secp256k1.GE.mul((z * w, secp256k1.G), (r * w, self.p, True))
         if R.infinity or (int(R.x) % ORDER) != r:
             return False
         return True
 
+
+# Minimum number of signatures for verify_ecdsa_many to use the executor.
+ECDSA_PARALLEL_THRESHOLD = 64
+
+def _verify_ecdsa_entry(entry):
+    pubkey, sig, msg, low_s = entry
+    return pubkey.verify_ecdsa(sig, msg, low_s)
+
+def verify_ecdsa_many(entries, low_s=True, executor=None):
+    """Verify a list of (pubkey, sig, msg) ECDSA signatures, with pubkey an ECPubKey.
+
+    Returns a list with the verification result for each entry. ECDSA signatures cannot be
+    batch verified like Schnorr signatures, so large lists can instead be spread over a
+    concurrent.futures executor given by the caller, typically a ProcessPoolExecutor (threads
+    would not help, as verification holds the GIL)."""
+    entries = [(pubkey, sig, msg, low_s) for pubkey, sig, msg in entries]
+    if executor is None or len(entries) < ECDSA_PARALLEL_THRESHOLD:
+        return [_verify_ecdsa_entry(entry) for entry in entries]
+    chunksize = max(1, len(entries) // (4 * (os.cpu_count() or 1)))
+    return list(executor.map(_verify_ecdsa_entry, entries, chunksize=chunksize))
+
 def generate_privkey():
     """Generate a valid random 32-byte private key."""
     return random.randrange(1, ORDER).to_bytes(32, 'big')
@@ -257,13 +279,82 @@ def verify_schnorr(key, sig, msg):
     if s >= ORDER:
         return False
     e = int.from_bytes(TaggedHash("BIP0340/challenge", sig[0:32] + key + msg), 'big') % ORDER
-    R = secp256k1.GE.mul((s, secp256k1.G), (-e, P))
+    R = secp256k1.GE.mul((s, secp256k1.G), (-e, P, True))
     if R.infinity or not R.y.is_even():
         return False
     if r != R.x:
         return False
     return True
 
+def _parse_schnorr(key, sig, msg):
+    """Decode the points and scalars of a BIP 340 verification equation s*G == R + e*P.
+
+    Returns (P, R, s, e), or None if the encoding alone makes the signature invalid."""
+    assert len(key) == 32
+    assert len(sig) == 64
+
+    P = secp256k1.GE.from_bytes_xonly(key)
+    if P is None:
+        return None
+    r = secp256k1.FE.from_bytes(sig[0:32])
+    if r is None:
+        return None
+    R = secp256k1.GE.lift_x(r)
+    if R is None:
+        return None
+    s = int.from_bytes(sig[32:64], 'big')
+    if s >= ORDER:
+        return None
+    e = int.from_bytes(TaggedHash("BIP0340/challenge", sig[0:32] + key + msg), 'big') % ORDER
+    return (P, R, s, e)
+
+# Number of signatures verify_schnorr_batch checks at once. A batch containing an invalid
+# signature is re-verified one signature at a time, so this bounds the cost of a failure.
+SCHNORR_BATCH_SIZE = 64
+
+def verify_schnorr_batch(entries):
+    """Verify a list of (key, sig, msg) Schnorr signatures (see BIP 340).
+
+    Returns a list with the verification result for each entry, identical to calling
+    verify_schnorr on each of them.
+
+    Batches of SCHNORR_BATCH_SIZE signatures are checked at once with a random linear
+    combination of their verification equations, sum(a_i*s_i)*G == sum(a_i*R_i) + sum(a_i*e_i*P_i),
+    which is a single multi-scalar multiplication. The signatures of a batch that fails this check
+    are verified individually to find the invalid ones. The coefficients a_i are derived from a
+    hash of all entries, so that verifying does not disturb the state of the random module."""
+    entries = list(entries)
+    results = [False] * len(entries)
+    parsed = []
+    seed = hashlib.sha256()
+    for i, (key, sig, msg) in enumerate(entries):
+        eq = _parse_schnorr(key, sig, msg)
+        if eq is not None:
+            parsed.append((i, key, eq))
+            seed.update(key + sig + hashlib.sha256(msg).digest())
+    seed = seed.digest()
+
+    def check(batch):
+        terms = []
+        key_terms = {}  # signatures by the same key share a single term (the R terms are one-off points)
+        s_sum = 0
+        for i, key, (P, R, s, e) in batch:
+            a = int.from_bytes(TaggedHash("BIP0340/batch", seed + i.to_bytes(4, 'big')), 'big') % ORDER
+            s_sum += a * s
+            terms.append((-a, R))
+            key_terms.setdefault(key, [0, P, True])[0] -= a * e
+        return secp256k1.GE.mul((s_sum, secp256k1.G), *terms, *key_terms.values()).infinity
+
+    for pos in range(0, len(parsed), SCHNORR_BATCH_SIZE):
+        batch = parsed[pos:pos + SCHNORR_BATCH_SIZE]
+        if check(batch):
+            for i, _, _ in batch:
+                results[i] = True
+        else:
+            for entry in batch:
+                results[entry[0]] = check([entry])
+    return results
+
 def sign_schnorr(key, msg, aux=None, flip_p=False, flip_r=False):
     """Create a Schnorr signature (see BIP 340)."""
 
@@ -343,3 +434,43 @@ class TestFrameworkKey(unittest.TestCase):
                     self.assertEqual(result, result_actual, "BIP340 test vector %i (%s): verification succeeded unexpectedly" % (i, comment))
                 num_tests += 1
         self.assertTrue(num_tests >= 15) # expect at least 15 test vectors
+
+    def test_schnorr_batch(self):
+        """Batch verification agrees with verify_schnorr and pinpoints invalid signatures."""
+        entries = []
+        vectors_file = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'bip340_test_vectors.csv')
+        with open(vectors_file, newline='', encoding='utf8') as csvfile:
+            reader = csv.reader(csvfile)
+            next(reader)
+            for row in reader:
+                entries.append((bytes.fromhex(row[2]), bytes.fromhex(row[5]), bytes.fromhex(row[4])))
+        privkeys = [generate_privkey() for _ in range(3)]
+        for i in range(20):
+            privkey = privkeys[i % 3]
+            msg = random.randbytes(32)
+            sig = sign_schnorr(privkey, msg)
+            if i % 7 == 3:
+                sig = random_bitflip(sig)
+            entries.append((compute_xonly_pubkey(privkey)[0], sig, msg))
+        random.shuffle(entries)
+        self.assertEqual(verify_schnorr_batch(entries), [verify_schnorr(*entry) for entry in entries])
+        valid = [entry for entry in entries if verify_schnorr(*entry)]
+        self.assertEqual(verify_schnorr_batch(valid), [True] * len(valid))
+        self.assertEqual(verify_schnorr_batch([]), [])
+
+    def test_ecdsa_many(self):
+        """verify_ecdsa_many agrees with verify_ecdsa, serially and on an executor."""
+        key = ECKey()
+        key.generate()
+        pubkey = key.get_pubkey()
+        entries = []
+        for i in range(ECDSA_PARALLEL_THRESHOLD):
+            msg = random.randbytes(32)
+            sig = key.sign_ecdsa(msg)
+            entries.append((pubkey, random_bitflip(sig) if i % 5 == 0 else sig, msg))
+        expected = [pubkey.verify_ecdsa(sig, msg) for _, sig, msg in entries]
+        self.assertEqual(verify_ecdsa_many(entries[:3]), expected[:3])
+        self.assertEqual(verify_ecdsa_many(entries), expected)
+        with ThreadPoolExecutor(2) as executor:
+            self.assertEqual(verify_ecdsa_many(entries[:3], executor=executor), expected[:3])
+            self.assertEqual(verify_ecdsa_many(entries, executor=executor), expected)
@@ -19,12 +19,15 @@ Classes use __slots__ to ensure extraneous attributes aren't accidentally added
 by tests, compromising their intended effect.
 """
 from base64 import b32decode, b32encode
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import copy
 import hashlib
 from io import BytesIO
 import math
 import random
 import socket
+import struct
 import time
 import unittest
 
@@ -83,6 +86,16 @@ MAX_OP_RETURN_RELAY = 100_000
 
 DEFAULT_MEMPOOL_EXPIRY_HOURS = 336  # hours
 
+# Precompiled layouts of fixed-size fields, used by the deserialize_from()
+# fast path which decodes directly from a memoryview
+_UINT32 = struct.Struct("<I")
+_OUTPOINT = struct.Struct("<32sI")
+_TXOUT_VALUE = struct.Struct("<q")
+_HEADER = struct.Struct("<i32s32sIII")
+
+# Number of nonces handed to a worker at a time when solving headers with jobs > 1
+HEADER_SOLVE_BATCH_SIZE = 1 << 16
+
 TX_MIN_STANDARD_VERSION = 1
 TX_MAX_STANDARD_VERSION = 3
 
@@ -149,6 +162,117 @@ def deser_varint(f):
             return n
 
 
+def deser_compact_size_from(buf, pos):
+    """Decode a compact size from buf at pos, returning (value, new_pos)"""
+    nit = buf[pos]
+    if nit < 253:
+        return nit, pos + 1
+    size = {253: 2, 254: 4, 255: 8}[nit]
+    if pos + 1 + size > len(buf):
+        raise ValueError("unexpected end of data")
+    return int.from_bytes(buf[pos + 1:pos + 1 + size], "little"), pos + 1 + size
+
+
+def deser_string_from(buf, pos):
+    """Decode a length-prefixed string from buf at pos, returning (bytes, new_pos)"""
+    nit, pos = deser_compact_size_from(buf, pos)
+    end = pos + nit
+    if end > len(buf):
+        raise ValueError("unexpected end of data")
+    return bytes(buf[pos:end]), end
+
+
+def deser_vector_from(buf, pos, c):
+    """Decode a vector of c objects from buf at pos, returning (list, new_pos)"""
+    nit, pos = deser_compact_size_from(buf, pos)
+    r = []
+    for _ in range(nit):
+        t = c()
+        pos = t.deserialize_from(buf, pos)
+        r.append(t)
+    return r, pos
+
+
+# Inputs, outputs and witness stacks are decoded inline rather than through
+# per-element deserialize_from() calls, as they dominate the size of blocks.
+# Strings shorter than 253 bytes (nearly all scripts) skip the generic
+# compact size decoding; the explicit bounds check guards against silently
+# truncated slices.
+def _deser_txins_from(buf, pos):
+    nit, pos = deser_compact_size_from(buf, pos)
+    size = len(buf)
+    unpack_outpoint = _OUTPOINT.unpack_from
+    unpack_sequence = _UINT32.unpack_from
+    r = []
+    for _ in range(nit):
+        hash, n = unpack_outpoint(buf, pos)
+        pos += 36
+        nbytes = buf[pos]
+        if nbytes < 253:
+            end = pos + 1 + nbytes
+            if end > size:
+                raise ValueError("unexpected end of data")
+            script_sig = bytes(buf[pos + 1:end])
+        else:
+            script_sig, end = deser_string_from(buf, pos)
+        (sequence,) = unpack_sequence(buf, end)
+        pos = end + 4
+        r.append(CTxIn(COutPoint(int.from_bytes(hash, "little"), n), script_sig, sequence))
+    return r, pos
+
+
+def _deser_txouts_from(buf, pos):
+    nit, pos = deser_compact_size_from(buf, pos)
+    size = len(buf)
+    unpack_value = _TXOUT_VALUE.unpack_from
+    r = []
+    for _ in range(nit):
+        (value,) = unpack_value(buf, pos)
+        pos += 8
+        nbytes = buf[pos]
+        if nbytes < 253:
+            end = pos + 1 + nbytes
+            if end > size:
+                raise ValueError("unexpected end of data")
+            script_pubkey = bytes(buf[pos + 1:end])
+        else:
+            script_pubkey, end = deser_string_from(buf, pos)
+        pos = end
+        r.append(CTxOut(value, script_pubkey))
+    return r, pos
+
+
+def _deser_witness_stack_from(buf, pos):
+    nit, pos = deser_compact_size_from(buf, pos)
+    size = len(buf)
+    stack = []
+    for _ in range(nit):
+        nbytes = buf[pos]
+        if nbytes < 253:
+            end = pos + 1 + nbytes
+            if end > size:
+                raise ValueError("unexpected end of data")
+            stack.append(bytes(buf[pos + 1:end]))
+        else:
+            item, end = deser_string_from(buf, pos)
+            stack.append(item)
+        pos = end
+    return stack, pos
+
+
+def deserialize_message(obj, data):
+    """Deserialize the bytes-like data into obj.
+
+    Uses the deserialize_from() fast path where the class provides one and
+    falls back to deserialize() with a BytesIO stream otherwise. Returns the
+    number of bytes consumed."""
+    if hasattr(obj, "deserialize_from"):
+        return obj.deserialize_from(memoryview(data), 0)
+    f = BytesIO(data)
+    obj.deserialize(f)
+    return f.tell()
+
+
 def deser_string(f):
     nit = deser_compact_size(f)
     return f.read(nit)
@@ -158,6 +282,11 @@ def ser_string(s):
     return ser_compact_size(len(s)) + s
 
 
+def ser_string_into(buf, s):
+    buf += ser_compact_size(len(s))
+    buf += s
+
+
 def deser_uint256(f):
     return int.from_bytes(f.read(32), 'little')
 
@@ -176,6 +305,31 @@ def uint256_from_compact(c):
     return v
 
 
+def grind_header_nonce(header_prefix, target, nonce_start=0, nonce_end=1 << 32):
+    """Return the first nonce in [nonce_start, nonce_end) that makes the header
+    hash at or below target, or None if there is none.
+
+    header_prefix is the serialized header without its trailing 4-byte nonce.
+    The SHA-256 state after the first 64 bytes is computed once, and each
+    attempt only writes the nonce into a preallocated 16-byte tail."""
+    midstate = hashlib.sha256(header_prefix[:64])
+    tail = bytearray(16)
+    tail[:12] = header_prefix[64:76]
+    # A hash at or below target has at least this many zero bytes at its
+    # (little-endian) most significant end.
+    zero_suffix = bytes((256 - target.bit_length()) // 8)
+    pack_nonce = struct.Struct("<I").pack_into
+    copy_midstate = midstate.copy
+    for nonce in range(nonce_start, nonce_end):
+        pack_nonce(tail, 12, nonce)
+        inner = copy_midstate()
+        inner.update(tail)
+        digest = sha256(inner.digest())
+        if digest.endswith(zero_suffix) and int.from_bytes(digest, "little") <= target:
+            return nonce
+    return None
+
+
 # deser_function_name: Allow for an alternate deserialization function on the
 # entries in the vector.
 def deser_vector(f, c, deser_function_name=None):
@@ -195,13 +349,43 @@ def deser_vector(f, c, deser_function_name=None):
 # entries in the vector (we use this for serializing the vector of transactions
 # for a witness block).
 def ser_vector(l, ser_function_name=None):
-    r = ser_compact_size(len(l))
+    r = bytearray()
+    ser_vector_into(r, l, ser_function_name)
+    return bytes(r)
+
+
+_SERIALIZE_METHODS = ("serialize", "serialize_with_witness", "serialize_without_witness")
+_serialize_into_types: dict[type, bool] = {}
+
+
+def has_serialize_into(obj):
+    """Return whether obj.serialize_into() may be used in place of its serialize methods.
+
+    Subclasses overriding serialize() (or the witness variants of it) without
+    providing a matching serialize_into() must go through the overrides, e.g.
+    tests deliberately building malformed transactions."""
+    cls = type(obj)
+    if cls not in _serialize_into_types:
+        owner = next((c for c in cls.__mro__ if "serialize_into" in c.__dict__), None)
+        _serialize_into_types[cls] = owner is not None and all(
+            getattr(cls, name) is getattr(owner, name) for name in _SERIALIZE_METHODS if hasattr(owner, name))
+    return _serialize_into_types[cls]
+
+
+def ser_vector_into(buf, l, ser_function_name=None):
+    """Append the serialization of vector l to the bytearray buf.
+
+    Entries are written with serialize_into() where the class has it (and does
+    not override serialize()), unless an alternate serialization function is
+    requested."""
+    buf += ser_compact_size(len(l))
     for i in l:
         if ser_function_name:
-            r += getattr(i, ser_function_name)()
+            buf += getattr(i, ser_function_name)()
+        elif has_serialize_into(i):
+            i.serialize_into(buf)
         else:
-            r += i.serialize()
-    return r
+            buf += i.serialize()
 
 
 def deser_uint256_vector(f):
@@ -214,10 +398,10 @@ def deser_uint256_vector(f):
 
 
 def ser_uint256_vector(l):
-    r = ser_compact_size(len(l))
+    r = bytearray(ser_compact_size(len(l)))
     for i in l:
         r += ser_uint256(i)
-    return r
+    return bytes(r)
 
 
 def deser_string_vector(f):
@@ -230,10 +414,16 @@ def deser_string_vector(f):
 
 
 def ser_string_vector(l):
-    r = ser_compact_size(len(l))
+    r = bytearray()
+    ser_string_vector_into(r, l)
+    return bytes(r)
+
+
+def ser_string_vector_into(buf, l):
+    buf += ser_compact_size(len(l))
     for sv in l:
-        r += ser_string(sv)
-    return r
+        buf += ser_compact_size(len(sv))
+        buf += sv
 
 
 def deser_block_spent_outputs(f):
@@ -276,17 +466,39 @@ def malleate_tx_to_invalid_witness(tx):
 # like from_hex, but without the hex part
 def from_binary(cls, stream):
     """deserialize a binary stream (or bytes object) into an object"""
+    obj = cls()
+    if isinstance(stream, bytes) and hasattr(obj, "deserialize_from"):
+        assert deserialize_message(obj, stream) == len(stream)
+        return obj
     # handle bytes object by turning it into a stream
     was_bytes = isinstance(stream, bytes)
     if was_bytes:
         stream = BytesIO(stream)
-    obj = cls()
     obj.deserialize(stream)
     if was_bytes:
         assert len(stream.read()) == 0
     return obj
 
 
+def deepcopy_without_caches(obj, memo, caches):
+    """Deep copy an object with __slots__, setting the attributes named in caches to None.
+
+    Used by the classes caching their serialization, so that a copy can be
+    modified without invalidate() being called on it first."""
+    cls = type(obj)
+    copied = cls.__new__(cls)
+    memo[id(obj)] = copied
+    for c in cls.__mro__:
+        for slot in c.__dict__.get("__slots__", ()):
+            if slot in caches:
+                setattr(copied, slot, None)
+            elif hasattr(obj, slot):
+                setattr(copied, slot, copy.deepcopy(getattr(obj, slot), memo))
+    if hasattr(obj, "__dict__"):
+        copied.__dict__.update(copy.deepcopy(obj.__dict__, memo))
+    return copied
+
+
 # Objects that map to bitcoind objects, which can be serialized/deserialized
 
 
@@ -483,18 +695,26 @@ class COutPoint:
         self.hash = deser_uint256(f)
         self.n = int.from_bytes(f.read(4), "little")
 
+    def deserialize_from(self, buf, pos):
+        hash, self.n = _OUTPOINT.unpack_from(buf, pos)
+        self.hash = int.from_bytes(hash, "little")
+        return pos + _OUTPOINT.size
+
     def serialize(self):
-        r = b""
-        r += ser_uint256(self.hash)
-        r += self.n.to_bytes(4, "little")
-        return r
+        r = bytearray()
+        self.serialize_into(r)
+        return bytes(r)
+
+    def serialize_into(self, buf):
+        buf += self.hash.to_bytes(32, "little")
+        buf += self.n.to_bytes(4, "little")
 
     def __repr__(self):
         return "COutPoint(hash=%064x n=%i)" % (self.hash, self.n)
 
 
 class CTxIn:
-    __slots__ = ("nSequence", "prevout", "scriptSig")
+    __slots__ = ("_serialized", "nSequence", "prevout", "scriptSig")
 
     def __init__(self, outpoint=None, scriptSig=b"", nSequence=0):
         if outpoint is None:
@@ -503,19 +723,48 @@ class CTxIn:
             self.prevout = outpoint
         self.scriptSig = scriptSig
         self.nSequence = nSequence
+        self._serialized = None
 
     def deserialize(self, f):
+        self._serialized = None
         self.prevout = COutPoint()
         self.prevout.deserialize(f)
         self.scriptSig = deser_string(f)
         self.nSequence = int.from_bytes(f.read(4), "little")
 
+    def deserialize_from(self, buf, pos):
+        self._serialized = None
+        hash, n = _OUTPOINT.unpack_from(buf, pos)
+        self.prevout = COutPoint(int.from_bytes(hash, "little"), n)
+        self.scriptSig, pos = deser_string_from(buf, pos + _OUTPOINT.size)
+        (self.nSequence,) = _UINT32.unpack_from(buf, pos)
+        return pos + _UINT32.size
+
+    def rehash(self):
+        """Cache the serialization until invalidate() is called."""
+        self._serialized = None
+        self._serialized = self.serialize()
+
+    def invalidate(self):
+        self._serialized = None
+
+    def __deepcopy__(self, memo):
+        return deepcopy_without_caches(self, memo, ("_serialized",))
+
     def serialize(self):
-        r = b""
-        r += self.prevout.serialize()
-        r += ser_string(self.scriptSig)
-        r += self.nSequence.to_bytes(4, "little")
-        return r
+        if self._serialized is not None:
+            return self._serialized
+        r = bytearray()
+        self.serialize_into(r)
+        return bytes(r)
+
+    def serialize_into(self, buf):
+        if self._serialized is not None:
+            buf += self._serialized
+            return
+        self.prevout.serialize_into(buf)
+        ser_string_into(buf, self.scriptSig)
+        buf += self.nSequence.to_bytes(4, "little")
 
     def __repr__(self):
         return "CTxIn(prevout=%s scriptSig=%s nSequence=%i)" \
@@ -524,21 +773,48 @@ class CTxIn:
 
 
 class CTxOut:
-    __slots__ = ("nValue", "scriptPubKey")
+    __slots__ = ("_serialized", "nValue", "scriptPubKey")
 
     def __init__(self, nValue=0, scriptPubKey=b""):
         self.nValue = nValue
         self.scriptPubKey = scriptPubKey
+        self._serialized = None
 
     def deserialize(self, f):
+        self._serialized = None
         self.nValue = int.from_bytes(f.read(8), "little", signed=True)
         self.scriptPubKey = deser_string(f)
 
+    def deserialize_from(self, buf, pos):
+        self._serialized = None
+        (self.nValue,) = _TXOUT_VALUE.unpack_from(buf, pos)
+        self.scriptPubKey, pos = deser_string_from(buf, pos + _TXOUT_VALUE.size)
+        return pos
+
+    def rehash(self):
+        """Cache the serialization until invalidate() is called."""
+        self._serialized = None
+        self._serialized = self.serialize()
+
+    def invalidate(self):
+        self._serialized = None
+
+    def __deepcopy__(self, memo):
+        return deepcopy_without_caches(self, memo, ("_serialized",))
+
     def serialize(self):
-        r = b""
-        r += self.nValue.to_bytes(8, "little", signed=True)
-        r += ser_string(self.scriptPubKey)
-        return r
+        if self._serialized is not None:
+            return self._serialized
+        r = bytearray()
+        self.serialize_into(r)
+        return bytes(r)
+
+    def serialize_into(self, buf):
+        if self._serialized is not None:
+            buf += self._serialized
+            return
+        buf += self.nValue.to_bytes(8, "little", signed=True)
+        ser_string_into(buf, self.scriptPubKey)
 
     def __repr__(self):
         return "CTxOut(nValue=%i.%08i scriptPubKey=%s)" \
@@ -572,9 +848,16 @@ class CTxInWitness:
     def deserialize(self, f):
         self.scriptWitness.stack = deser_string_vector(f)
 
+    def deserialize_from(self, buf, pos):
+        self.scriptWitness.stack, pos = _deser_witness_stack_from(buf, pos)
+        return pos
+
     def serialize(self):
         return ser_string_vector(self.scriptWitness.stack)
 
+    def serialize_into(self, buf):
+        ser_string_vector_into(buf, self.scriptWitness.stack)
+
     def __repr__(self):
         return repr(self.scriptWitness)
 
@@ -593,13 +876,16 @@ class CTxWitness:
             self.vtxinwit[i].deserialize(f)
 
     def serialize(self):
-        r = b""
+        r = bytearray()
+        self.serialize_into(r)
+        return bytes(r)
+
+    def serialize_into(self, buf):
         # This is different than the usual vector serialization --
         # we omit the length of the vector, which is required to be
         # the same length as the transaction's vin vector.
         for x in self.vtxinwit:
-            r += x.serialize()
-        return r
+            x.serialize_into(buf)
 
     def __repr__(self):
         return "CTxWitness(%s)" % \
@@ -613,9 +899,10 @@ class CTxWitness:
 
 
 class CTransaction:
-    __slots__ = ("nLockTime", "version", "vin", "vout", "wit")
+    __slots__ = ("_cache", "nLockTime", "version", "vin", "vout", "wit")
 
     def __init__(self, tx=None):
+        self._cache = None
         if tx is None:
             self.version = 2
             self.vin = []
@@ -630,6 +917,7 @@ class CTransaction:
             self.wit = copy.deepcopy(tx.wit)
 
     def deserialize(self, f):
+        self._cache = None
         self.version = int.from_bytes(f.read(4), "little")
         self.vin = deser_vector(f, CTxIn)
         flags = 0
@@ -649,61 +937,149 @@ class CTransaction:
             self.wit = CTxWitness()
         self.nLockTime = int.from_bytes(f.read(4), "little")
 
-    def serialize_without_witness(self):
-        r = b""
-        r += self.version.to_bytes(4, "little")
-        r += ser_vector(self.vin)
-        r += ser_vector(self.vout)
-        r += self.nLockTime.to_bytes(4, "little")
-        return r
-
-    # Only serialize with witness when explicitly called for
-    def serialize_with_witness(self):
+    def deserialize_from(self, buf, pos):
+        """Deserialize from a memoryview at pos, mirroring deserialize(), and
+        return the position after the transaction."""
+        self._cache = None
+        (self.version,) = _UINT32.unpack_from(buf, pos)
+        self.vin, pos = _deser_txins_from(buf, pos + _UINT32.size)
+        flags = 0
+        if len(self.vin) == 0:
+            flags = buf[pos]
+            pos += 1
+            if (flags != 0):
+                self.vin, pos = _deser_txins_from(buf, pos)
+                self.vout, pos = _deser_txouts_from(buf, pos)
+        else:
+            self.vout, pos = _deser_txouts_from(buf, pos)
+        if flags != 0:
+            self.wit.vtxinwit = [CTxInWitness() for _ in range(len(self.vin))]
+            for inwit in self.wit.vtxinwit:
+                inwit.scriptWitness.stack, pos = _deser_witness_stack_from(buf, pos)
+        else:
+            self.wit = CTxWitness()
+        (self.nLockTime,) = _UINT32.unpack_from(buf, pos)
+        return pos + _UINT32.size
+
+    def rehash(self):
+        """Compute and cache the serializations, txid and wtxid.
+
+        Until invalidate() (or rehash()) is called again, serialization, the
+        hash properties and get_weight()/get_vsize() return the cached values,
+        so the transaction must not be modified in between. Inputs and outputs
+        are cached separately, see CTxIn.rehash() and CTxOut.rehash()."""
+        self._cache = None
+        without_witness, with_witness = self._serialize_both()
+        txid = hash256(without_witness)
+        wtxid = txid if with_witness == without_witness else hash256(with_witness)
+        self._cache = (without_witness, with_witness, txid, wtxid)
+
+    def invalidate(self):
+        """Drop the values cached by rehash()."""
+        self._cache = None
+
+    def __deepcopy__(self, memo):
+        return deepcopy_without_caches(self, memo, ("_cache",))
+
+    def _fill_witness(self):
+        if (len(self.wit.vtxinwit) != len(self.vin)):
+            # vtxinwit must have the same length as vin
+            self.wit.vtxinwit = self.wit.vtxinwit[:len(self.vin)]
+            for _ in range(len(self.wit.vtxinwit), len(self.vin)):
+                self.wit.vtxinwit.append(CTxInWitness())
+
+    def _serialize_body(self):
+        """Serialize the parts shared by both serializations in one pass.
+
+        Returns the serialized vin and vout vectors, and the witness data, or
+        None if the witness is null (and hence not serialized)."""
+        body = bytearray()
+        ser_vector_into(body, self.vin)
+        ser_vector_into(body, self.vout)
+        if self.wit.is_null():
+            return body, None
+        self._fill_witness()
+        return body, self.wit.serialize()
+
+    def _serialize_both(self):
+        """Return (serialization without witness, serialization with witness)"""
+        if not has_serialize_into(self):
+            return self.serialize_without_witness(), self.serialize_with_witness()
+        body, witness = self._serialize_body()
+        version = self.version.to_bytes(4, "little")
+        lock_time = self.nLockTime.to_bytes(4, "little")
+        without_witness = version + body + lock_time
+        if witness is None:
+            return without_witness, without_witness
+        return without_witness, version + b"\x00\x01" + body + witness + lock_time
+
+    def serialize_into(self, buf, with_witness=True):
+        if self._cache is not None:
+            buf += self._cache[1 if with_witness else 0]
+            return
         flags = 0
-        if not self.wit.is_null():
+        if with_witness and not self.wit.is_null():
             flags |= 1
-        r = b""
-        r += self.version.to_bytes(4, "little")
+        buf += self.version.to_bytes(4, "little")
         if flags:
-            dummy = []
-            r += ser_vector(dummy)
-            r += flags.to_bytes(1, "little")
-        r += ser_vector(self.vin)
-        r += ser_vector(self.vout)
+            buf += b"\x00"  # dummy empty vin vector
+            buf += flags.to_bytes(1, "little")
+        ser_vector_into(buf, self.vin)
+        ser_vector_into(buf, self.vout)
         if flags & 1:
-            if (len(self.wit.vtxinwit) != len(self.vin)):
-                # vtxinwit must have the same length as vin
-                self.wit.vtxinwit = self.wit.vtxinwit[:len(self.vin)]
-                for _ in range(len(self.wit.vtxinwit), len(self.vin)):
-                    self.wit.vtxinwit.append(CTxInWitness())
-            r += self.wit.serialize()
-        r += self.nLockTime.to_bytes(4, "little")
-        return r
+            self._fill_witness()
+            self.wit.serialize_into(buf)
+        buf += self.nLockTime.to_bytes(4, "little")
+
+    def serialize_without_witness(self):
+        if self._cache is not None:
+            return self._cache[0]
+        r = bytearray()
+        self.serialize_into(r, with_witness=False)
+        return bytes(r)
+
+    # Only serialize with witness when explicitly called for
+    def serialize_with_witness(self):
+        if self._cache is not None:
+            return self._cache[1]
+        r = bytearray()
+        self.serialize_into(r)
+        return bytes(r)
 
     # Regular serialization is with witness -- must explicitly
     # call serialize_without_witness to exclude witness data.
     def serialize(self):
         return self.serialize_with_witness()
 
+    def _wtxid(self):
+        if self._cache is not None:
+            return self._cache[3]
+        return hash256(self.serialize_with_witness())
+
+    def _txid(self):
+        if self._cache is not None:
+            return self._cache[2]
+        return hash256(self.serialize_without_witness())
+
     @property
     def wtxid_hex(self):
         """Return wtxid (transaction hash with witness) as hex string."""
-        return hash256(self.serialize())[::-1].hex()
+        return self._wtxid()[::-1].hex()
 
     @property
     def wtxid_int(self):
         """Return wtxid (transaction hash with witness) as integer."""
-        return uint256_from_str(hash256(self.serialize_with_witness()))
+        return uint256_from_str(self._wtxid())
 
     @property
     def txid_hex(self):
         """Return txid (transaction hash without witness) as hex string."""
-        return hash256(self.serialize_without_witness())[::-1].hex()
+        return self._txid()[::-1].hex()
 
     @property
     def txid_int(self):
         """Return txid (transaction hash without witness) as integer."""
-        return uint256_from_str(hash256(self.serialize_without_witness()))
+        return uint256_from_str(self._txid())
 
     def is_valid(self):
         for tout in self.vout:
@@ -714,8 +1090,19 @@ class CTransaction:
     # Calculate the transaction weight using witness and non-witness
     # serialization size (does NOT use sigops).
     def get_weight(self):
-        with_witness_size = len(self.serialize_with_witness())
-        without_witness_size = len(self.serialize_without_witness())
+        if self._cache is not None:
+            with_witness_size = len(self._cache[1])
+            without_witness_size = len(self._cache[0])
+        elif not has_serialize_into(self):
+            with_witness_size = len(self.serialize_with_witness())
+            without_witness_size = len(self.serialize_without_witness())
+        else:
+            # Only the sizes are needed, so skip assembling the serializations
+            body, witness = self._serialize_body()
+            without_witness_size = 8 + len(body)
+            with_witness_size = without_witness_size
+            if witness is not None:
+                with_witness_size += 2 + len(witness)
         return (WITNESS_SCALE_FACTOR - 1) * without_witness_size + with_witness_size
 
     def get_vsize(self):
@@ -757,18 +1144,22 @@ class CBlockHeader:
         self.nBits = int.from_bytes(f.read(4), "little")
         self.nNonce = int.from_bytes(f.read(4), "little")
 
+    def deserialize_from(self, buf, pos):
+        (self.nVersion, prev_block, merkle_root,
+         self.nTime, self.nBits, self.nNonce) = _HEADER.unpack_from(buf, pos)
+        self.hashPrevBlock = int.from_bytes(prev_block, "little")
+        self.hashMerkleRoot = int.from_bytes(merkle_root, "little")
+        return pos + _HEADER.size
+
     def serialize(self):
         return self._serialize_header()
 
+    def serialize_into(self, buf):
+        buf += self._serialize_header()
+
     def _serialize_header(self):
-        r = b""
-        r += self.nVersion.to_bytes(4, "little", signed=True)
-        r += ser_uint256(self.hashPrevBlock)
-        r += ser_uint256(self.hashMerkleRoot)
-        r += self.nTime.to_bytes(4, "little")
-        r += self.nBits.to_bytes(4, "little")
-        r += self.nNonce.to_bytes(4, "little")
-        return r
+        return _HEADER.pack(self.nVersion, ser_uint256(self.hashPrevBlock), ser_uint256(self.hashMerkleRoot),
+                            self.nTime, self.nBits, self.nNonce)
 
     @property
     def hash_hex(self):
@@ -780,6 +1171,42 @@ class CBlockHeader:
         """Return block header hash as integer."""
         return uint256_from_str(hash256(self._serialize_header()))
 
+    def solve(self, *, jobs=1):
+        """Increment nNonce until the header hash meets the nBits target.
+
+        Easy (regtest) targets are met after a couple of attempts, so they are
+        checked by rehashing the header directly. Otherwise the nonce is ground
+        with grind_header_nonce(), spread over `jobs` processes in batches of
+        HEADER_SOLVE_BATCH_SIZE nonces. The lowest valid nonce is always the
+        one picked, so the result does not depend on `jobs`."""
+        target = uint256_from_compact(self.nBits)
+        if target >> 252:
+            while self.hash_int > target:
+                self.nNonce += 1
+            return
+        prefix = self._serialize_header()[:76]
+        if jobs <= 1:
+            nonce = grind_header_nonce(prefix, target, self.nNonce)
+        else:
+            nonce = None
+            with ProcessPoolExecutor(jobs) as executor:
+                batches = deque()
+                for start in range(self.nNonce, 1 << 32, HEADER_SOLVE_BATCH_SIZE):
+                    end = min(start + HEADER_SOLVE_BATCH_SIZE, 1 << 32)
+                    batches.append(executor.submit(grind_header_nonce, prefix, target, start, end))
+                    if len(batches) < 2 * jobs:
+                        continue
+                    # Consume results in submission order so the lowest nonce wins
+                    nonce = batches.popleft().result()
+                    if nonce is not None:
+                        break
+                while nonce is None and batches:
+                    nonce = batches.popleft().result()
+                for batch in batches:
+                    batch.cancel()
+        assert nonce is not None, "nonce space exhausted without meeting the target"
+        self.nNonce = nonce
+
     def __repr__(self):
         return "CBlockHeader(nVersion=%i hashPrevBlock=%064x hashMerkleRoot=%064x nTime=%s nBits=%08x nNonce=%08x)" \
             % (self.nVersion, self.hashPrevBlock, self.hashMerkleRoot,
@@ -789,43 +1216,78 @@ BLOCK_HEADER_SIZE = len(CBlockHeader().serialize())
 assert_equal(BLOCK_HEADER_SIZE, 80)
 
 class CBlock(CBlockHeader):
-    __slots__ = ("vtx",)
+    __slots__ = ("_merkle_trees", "_vtx_cache", "vtx")
 
     def __init__(self, header=None):
         super().__init__(header)
         self.vtx = []
+        self._vtx_cache = None
+        # Trees last used by calc_merkle_root() and calc_witness_merkle_root()
+        self._merkle_trees = [None, None]
 
     def deserialize(self, f):
+        self._vtx_cache = None
         super().deserialize(f)
         self.vtx = deser_vector(f, CTransaction)
 
+    def deserialize_from(self, buf, pos):
+        self._vtx_cache = None
+        pos = super().deserialize_from(buf, pos)
+        self.vtx, pos = deser_vector_from(buf, pos, CTransaction)
+        return pos
+
+    def rehash(self):
+        """Rehash every transaction and cache the serialized transaction vector.
+
+        The header is not cached, so it can still be modified (e.g. by solve()),
+        but vtx and its transactions must not change until invalidate() is
+        called."""
+        self._vtx_cache = None
+        for tx in self.vtx:
+            tx.rehash()
+        self._vtx_cache = (ser_vector(self.vtx, "serialize_without_witness"),
+                           ser_vector(self.vtx, "serialize_with_witness"))
+
+    def invalidate(self):
+        """Drop the values cached by rehash(), including those of the transactions."""
+        self._vtx_cache = None
+        for tx in self.vtx:
+            tx.invalidate()
+
+    def __deepcopy__(self, memo):
+        block = deepcopy_without_caches(self, memo, ("_merkle_trees", "_vtx_cache"))
+        block._merkle_trees = [None, None]
+        return block
+
     def serialize(self, with_witness=True):
-        r = b""
-        r += super().serialize()
-        if with_witness:
-            r += ser_vector(self.vtx, "serialize_with_witness")
-        else:
-            r += ser_vector(self.vtx, "serialize_without_witness")
-        return r
+        r = bytearray()
+        self.serialize_into(r, with_witness)
+        return bytes(r)
+
+    def serialize_into(self, buf, with_witness=True):
+        super().serialize_into(buf)
+        if self._vtx_cache is not None:
+            buf += self._vtx_cache[with_witness]
+            return
+        buf += ser_compact_size(len(self.vtx))
+        for tx in self.vtx:
+            if has_serialize_into(tx):
+                tx.serialize_into(buf, with_witness)
+            elif with_witness:
+                buf += tx.serialize_with_witness()
+            else:
+                buf += tx.serialize_without_witness()
 
     # Calculate the merkle root given a vector of transaction hashes
     @classmethod
     def get_merkle_root(cls, hashes):
-        while len(hashes) > 1:
-            newhashes = []
-            for i in range(0, len(hashes), 2):
-                i2 = min(i+1, len(hashes)-1)
-                newhashes.append(hash256(hashes[i] + hashes[i2]))
-            hashes = newhashes
-        return uint256_from_str(hashes[0])
+        assert hashes
+        return MerkleTree(hashes).get_root()
 
-    def calc_merkle_root(self):
-        hashes = []
-        for tx in self.vtx:
-            hashes.append(ser_uint256(tx.txid_int))
-        return self.get_merkle_root(hashes)
+    def _merkle_leaves(self):
+        return [ser_uint256(tx.txid_int) for tx in self.vtx]
 
-    def calc_witness_merkle_root(self):
+    def _witness_merkle_leaves(self):
         # For witness root purposes, the hash of the
         # coinbase, with witness, is defined to be 0...0
         hashes = [ser_uint256(0)]
@@ -834,7 +1296,32 @@ class CBlock(CBlockHeader):
             # Calculate the hashes with witness data
             hashes.append(ser_uint256(tx.wtxid_int))
 
-        return self.get_merkle_root(hashes)
+        return hashes
+
+    def get_merkle_tree(self):
+        """Return a MerkleTree over the txids, which can be kept up to date
+        as transactions are appended or replaced."""
+        return MerkleTree(self._merkle_leaves())
+
+    def get_witness_merkle_tree(self):
+        return MerkleTree(self._witness_merkle_leaves())
+
+    def _calc_root(self, witness, leaves):
+        # The tree of the previous call is kept, so that e.g. adding transactions
+        # or changing the coinbase (see blocktools.add_witness_commitment) between
+        # calls only rehashes the paths of the changed leaves.
+        tree = self._merkle_trees[witness]
+        if tree is None:
+            tree = self._merkle_trees[witness] = MerkleTree(leaves)
+        else:
+            tree.update(leaves)
+        return tree.get_root()
+
+    def calc_merkle_root(self):
+        return self._calc_root(False, self._merkle_leaves())
+
+    def calc_witness_merkle_root(self):
+        return self._calc_root(True, self._witness_merkle_leaves())
 
     def is_valid(self):
         target = uint256_from_compact(self.nBits)
@@ -847,17 +1334,12 @@ class CBlock(CBlockHeader):
             return False
         return True
 
-    def solve(self):
-        target = uint256_from_compact(self.nBits)
-        while self.hash_int > target:
-            self.nNonce += 1
-
     # Calculate the block weight using witness and non-witness
     # serialization size (does NOT use sigops).
     def get_weight(self):
-        with_witness_size = len(self.serialize(with_witness=True))
-        without_witness_size = len(self.serialize(with_witness=False))
-        return (WITNESS_SCALE_FACTOR - 1) * without_witness_size + with_witness_size
+        # The header and transaction count are part of both serializations
+        header_size = BLOCK_HEADER_SIZE + len(ser_compact_size(len(self.vtx)))
+        return WITNESS_SCALE_FACTOR * header_size + sum(tx.get_weight() for tx in self.vtx)
 
     def __repr__(self):
         return "CBlock(nVersion=%i hashPrevBlock=%064x hashMerkleRoot=%064x nTime=%s nBits=%08x nNonce=%08x vtx=%s)" \
@@ -865,6 +1347,111 @@ class CBlock(CBlockHeader):
                time.ctime(self.nTime), self.nBits, self.nNonce, repr(self.vtx))
 
 
+class MerkleTree:
+    """Merkle tree over 32-byte hashes with all levels cached.
+
+    Appending or replacing a leaf only rehashes the nodes on its path to the
+    root, so building a block's tree one transaction at a time is O(n log n)
+    rather than O(n^2). As in bitcoind, the last node of a level with an odd
+    number of nodes is paired with itself."""
+    __slots__ = ("levels",)
+
+    def __init__(self, hashes=None):
+        # levels[0] holds the leaves, levels[-1] the root (if not empty)
+        self.levels = [list(hashes or [])]
+        while len(self.levels[-1]) > 1:
+            level = self.levels[-1]
+            self.levels.append([hash256(level[i] + level[min(i + 1, len(level) - 1)])
+                                for i in range(0, len(level), 2)])
+
+    def __len__(self):
+        return len(self.levels[0])
+
+    def _update_path(self, index):
+        height = 0
+        while len(self.levels[height]) > 1:
+            level = self.levels[height]
+            if height + 1 == len(self.levels):
+                self.levels.append([])
+            left = index & ~1
+            parent = hash256(level[left] + level[min(left + 1, len(level) - 1)])
+            index >>= 1
+            height += 1
+            if index == len(self.levels[height]):
+                self.levels[height].append(parent)
+            else:
+                self.levels[height][index] = parent
+
+    def append(self, leaf):
+        self.levels[0].append(leaf)
+        self._update_path(len(self.levels[0]) - 1)
+
+    def replace(self, index, leaf):
+        self.levels[0][index] = leaf
+        self._update_path(index)
+
+    def update(self, leaves):
+        """Set the leaves to `leaves`, rehashing only the paths of the leaves that
+        were changed or appended. The tree is rebuilt if it shrinks or if most
+        leaves changed."""
+        old = self.levels[0]
+        if len(leaves) < len(old):
+            self.__init__(leaves)
+            return
+        changed = [i for i in range(len(old)) if old[i] != leaves[i]]
+        if (len(changed) + len(leaves) - len(old)) * len(self.levels) > len(leaves):
+            self.__init__(leaves)
+            return
+        for i in changed:
+            self.replace(i, leaves[i])
+        for leaf in leaves[len(old):]:
+            self.append(leaf)
+
+    def get_root(self):
+        """Return the root as an integer (0 for an empty tree)."""
+        if not self.levels[0]:
+            return 0
+        return uint256_from_str(self.levels[-1][0])
+
+    def get_branch(self, index):
+        """Return the sibling hashes from leaf `index` up to the root."""
+        branch = []
+        for level in self.levels[:-1]:
+            branch.append(level[min(index ^ 1, len(level) - 1)])
+            index >>= 1
+        return branch
+
+    @staticmethod
+    def compute_root_from_branch(leaf, branch, index):
+        """Return the root (as an integer) implied by a leaf and its branch."""
+        for sibling in branch:
+            leaf = hash256(sibling + leaf if index & 1 else leaf + sibling)
+            index >>= 1
+        return uint256_from_str(leaf)
+
+    def get_partial_merkle_tree(self, matches):
+        """Build the BIP37 CPartialMerkleTree for the leaves flagged in matches."""
+        assert_equal(len(matches), len(self))
+        pmt = CPartialMerkleTree()
+        pmt.nTransactions = len(self)
+
+        def traverse_and_build(height, pos):
+            parent_of_match = any(matches[pos << height:(pos + 1) << height])
+            pmt.vBits.append(parent_of_match)
+            if height == 0 or not parent_of_match:
+                pmt.vHash.append(uint256_from_str(self.levels[height][pos]))
+            else:
+                traverse_and_build(height - 1, pos * 2)
+                if pos * 2 + 1 < len(self.levels[height - 1]):
+                    traverse_and_build(height - 1, pos * 2 + 1)
+
+        traverse_and_build(len(self.levels) - 1, 0)
+        return pmt
+
+    def __repr__(self):
+        return "MerkleTree(leaves=%d root=%064x)" % (len(self), self.get_root())
+
+
 class PrefilledTransaction:
     __slots__ = ("index", "tx")
 
@@ -1333,6 +1920,9 @@ class msg_tx:
     def deserialize(self, f):
         self.tx.deserialize(f)
 
+    def deserialize_from(self, buf, pos):
+        return self.tx.deserialize_from(buf, pos)
+
     def serialize(self):
         return self.tx.serialize_with_witness()
 
@@ -1376,6 +1966,9 @@ class msg_block:
     def deserialize(self, f):
         self.block.deserialize(f)
 
+    def deserialize_from(self, buf, pos):
+        return self.block.deserialize_from(buf, pos)
+
     def serialize(self):
         return self.block.serialize()
 
@@ -1554,6 +2147,12 @@ class msg_headers:
         for x in blocks:
             self.headers.append(CBlockHeader(x))
 
+    def deserialize_from(self, buf, pos):
+        blocks, pos = deser_vector_from(buf, pos, CBlock)
+        for x in blocks:
+            self.headers.append(CBlockHeader(x))
+        return pos
+
     def serialize(self):
         blocks = [CBlock(x) for x in self.headers]
         return ser_vector(blocks)
@@ -1958,3 +2557,218 @@ class TestFrameworkScript(unittest.TestCase):
         check_varint(0x80123456, "86ffc7e756")
         check_varint(0xffffffff, "8efefefe7f")
         check_varint(0xffffffffffffffff, "80fefefefefefefefe7f")
+
+    def test_header_solve(self):
+        def naive_solve(header):
+            target = uint256_from_compact(header.nBits)
+            while header.hash_int > target:
+                header.nNonce += 1
+
+        for nbits in (0x207fffff, 0x1f0fffff):
+            header = CBlockHeader()
+            header.hashPrevBlock = 0x1234
+            header.hashMerkleRoot = 0x5678
+            header.nTime = 1296688602
+            header.nBits = nbits
+            header.nNonce = 7
+            expected = CBlockHeader(header)
+            naive_solve(expected)
+            for jobs in (1, 2):
+                solved = CBlockHeader(header)
+                solved.solve(jobs=jobs)
+                self.assertEqual(solved.nNonce, expected.nNonce)
+                self.assertLessEqual(solved.hash_int, uint256_from_compact(nbits))
+
+    def test_cached_hashes(self):
+        tx = CTransaction()
+        tx.vin = [CTxIn(COutPoint(0x1234, 1), b"\x51", 0xfffffffd)]
+        tx.vout = [CTxOut(1000, b"\x6a")]
+        tx.wit.vtxinwit = [CTxInWitness()]
+        tx.wit.vtxinwit[0].scriptWitness.stack = [b"\x01"]
+        txid, wtxid, weight = tx.txid_hex, tx.wtxid_hex, tx.get_weight()
+        self.assertNotEqual(txid, wtxid)
+
+        tx.rehash()
+        self.assertEqual((tx.txid_hex, tx.wtxid_hex, tx.get_weight()), (txid, wtxid, weight))
+        # Cached values are only refreshed on explicit invalidation
+        tx.vout[0].nValue = 2000
+        self.assertEqual(tx.txid_hex, txid)
+        tx.invalidate()
+        self.assertNotEqual(tx.txid_hex, txid)
+        self.assertEqual(tx.txid_hex, CTransaction(tx).txid_hex)
+
+        # Copies drop the cached values, so they can be modified right away
+        tx.rehash()
+        for tx_in in tx.vin:
+            tx_in.rehash()
+        for tx_out in tx.vout:
+            tx_out.rehash()
+        for copied in (CTransaction(tx), copy.deepcopy(tx)):
+            self.assertEqual(copied.txid_hex, tx.txid_hex)
+            copied.vin[0].scriptSig = b"\x52\x52"
+            copied.vout[0].nValue = 3000
+            self.assertEqual(copied.vin[0].serialize()[36:39], b"\x02\x52\x52")
+            self.assertEqual(copied.vout[0].serialize()[:8], (3000).to_bytes(8, "little"))
+            self.assertNotEqual(copied.txid_hex, tx.txid_hex)
+        copied = copy.deepcopy(tx)
+        copied.nLockTime = 1
+        self.assertNotEqual(copied.txid_hex, tx.txid_hex)
+        self.assertEqual(tx.vin[0].scriptSig, b"\x51")
+
+        block = CBlock()
+        block.nBits = 0x207fffff
+        block.vtx = [tx]
+        block.hashMerkleRoot = block.calc_merkle_root()
+        serialized = block.serialize()
+        block.rehash()
+        block.solve()
+        self.assertEqual(block.serialize()[80:], serialized[80:])
+        self.assertEqual(block.serialize(with_witness=False)[80:], ser_vector([CTransaction(tx)], "serialize_without_witness"))
+        self.assertTrue(block.is_valid())
+        copied = copy.deepcopy(block)
+        copied.vtx[0].nLockTime += 1
+        self.assertNotEqual(copied.serialize(), block.serialize())
+        self.assertNotEqual(copied.calc_merkle_root(), block.hashMerkleRoot)
+        self.assertEqual(block.calc_merkle_root(), block.hashMerkleRoot)
+
+    def test_deserialize_from(self):
+        block = CBlock()
+        block.nVersion = -1
+        block.hashPrevBlock = 0x1234
+        block.nBits = 0x207fffff
+        for i in range(3):
+            tx = CTransaction()
+            tx.vin = [CTxIn(COutPoint(i, j), bytes(j), j) for j in range(i + 1)]
+            tx.vout = [CTxOut(-1 if i == 2 else i * COIN, bytes(300))]
+            if i:
+                tx.wit.vtxinwit = [CTxInWitness() for _ in tx.vin]
+                tx.wit.vtxinwit[0].scriptWitness.stack = [b"", bytes(253)]
+            block.vtx.append(tx)
+        block.hashMerkleRoot = block.calc_merkle_root()
+
+        for with_witness in (True, False):
+            data = block.serialize(with_witness=with_witness)
+            fast = from_binary(CBlock, data)
+            slow = CBlock()
+            slow.deserialize(BytesIO(data))
+            self.assertEqual(repr(fast), repr(slow))
+            self.assertEqual(fast.serialize(with_witness=with_witness), data)
+            self.assertEqual(fast.hash_hex, block.hash_hex)
+            self.assertRaises(Exception, deserialize_message, CBlock(), data[:-5])
+
+        headers = msg_headers([CBlockHeader(block)] * 2)
+        parsed = msg_headers()
+        self.assertEqual(deserialize_message(parsed, headers.serialize()), len(headers.serialize()))
+        self.assertEqual(repr(parsed), repr(headers))
+
+    def test_serialize_into(self):
+        tx = CTransaction()
+        tx.vin = [CTxIn(COutPoint(1, 2), b"\x51" * 300), CTxIn()]
+        tx.vout = [CTxOut(5, b"\x6a")]
+        for with_witness_data in (False, True):
+            if with_witness_data:
+                tx.wit.vtxinwit = [CTxInWitness()]
+                tx.wit.vtxinwit[0].scriptWitness.stack = [b"\x01" * 80]
+            without_witness = tx.serialize_without_witness()
+            with_witness = tx.serialize_with_witness()
+            self.assertEqual(with_witness == without_witness, not with_witness_data)
+            self.assertEqual(tx.get_weight(), 3 * len(without_witness) + len(with_witness))
+            buf = bytearray(b"prefix")
+            tx.serialize_into(buf, with_witness=False)
+            self.assertEqual(bytes(buf), b"prefix" + without_witness)
+
+            block = CBlock()
+            block.vtx = [tx, CTransaction(tx)]
+            self.assertEqual(block.get_weight(), 3 * len(block.serialize(with_witness=False)) + len(block.serialize()))
+            self.assertEqual(block.serialize()[BLOCK_HEADER_SIZE + 1:], 2 * with_witness)
+        # the witness is padded to the number of inputs when serialized
+        self.assertEqual(len(tx.wit.vtxinwit), 2)
+
+        # overridden serialization (e.g. of deliberately malformed transactions) is respected
+        class ExtraWitnessTransaction(CTransaction):
+            def serialize_with_witness(self):
+                r = bytearray()
+                r += self.version.to_bytes(4, "little", signed=True)
+                r += ser_compact_size(0) + b"\x01"
+                ser_vector_into(r, self.vin)
+                ser_vector_into(r, self.vout)
+                self.wit.serialize_into(r)
+                r += self.nLockTime.to_bytes(4, "little")
+                return bytes(r)
+
+        broken = ExtraWitnessTransaction(tx)
+        broken.wit.vtxinwit.append(CTxInWitness())
+        self.assertFalse(has_serialize_into(broken))
+        self.assertTrue(has_serialize_into(tx))
+        expected = broken.serialize_with_witness()
+        block = CBlock()
+        block.vtx = [broken]
+        self.assertEqual(block.serialize()[BLOCK_HEADER_SIZE + 1:], expected)
+        self.assertEqual(ser_vector([broken]), ser_compact_size(1) + expected)
+        self.assertEqual(broken.get_weight(), 3 * len(broken.serialize_without_witness()) + len(expected))
+        block.rehash()
+        self.assertEqual(block.serialize()[BLOCK_HEADER_SIZE + 1:], expected)
+        self.assertEqual(broken.wtxid_int, uint256_from_str(hash256(expected)))
+        self.assertEqual(len(broken.wit.vtxinwit), 3)
+
+    def test_merkle_tree(self):
+        def naive_root(hashes):
+            while len(hashes) > 1:
+                hashes = [hash256(hashes[i] + hashes[min(i + 1, len(hashes) - 1)]) for i in range(0, len(hashes), 2)]
+            return uint256_from_str(hashes[0])
+
+        leaves = [sha256(bytes([i])) for i in range(40)]
+        tree = MerkleTree()
+        self.assertEqual(tree.get_root(), 0)
+        for n in range(1, len(leaves) + 1):
+            tree.append(leaves[n - 1])
+            self.assertEqual(tree.get_root(), naive_root(leaves[:n]))
+            self.assertEqual(MerkleTree(leaves[:n]).levels, tree.levels)
+        tree.replace(17, sha256(b"replaced"))
+        self.assertEqual(tree.get_root(), naive_root(leaves[:17] + [sha256(b"replaced")] + leaves[18:]))
+        updated = leaves[:17] + [sha256(b"replaced")] + leaves[18:]
+        for new_leaves in (updated + [sha256(b"appended")] * 3, [sha256(b"first")] + updated[1:], updated[:20], leaves):
+            tree.update(new_leaves)
+            self.assertEqual(tree.levels, MerkleTree(new_leaves).levels)
+        for i in (0, 17, 39):
+            branch = tree.get_branch(i)
+            self.assertEqual(MerkleTree.compute_root_from_branch(tree.levels[0][i], branch, i), tree.get_root())
+
+        # Walk the partial merkle tree as bitcoind's CPartialMerkleTree::ExtractMatches does
+        def extract_root(pmt, height, pos, state):
+            parent_of_match = pmt.vBits[state["bits"]]
+            state["bits"] += 1
+            if height == 0 or not parent_of_match:
+                h = ser_uint256(pmt.vHash[state["hashes"]])
+                state["hashes"] += 1
+                if height == 0 and parent_of_match:
+                    state["matched"].append(pos)
+                return h
+            left = extract_root(pmt, height - 1, pos * 2, state)
+            right = left
+            if pos * 2 + 1 < (pmt.nTransactions + (1 << (height - 1)) - 1) >> (height - 1):
+                right = extract_root(pmt, height - 1, pos * 2 + 1, state)
+            return hash256(left + right)
+
+        matches = [i in (3, 4, 30) for i in range(len(tree))]
+        pmt = tree.get_partial_merkle_tree(matches)
+        state = {"bits": 0, "hashes": 0, "matched": []}
+        self.assertEqual(uint256_from_str(extract_root(pmt, len(tree.levels) - 1, 0, state)), tree.get_root())
+        self.assertEqual(state["matched"], [3, 4, 30])
+        self.assertEqual(state["hashes"], len(pmt.vHash))
+
+        # CBlock keeps its trees between calls, and must follow any change to vtx
+        block = CBlock()
+        for i in range(12):
+            tx = CTransaction()
+            tx.vin = [CTxIn(COutPoint(i, 0))]
+            tx.wit.vtxinwit = [CTxInWitness()]
+            tx.wit.vtxinwit[0].scriptWitness.stack = [bytes([i])]
+            block.vtx.append(tx)
+            self.assertEqual(block.calc_merkle_root(), naive_root(block._merkle_leaves()))
+            self.assertEqual(block.calc_witness_merkle_root(), naive_root(block._witness_merkle_leaves()))
+        block.vtx[0].vout.append(CTxOut(0, b"\x6a"))
+        self.assertEqual(block.calc_merkle_root(), block.get_merkle_tree().get_root())
+        del block.vtx[5:]
+        self.assertEqual(block.calc_merkle_root(), block.get_merkle_tree().get_root())
+        self.assertEqual(block.calc_witness_merkle_root(), block.get_witness_merkle_tree().get_root())
@@ -11,7 +11,9 @@ node's p2p interface. They can be used to send messages to the node, and
 callbacks can be registered that execute when messages are received from the
 node. Messages are sent to/received from the node on an asyncio event loop.
 State held inside the objects must be guarded by the p2p_lock to avoid data
-races between the main testing thread and the event loop.
+races between the main testing thread and the event loop. Messages are
+delivered holding p2p_lock in shared mode only, so the test logic excludes
+delivery to every connection while connections don't exclude each other.
 
 P2PConnection: A low-level connection object to a node's P2P interface
 P2PInterface: A high-level interface object for communicating to a node over P2P
@@ -22,15 +24,26 @@ P2PTxInvStore: A p2p interface class that inherits from P2PDataStore, and keeps
 
 import asyncio
 from collections import defaultdict
+from contextlib import contextmanager
 from io import BytesIO
+import itertools
 import logging
 import platform
+import random
 import struct
 import sys
 import threading
+import time
+import unittest
 
 from test_framework.messages import (
     CBlockHeader,
+    CInv,
+    COutPoint,
+    CTransaction,
+    CTxIn,
+    CTxOut,
+    deserialize_message,
     MAX_HEADERS_RESULTS,
     msg_addr,
     msg_addrv2,
@@ -110,6 +123,10 @@ OVERLOADED_PEER_TX_DELAY = 2
 # How long to wait before downloading a transaction from an additional peer
 GETDATA_TX_INTERVAL = 60
 
+# Size of a v1 P2P message header: magic, msgtype, length and checksum
+MSG_HEADER_SIZE = 4 + 12 + 4 + 4
+_MSG_HEADER_FIELDS = struct.Struct("<12si4s")
+
 MESSAGEMAP = {
     b"addr": msg_addr,
     b"addrv2": msg_addrv2,
@@ -166,11 +183,22 @@ class P2PConnection(asyncio.Protocol):
         # The underlying transport of the connection.
         # Should only call methods on this from the NetworkThread, c.f. call_soon_threadsafe
         self._transport = None
+        # The NetworkThread event loop serving this connection
+        self._loop = None
         # This lock is acquired before sending messages over the socket. There's an implied lock order and
         # p2p_lock must not be acquired after _send_lock as it could result in deadlocks.
         self._send_lock = threading.Lock()
         self.v2_state = None  # EncryptedP2PState object needed for v2 p2p connections
         self.reconnect = False  # set if reconnection needs to happen
+        # Counts messages delivered and connection state changes, so that
+        # wait_until() can sleep until something happened on this connection.
+        self._event_cond = threading.Condition()
+        self._event_count = 0
+
+    def _notify_event(self):
+        with self._event_cond:
+            self._event_count += 1
+            self._event_cond.notify_all()
 
     @property
     def is_connected(self):
@@ -187,7 +215,7 @@ class P2PConnection(asyncio.Protocol):
         self.dstport = dstport
         # The initial message to send after the connection was made:
         self.on_connection_send_msg = None
-        self.recvbuf = b""
+        self.recvbuf = bytearray()
         self.magic_bytes = MAGIC_BYTES[net]
         self.p2p_connected_to_node = dstport != 0
 
@@ -196,7 +224,7 @@ class P2PConnection(asyncio.Protocol):
         if supports_v2_p2p:
             self.v2_state = EncryptedP2PState(initiating=True, net=net)
 
-        loop = NetworkThread.network_event_loop
+        loop = self._loop = NetworkThread.next_event_loop()
         logger.debug('Connecting to Bitcoin Node: %s:%d' % (self.dstaddr, self.dstport))
         coroutine = loop.create_connection(lambda: self, host=self.dstaddr, port=self.dstport)
         return lambda: loop.call_soon_threadsafe(loop.create_task, coroutine)
@@ -212,7 +240,8 @@ class P2PConnection(asyncio.Protocol):
 
     def peer_disconnect(self):
         # Connection could have already been closed by other end.
-        NetworkThread.network_event_loop.call_soon_threadsafe(lambda: self._transport and self._transport.abort())
+        loop = self._loop or NetworkThread.network_event_loop
+        loop.call_soon_threadsafe(lambda: self._transport and self._transport.abort())
 
     # Connection and disconnection methods
 
@@ -226,6 +255,8 @@ class P2PConnection(asyncio.Protocol):
         self.dstaddr = them[0]
         self.dstport = them[1]
         self._transport = transport
+        self._loop = asyncio.get_running_loop()
+        self._notify_event()
         # in an inbound connection to the TestNode with P2PConnection as the initiator, [TestNode <---- P2PConnection]
         # send the initial handshake immediately
         if self.supports_v2_p2p and self.v2_state.initiating and not self.v2_state.tried_v2_handshake:
@@ -246,8 +277,9 @@ class P2PConnection(asyncio.Protocol):
         else:
             logger.debug("Closed connection to: %s:%d" % (self.dstaddr, self.dstport))
         self._transport = None
-        self.recvbuf = b""
+        self.recvbuf = bytearray()
         self.on_close()
+        self._notify_event()
 
     # v2 handshake method
     def _on_data_v2_handshake(self):
@@ -265,7 +297,7 @@ class P2PConnection(asyncio.Protocol):
                 # if the responder hasn't sent garbage yet, the responder is still reading ellswift bytes
                 # reads ellswift bytes till the first mismatch from 12 bytes V1_PREFIX
                 length, send_handshake_bytes = self.v2_state.respond_v2_handshake(BytesIO(self.recvbuf))
-                self.recvbuf = self.recvbuf[length:]
+                del self.recvbuf[:length]
                 if send_handshake_bytes == -1:
                     self.v2_state = None
                     return
@@ -278,7 +310,7 @@ class P2PConnection(asyncio.Protocol):
             # `complete_handshake()` reads the remaining ellswift bytes from recvbuf
             # and sends response after deriving shared ECDH secret using received ellswift bytes
             length, response = self.v2_state.complete_handshake(BytesIO(self.recvbuf))
-            self.recvbuf = self.recvbuf[length:]
+            del self.recvbuf[:length]
             if response:
                 self.send_raw_message(response)
             else:
@@ -291,7 +323,7 @@ class P2PConnection(asyncio.Protocol):
         length, is_mac_auth = self.v2_state.authenticate_handshake(self.recvbuf)
         if not is_mac_auth:
             raise ValueError("invalid v2 mac tag in handshake authentication")
-        self.recvbuf = self.recvbuf[length:]
+        del self.recvbuf[:length]
         if self.v2_state.tried_v2_handshake:
             # for v2 outbound connections, send version message immediately after v2 handshake
             if self.p2p_connected_to_node:
@@ -316,7 +348,12 @@ class P2PConnection(asyncio.Protocol):
 
         This method reads data from the buffer in a loop. It deserializes,
         parses and verifies the P2P header, then passes the P2P payload to
-        the on_message callback for processing."""
+        the on_message callback for processing.
+
+        The buffer is a bytearray, and each message is parsed in place and
+        then dropped with `del recvbuf[:n]`, which only advances the start
+        of the buffer. A burst of messages therefore costs linear, not
+        quadratic, copying."""
         try:
             while True:
                 if self.supports_v2_p2p:
@@ -326,7 +363,7 @@ class P2PConnection(asyncio.Protocol):
                         raise ValueError("invalid v2 mac tag " + repr(self.recvbuf))
                     elif msglen == 0:  # need to receive more bytes in recvbuf
                         return
-                    self.recvbuf = self.recvbuf[msglen:]
+                    del self.recvbuf[:msglen]
 
                     if msg is None:  # ignore decoy messages
                         return
@@ -348,26 +385,25 @@ class P2PConnection(asyncio.Protocol):
                         return
                     if self.recvbuf[:4] != self.magic_bytes:
                         raise ValueError("magic bytes mismatch: {} != {}".format(repr(self.magic_bytes), repr(self.recvbuf)))
-                    if len(self.recvbuf) < 4 + 12 + 4 + 4:
+                    if len(self.recvbuf) < MSG_HEADER_SIZE:
                         return
-                    msgtype = self.recvbuf[4:4+12].split(b"\x00", 1)[0]
-                    msglen = struct.unpack("<i", self.recvbuf[4+12:4+12+4])[0]
-                    checksum = self.recvbuf[4+12+4:4+12+4+4]
-                    if len(self.recvbuf) < 4 + 12 + 4 + 4 + msglen:
+                    msgtype, msglen, checksum = _MSG_HEADER_FIELDS.unpack_from(self.recvbuf, 4)
+                    msgtype = msgtype.split(b"\x00", 1)[0]
+                    if len(self.recvbuf) < MSG_HEADER_SIZE + msglen:
                         return
-                    msg = self.recvbuf[4+12+4+4:4+12+4+4+msglen]
+                    msg = bytes(self.recvbuf[MSG_HEADER_SIZE:MSG_HEADER_SIZE+msglen])
                     th = sha256(msg)
                     h = sha256(th)
                     if checksum != h[:4]:
                         raise ValueError("got bad checksum " + repr(self.recvbuf))
-                    self.recvbuf = self.recvbuf[4+12+4+4+msglen:]
+                    del self.recvbuf[:MSG_HEADER_SIZE+msglen]
                 if msgtype not in MESSAGEMAP:
                     raise ValueError("Received unknown msgtype from %s:%d: '%s' %s" % (self.dstaddr, self.dstport, msgtype, repr(msg)))
-                f = BytesIO(msg)
                 t = MESSAGEMAP[msgtype]()
-                t.deserialize(f)
+                deserialize_message(t, msg)
                 self._log_message("receive", t)
                 self.on_message(t)
+                self._notify_event()
         except Exception as e:
             if not self.reconnect:
                 logger.exception(f"Error reading message: {repr(e)}")
@@ -395,6 +431,17 @@ class P2PConnection(asyncio.Protocol):
             self._log_message("send", message)
             return self.send_raw_message(tmsg)
 
+    def send_many_without_ping(self, messages, is_decoy=False):
+        """Send several P2P messages over the socket in a single write.
+
+        Equivalent to calling send_without_ping for each message, but the
+        messages are built (and for v2 connections, encrypted) in one batch."""
+        with self._send_lock:
+            tmsg = self.build_messages(messages, is_decoy)
+            for message in messages:
+                self._log_message("send", message)
+            return self.send_raw_message(tmsg)
+
     def send_raw_message(self, raw_message_bytes):
         if not self.is_connected:
             raise IOError('Not connected')
@@ -405,24 +452,17 @@ class P2PConnection(asyncio.Protocol):
             if self._transport.is_closing():
                 return
             self._transport.write(raw_message_bytes)
-        NetworkThread.network_event_loop.call_soon_threadsafe(maybe_write)
+        self._loop.call_soon_threadsafe(maybe_write)
 
     # Class utility methods
 
     def build_message(self, message, is_decoy=False):
         """Build a serialized P2P message"""
-        msgtype = message.msgtype
-        data = message.serialize()
         if self.supports_v2_p2p:
-            if msgtype in SHORTID.values():
-                tmsg = MSGTYPE_TO_SHORTID.get(msgtype).to_bytes(1, 'big')
-            else:
-                tmsg = b"\x00"
-                tmsg += msgtype
-                tmsg += b"\x00" * (12 - len(msgtype))
-            tmsg += data
-            return self.v2_state.v2_enc_packet(tmsg, ignore=is_decoy)
+            return self.v2_state.v2_enc_packet(self._v2_contents(message), ignore=is_decoy)
         else:
+            msgtype = message.msgtype
+            data = message.serialize()
             tmsg = self.magic_bytes
             tmsg += msgtype
             tmsg += b"\x00" * (12 - len(msgtype))
@@ -433,6 +473,26 @@ class P2PConnection(asyncio.Protocol):
             tmsg += data
             return tmsg
 
+    def build_messages(self, messages, is_decoy=False):
+        """Build several serialized P2P messages, concatenated"""
+        if self.supports_v2_p2p:
+            contents = [self._v2_contents(message) for message in messages]
+            return b"".join(self.v2_state.v2_enc_packets(contents, ignore=is_decoy))
+        return b"".join(self.build_message(message, is_decoy) for message in messages)
+
+    @staticmethod
+    def _v2_contents(message):
+        """Serialize a message as the contents of a BIP324 packet"""
+        msgtype = message.msgtype
+        if msgtype in SHORTID.values():
+            tmsg = MSGTYPE_TO_SHORTID.get(msgtype).to_bytes(1, 'big')
+        else:
+            tmsg = b"\x00"
+            tmsg += msgtype
+            tmsg += b"\x00" * (12 - len(msgtype))
+        tmsg += message.serialize()
+        return tmsg
+
     def _log_message(self, direction, msg):
         """Logs a message being sent or received over the connection."""
         if direction == "send":
@@ -511,7 +571,7 @@ class P2PInterface(P2PConnection):
 
         We keep a count of how many of each message type has been received
         and the most recent message of each type."""
-        with p2p_lock:
+        with p2p_lock.shared():
             try:
                 msgtype = message.msgtype.decode('ascii')
                 self.message_count[msgtype] += 1
@@ -593,12 +653,27 @@ class P2PInterface(P2PConnection):
     # Connection helper methods
 
     def wait_until(self, test_function_in, *, timeout=60, check_connected=True, check_interval=0.05):
+        """Wait until test_function_in returns True.
+
+        It is re-evaluated as soon as a message arrives on this connection or
+        the connection opens or closes, and at least every check_interval
+        seconds for conditions that depend on anything else."""
         def test_function():
             if check_connected:
                 assert self.is_connected
             return test_function_in()
 
-        wait_until_helper_internal(test_function, timeout=timeout, lock=p2p_lock, timeout_factor=self.timeout_factor, check_interval=check_interval)
+        with self._event_cond:
+            seen = self._event_count
+
+        def wait_for_event(max_wait):
+            nonlocal seen
+            with self._event_cond:
+                self._event_cond.wait_for(lambda: self._event_count != seen, max_wait)
+                seen = self._event_count
+
+        wait_until_helper_internal(test_function, timeout=timeout, lock=p2p_lock, timeout_factor=self.timeout_factor,
+                                   check_interval=check_interval, sleep=wait_for_event)
 
     def wait_for_connect(self, *, timeout=60):
         test_function = lambda: self.is_connected
@@ -717,40 +792,125 @@ class P2PInterface(P2PConnection):
         self.ping_counter += 1
 
 
+class P2PLock:
+    """A lock that can be held exclusively or shared.
+
+    `with lock:` acquires it exclusively, like a threading.Lock. `with
+    lock.shared():` can be held by any number of threads at once, but not
+    while it is held exclusively. Waiting exclusive acquirers take precedence,
+    so a steady stream of shared holders cannot starve them."""
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._exclusive = False
+        self._exclusive_waiting = 0
+        self._shared = 0
+
+    def acquire(self, blocking=True, timeout=-1):
+        with self._cond:
+            self._exclusive_waiting += 1
+            try:
+                if not blocking:
+                    timeout = 0
+                acquired = self._cond.wait_for(lambda: not self._exclusive and not self._shared,
+                                               None if timeout < 0 else timeout)
+                if acquired:
+                    self._exclusive = True
+                return acquired
+            finally:
+                self._exclusive_waiting -= 1
+
+    def release(self):
+        with self._cond:
+            if not self._exclusive:
+                raise RuntimeError("release unlocked lock")
+            self._exclusive = False
+            self._cond.notify_all()
+
+    def locked(self):
+        return self._exclusive
+
+    __enter__ = acquire
+
+    def __exit__(self, *args):
+        self.release()
+
+    @contextmanager
+    def shared(self):
+        with self._cond:
+            self._cond.wait_for(lambda: not self._exclusive and not self._exclusive_waiting)
+            self._shared += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._shared -= 1
+                if not self._shared:
+                    self._cond.notify_all()
+
+
 # One lock for synchronizing all data access between the network event loop (see
-# NetworkThread below) and the thread running the test logic.  For simplicity,
-# P2PConnection acquires this lock whenever delivering a message to a P2PInterface.
-# This lock should be acquired in the thread running the test logic to synchronize
-# access to any data shared with the P2PInterface or P2PConnection.
-p2p_lock = threading.Lock()
+# NetworkThread below) and the thread running the test logic. P2PInterface holds
+# it in shared mode whenever delivering a message, which keeps connections from
+# contending with each other. This lock should be acquired (exclusively) in the
+# thread running the test logic to synchronize access to any data shared with
+# the P2PInterface or P2PConnection.
+p2p_lock = P2PLock()
 
 
 class NetworkThread(threading.Thread):
+    """Runs the event loops serving all P2P connections.
+
+    With num_loops > 1, additional event loops run on helper threads and new
+    connections are spread across all loops round-robin. This spreads the
+    serialization, encryption and callback work of many peers over several
+    threads. network_event_loop is always the first loop."""
     network_event_loop = None
+    network_event_loops: list[asyncio.AbstractEventLoop] = []
 
-    def __init__(self):
+    def __init__(self, *, num_loops=1):
         super().__init__(name="NetworkThread")
-        # There is only one event loop and no more than one thread must be created
+        # There is only one set of event loops and no more than one NetworkThread must be created
         assert not self.network_event_loop
+        assert num_loops >= 1
 
         NetworkThread.listeners = {}
+        NetworkThread.listen_loops = {}
         NetworkThread.protos = {}
         if platform.system() == 'Windows':
             asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
-        NetworkThread.network_event_loop = asyncio.new_event_loop()
+        NetworkThread.network_event_loops = [asyncio.new_event_loop() for _ in range(num_loops)]
+        NetworkThread.network_event_loop = NetworkThread.network_event_loops[0]
+        NetworkThread.loop_counter = itertools.count()
+        self.helper_threads = [threading.Thread(target=loop.run_forever, name="NetworkThread-{}".format(i), daemon=True)
+                               for i, loop in enumerate(self.network_event_loops[1:], start=1)]
+
+    def start(self):
+        super().start()
+        for thread in self.helper_threads:
+            thread.start()
 
     def run(self):
         """Start the network thread."""
         self.network_event_loop.run_forever()
 
     def close(self, *, timeout=10):
-        """Close the connections and network event loop."""
-        self.network_event_loop.call_soon_threadsafe(self.network_event_loop.stop)
-        wait_until_helper_internal(lambda: not self.network_event_loop.is_running(), timeout=timeout)
-        self.network_event_loop.close()
+        """Close the connections and network event loops."""
+        for loop in self.network_event_loops:
+            loop.call_soon_threadsafe(loop.stop)
+        wait_until_helper_internal(lambda: not any(loop.is_running() for loop in self.network_event_loops), timeout=timeout)
+        for loop in self.network_event_loops:
+            loop.close()
         self.join(timeout)
-        # Safe to remove event loop.
+        for thread in self.helper_threads:
+            thread.join(timeout)
+        # Safe to remove event loops.
         NetworkThread.network_event_loop = None
+        NetworkThread.network_event_loops = []
+
+    @classmethod
+    def next_event_loop(cls):
+        """Return the event loop that should serve a new connection."""
+        return cls.network_event_loops[next(cls.loop_counter) % len(cls.network_event_loops)]
 
     @classmethod
     def listen(cls, p2p, callback, port=None, addr=None, idx=1):
@@ -768,9 +928,15 @@ class NetworkThread(threading.Thread):
             if not p2p.reconnect:
                 loop.default_exception_handler(context)
 
-        cls.network_event_loop.set_exception_handler(exception_handler)
+        # Connections accepted by a listening server are served by the loop
+        # it runs on, so a port keeps the loop it was first assigned.
+        if (addr, port) not in cls.listen_loops:
+            cls.listen_loops[(addr, port)] = cls.next_event_loop()
+        loop = cls.listen_loops[(addr, port)]
+        p2p._loop = loop
+        loop.set_exception_handler(exception_handler)
         coroutine = cls.create_listen_server(addr, port, callback, p2p)
-        cls.network_event_loop.call_soon_threadsafe(cls.network_event_loop.create_task, coroutine)
+        loop.call_soon_threadsafe(loop.create_task, coroutine)
 
     @classmethod
     async def create_listen_server(cls, addr, port, callback, proto):
@@ -793,7 +959,7 @@ class NetworkThread(threading.Thread):
             # connections, we can accomplish this by providing different
             # `proto` functions
 
-            listener = await cls.network_event_loop.create_server(peer_protocol, addr, port)
+            listener = await asyncio.get_running_loop().create_server(peer_protocol, addr, port)
             logger.debug("Listening server on %s:%d should be started" % (addr, port))
             cls.listeners[(addr, port)] = listener
 
@@ -880,8 +1046,7 @@ class P2PDataStore(P2PInterface):
             if is_decoy:  # since decoy messages are ignored by the recipient - no need to wait for response
                 force_send = True
             if force_send:
-                for b in blocks:
-                    self.send_without_ping(msg_block(block=b), is_decoy)
+                self.send_many_without_ping([msg_block(block=b) for b in blocks], is_decoy)
             else:
                 self.send_without_ping(msg_headers([CBlockHeader(block) for block in blocks]))
                 self.wait_until(
@@ -914,8 +1079,7 @@ class P2PDataStore(P2PInterface):
 
         reject_reason = [reject_reason] if reject_reason else []
         with node.assert_debug_log(expected_msgs=reject_reason):
-            for tx in txs:
-                self.send_without_ping(msg_tx(tx))
+            self.send_many_without_ping([msg_tx(tx) for tx in txs])
 
             self.sync_with_ping()
 
@@ -955,3 +1119,98 @@ class P2PTxInvStore(P2PInterface):
         self.wait_until(lambda: set(self.tx_invs_received.keys()) == set([int(tx, 16) for tx in txns]), timeout=timeout)
         # Flush messages and wait for the getdatas to be processed
         self.sync_with_ping()
+
+
+class TestFrameworkP2P(unittest.TestCase):
+    class Peer(P2PConnection):
+        def __init__(self):
+            super().__init__()
+            self.received = []
+            self.peer_connect_helper("0", 0, "regtest", 1)
+
+        def on_message(self, message):
+            self.received.append(message)
+
+    def check_flood(self, sender, receiver):
+        tx = CTransaction()
+        tx.vin = [CTxIn(COutPoint(1, 0))]
+        tx.vout = [CTxOut(1000, b"\x51")]
+        messages = [msg_inv([CInv(MSG_TX, i)]) if i % 3 else msg_tx(tx) for i in range(1000)]
+        messages.append(msg_ping(1))
+        data = sender.build_messages(messages)
+        # Deliver the burst at random read boundaries
+        rng = random.Random(0)
+        pos = 0
+        while pos < len(data):
+            size = rng.randrange(1, 5000)
+            receiver.data_received(data[pos:pos + size])
+            pos += size
+        self.assertEqual([m.serialize() for m in receiver.received], [m.serialize() for m in messages])
+        self.assertEqual(len(receiver.recvbuf), 0)
+
+    def test_receive_flood_v1(self):
+        sender = self.Peer()
+        self.check_flood(sender, self.Peer())
+
+    def test_receive_flood_v2(self):
+        ecdh_secret = random.randbytes(32)
+        sender, receiver = self.Peer(), self.Peer()
+        sender.v2_state = EncryptedP2PState(initiating=True, net="regtest")
+        receiver.v2_state = EncryptedP2PState(initiating=False, net="regtest")
+        sender.v2_state.initialize_v2_transport(ecdh_secret)
+        receiver.v2_state.initialize_v2_transport(ecdh_secret)
+        receiver.v2_state.tried_v2_handshake = True
+        self.check_flood(sender, receiver)
+
+    def test_p2p_lock(self):
+        lock = P2PLock()
+        with lock.shared(), lock.shared():
+            self.assertFalse(lock.acquire(timeout=0.01))
+        acquired = threading.Event()
+        release = threading.Event()
+
+        def hold_shared():
+            with lock.shared():
+                acquired.set()
+                release.wait()
+
+        with lock:
+            self.assertTrue(lock.locked())
+            blocked = threading.Thread(target=hold_shared)
+            blocked.start()
+            # The shared hold waits for the exclusive one to be released
+            self.assertFalse(acquired.wait(0.05))
+        self.assertTrue(acquired.wait(10))
+        self.assertFalse(lock.acquire(timeout=0.01))
+        release.set()
+        blocked.join()
+        self.assertFalse(lock.locked())
+        self.assertTrue(lock.acquire(timeout=0.01))
+        lock.release()
+
+    def test_wait_until_wakeup(self):
+        peer = P2PInterface()
+        peer.peer_connect_helper("0", 0, "regtest", 1)
+        data = peer.build_message(msg_pong(7))
+        timer = threading.Timer(0.1, lambda: peer.data_received(data))
+        timer.start()
+        start = time.time()
+        # Returns on delivery of the pong instead of after check_interval
+        peer.wait_until(lambda: "pong" in peer.last_message, check_connected=False, check_interval=30)
+        self.assertLess(time.time() - start, 10)
+        timer.join()
+
+    def test_network_thread_loops(self):
+        network_thread = NetworkThread(num_loops=3)
+        network_thread.start()
+        try:
+            loops = [NetworkThread.next_event_loop() for _ in range(6)]
+            self.assertEqual(loops, NetworkThread.network_event_loops * 2)
+
+            async def thread_name():
+                return threading.current_thread().name
+            names = {asyncio.run_coroutine_threadsafe(thread_name(), loop).result(10) for loop in loops}
+            self.assertEqual(names, {"NetworkThread", "NetworkThread-1", "NetworkThread-2"})
+        finally:
+            network_thread.close()
+        self.assertIsNone(NetworkThread.network_event_loop)
@@ -15,6 +15,7 @@ from .key import TaggedHash, tweak_add_pubkey, compute_xonly_pubkey
 from .messages import (
     CTransaction,
     CTxOut,
+    from_hex,
     hash256,
     ser_string,
     sha256,
@@ -695,42 +696,35 @@ def sign_input_legacy(tx, input_index, input_scriptpubkey, privkey, sighash_type
     der_sig = privkey.sign_ecdsa(sighash)
     tx.vin[input_index].scriptSig = bytes(CScript([der_sig + bytes([sighash_type])])) + tx.vin[input_index].scriptSig
 
-def sign_input_segwitv0(tx, input_index, input_scriptpubkey, input_amount, privkey, sighash_type=SIGHASH_ALL):
+def sign_input_segwitv0(tx, input_index, input_scriptpubkey, input_amount, privkey, sighash_type=SIGHASH_ALL, txdata=None):
     """Add segwitv0 ECDSA signature for a given transaction input. Note that the signature
        is inserted at the bottom of the witness stack, i.e. additional witness data
-       needed (e.g. pubkey for P2WPKH) can already be set before."""
-    sighash = SegwitV0SignatureHash(input_scriptpubkey, tx, input_index, sighash_type, input_amount)
+       needed (e.g. pubkey for P2WPKH) can already be set before. When signing many
+       inputs of the same transaction, pass a PrecomputedTransactionData as txdata."""
+    sighash = SegwitV0SignatureHash(input_scriptpubkey, tx, input_index, sighash_type, input_amount, txdata)
     der_sig = privkey.sign_ecdsa(sighash)
     tx.wit.vtxinwit[input_index].scriptWitness.stack.insert(0, der_sig + bytes([sighash_type]))
 
-# TODO: Allow cached hashPrevouts/hashSequence/hashOutputs to be provided.
-# Performance optimization probably not necessary for python tests, however.
 # Note that this corresponds to sigversion == 1 in EvalScript, which is used
-# for version 0 witnesses.
-def SegwitV0SignatureMsg(script, txTo, inIdx, hashtype, amount):
+# for version 0 witnesses. The transaction-wide hashes are taken from txdata
+# (a PrecomputedTransactionData for txTo) if provided.
+def SegwitV0SignatureMsg(script, txTo, inIdx, hashtype, amount, txdata=None):
     ZERO_HASH = bytes([0]*32)
 
     hashPrevouts = ZERO_HASH
     hashSequence = ZERO_HASH
     hashOutputs = ZERO_HASH
+    if txdata is None:
+        txdata = PrecomputedTransactionData(txTo)
 
     if not (hashtype & SIGHASH_ANYONECANPAY):
-        serialize_prevouts = bytes()
-        for i in txTo.vin:
-            serialize_prevouts += i.prevout.serialize()
-        hashPrevouts = hash256(serialize_prevouts)
+        hashPrevouts = txdata.hashPrevouts
 
     if (not (hashtype & SIGHASH_ANYONECANPAY) and (hashtype & 0x1f) != SIGHASH_SINGLE and (hashtype & 0x1f) != SIGHASH_NONE):
-        serialize_sequence = bytes()
-        for i in txTo.vin:
-            serialize_sequence += i.nSequence.to_bytes(4, "little")
-        hashSequence = hash256(serialize_sequence)
+        hashSequence = txdata.hashSequence
 
     if ((hashtype & 0x1f) != SIGHASH_SINGLE and (hashtype & 0x1f) != SIGHASH_NONE):
-        serialize_outputs = bytes()
-        for o in txTo.vout:
-            serialize_outputs += o.serialize()
-        hashOutputs = hash256(serialize_outputs)
+        hashOutputs = txdata.hashOutputs
     elif ((hashtype & 0x1f) == SIGHASH_SINGLE and inIdx < len(txTo.vout)):
         serialize_outputs = txTo.vout[inIdx].serialize()
         hashOutputs = hash256(serialize_outputs)
@@ -793,6 +787,26 @@ class TestFrameworkScript(unittest.TestCase):
                 self.assertEqual(multisig_script.GetSigOpCount(fAccurate=False), 20)
                 self.assertEqual(multisig_script.GetSigOpCount(fAccurate=True), n)
 
+    def test_precomputed_txdata(self):
+        # BIP143 native P2WPKH example
+        tx = from_hex(CTransaction(), "0100000002fff7f7881a8099afa6940d42d1e7f6362bec38171ea3edf433541db4e4ad969f0000000000eeffffff"
+                                      "ef51e1b804cc89d182d279655c3aa89e815b1b309fe287d9b2b55d57b90ec68a0100000000ffffffff02202cb206"
+                                      "000000001976a9148280b37df378db99f66f85c95a783a76ac7a6d5988ac9093510d000000001976a9143bde42db"
+                                      "ee7e4dbe6a21b2d50ce2f0167faa815988ac11000000")
+        scriptcode = bytes.fromhex("76a9141d0f172a0ecb48aee1be1f2687d2963ae33f71a188ac")
+        spent_utxos = [CTxOut(625000000, CScript([OP_1, bytes(32)])), CTxOut(600000000, CScript([OP_1, bytes(range(32))]))]
+        txdata = PrecomputedTransactionData(tx, spent_utxos)
+        for t in (None, txdata, PrecomputedTransactionData(tx)):
+            self.assertEqual(SegwitV0SignatureHash(scriptcode, tx, 1, SIGHASH_ALL, 600000000, t).hex(),
+                             "c37af31116d1b27caf68aae9e3ac82f1477929014d5b917657d0eb49478cb670")
+        for hash_type in (SIGHASH_DEFAULT, SIGHASH_ALL, SIGHASH_NONE, SIGHASH_SINGLE, SIGHASH_ALL | SIGHASH_ANYONECANPAY):
+            for idx in range(2):
+                self.assertEqual(TaprootSignatureMsg(tx, spent_utxos, hash_type, idx, txdata=txdata),
+                                 TaprootSignatureMsg(tx, spent_utxos, hash_type, idx))
+                if hash_type != SIGHASH_DEFAULT:
+                    self.assertEqual(SegwitV0SignatureMsg(scriptcode, tx, idx, hash_type, 1, txdata),
+                                     SegwitV0SignatureMsg(scriptcode, tx, idx, hash_type, 1))
+
 def BIP341_sha_prevouts(txTo):
     return sha256(b"".join(i.prevout.serialize() for i in txTo.vin))
 
@@ -808,9 +822,36 @@ def BIP341_sha_sequences(txTo):
 def BIP341_sha_outputs(txTo):
     return sha256(b"".join(o.serialize() for o in txTo.vout))
 
-def TaprootSignatureMsg(txTo, spent_utxos, hash_type, input_index=0, *, scriptpath=False, leaf_script=None, codeseparator_pos=-1, annex=None, leaf_ver=LEAF_VERSION_TAPSCRIPT):
+class PrecomputedTransactionData:
+    """The transaction-wide hashes used in BIP143 and BIP341 signature messages.
+
+    Like the node's PrecomputedTransactionData, this is computed once per
+    transaction and passed as txdata to SegwitV0SignatureMsg/TaprootSignatureMsg
+    (and the functions using them), so that signing all inputs of a transaction
+    does not take quadratic time. spent_utxos is only needed for BIP341. The
+    object must be recreated if the inputs, outputs or spent outputs change."""
+
+    def __init__(self, txTo, spent_utxos=None):
+        self.prevouts_single_hash = BIP341_sha_prevouts(txTo)
+        self.sequences_single_hash = BIP341_sha_sequences(txTo)
+        self.outputs_single_hash = BIP341_sha_outputs(txTo)
+        # BIP143 uses the double SHA256 of the same data.
+        self.hashPrevouts = sha256(self.prevouts_single_hash)
+        self.hashSequence = sha256(self.sequences_single_hash)
+        self.hashOutputs = sha256(self.outputs_single_hash)
+        self.spent_amounts_single_hash = None
+        self.spent_scripts_single_hash = None
+        if spent_utxos is not None:
+            assert len(txTo.vin) == len(spent_utxos)
+            self.spent_amounts_single_hash = BIP341_sha_amounts(spent_utxos)
+            self.spent_scripts_single_hash = BIP341_sha_scriptpubkeys(spent_utxos)
+
+def TaprootSignatureMsg(txTo, spent_utxos, hash_type, input_index=0, *, scriptpath=False, leaf_script=None, codeseparator_pos=-1, annex=None, leaf_ver=LEAF_VERSION_TAPSCRIPT, txdata=None):
     assert (len(txTo.vin) == len(spent_utxos))
     assert (input_index < len(txTo.vin))
+    if txdata is None:
+        txdata = PrecomputedTransactionData(txTo, spent_utxos)
+    assert txdata.spent_amounts_single_hash is not None
     out_type = SIGHASH_ALL if hash_type == 0 else hash_type & 3
     in_type = hash_type & SIGHASH_ANYONECANPAY
     spk = spent_utxos[input_index].scriptPubKey
@@ -818,12 +859,12 @@ def TaprootSignatureMsg(txTo, spent_utxos, hash_type, input_index=0, *, scriptpa
     ss += txTo.version.to_bytes(4, "little")
     ss += txTo.nLockTime.to_bytes(4, "little")
     if in_type != SIGHASH_ANYONECANPAY:
-        ss += BIP341_sha_prevouts(txTo)
-        ss += BIP341_sha_amounts(spent_utxos)
-        ss += BIP341_sha_scriptpubkeys(spent_utxos)
-        ss += BIP341_sha_sequences(txTo)
+        ss += txdata.prevouts_single_hash
+        ss += txdata.spent_amounts_single_hash
+        ss += txdata.spent_scripts_single_hash
+        ss += txdata.sequences_single_hash
     if out_type == SIGHASH_ALL:
-        ss += BIP341_sha_outputs(txTo)
+        ss += txdata.outputs_single_hash
     spend_type = 0
     if annex is not None:
         spend_type |= 1
@@ -21,7 +21,7 @@ import tempfile
 import time
 
 from .address import create_deterministic_address_bcrt1_p2tr_op_true
-from .authproxy import JSONRPCException
+from .authproxy import JSONRPCException, RPCBatch
 from . import coverage
 from .p2p import NetworkThread
 from .test_node import TestNode
@@ -31,6 +31,7 @@ from .util import (
     PortSeed,
     assert_equal,
     check_json_precision,
+    copy_datadir,
     export_env_build_path,
     find_vout_for_address,
     get_binary_paths,
@@ -53,6 +54,9 @@ TEST_EXIT_SKIPPED = 77
 
 TMPDIR_PREFIX = "bitcoin_func_test_"
 
+# Initial interval between polls in sync_mempools, doubled after every poll
+SYNC_POLL_INTERVAL = 0.05
+
 
 class SkipTest(Exception):
     """This exception is raised to skip a test"""
@@ -194,6 +198,8 @@ class BitcoinTestFramework(metaclass=BitcoinTestMetaClass):
         parser.add_argument("--randomseed", type=int,
                             help="set a random seed for deterministically reproducing a previous test run")
         parser.add_argument("--timeout-factor", dest="timeout_factor", type=float, help="adjust test timeouts by a factor. Setting it to 0 disables all timeouts")
+        parser.add_argument("--p2pthreads", dest="p2pthreads", default=1, type=int,
+                            help="number of network threads to spread the test's P2P connections over (default: %(default)s)")
         parser.add_argument("--v2transport", dest="v2transport", default=False, action="store_true",
                             help="use BIP324 v2 connections between all nodes by default")
         parser.add_argument("--v1transport", dest="v1transport", default=False, action="store_true",
@@ -256,7 +262,7 @@ class BitcoinTestFramework(metaclass=BitcoinTestMetaClass):
         self.log.info("PRNG seed is: {}".format(seed))
 
         self.log.debug('Setting up network thread')
-        self.network_thread = NetworkThread()
+        self.network_thread = NetworkThread(num_loops=self.options.p2pthreads)
         self.network_thread.start()
 
         if self.options.usecli:
@@ -698,17 +704,27 @@ class BitcoinTestFramework(metaclass=BitcoinTestMetaClass):
         sync_blocks needs to be called with an rpc_connections set that has least
         one node already synced to the latest, stable tip, otherwise there's a
         chance it might return before all nodes are stably synced.
+
+        Nodes lagging behind the most-work tip are long-polled with
+        waitforblock, so this returns as soon as the tip arrives. `wait` bounds
+        each long poll, which matters when nodes are on competing tips.
         """
         rpc_connections = nodes or self.nodes
         timeout = int(timeout * self.options.timeout_factor)
         stop_time = time.time() + timeout
         while time.time() <= stop_time:
-            best_hash = [x.getbestblockhash() for x in rpc_connections]
+            best_hash, block_count, connection_count = self._batch_per_node(
+                rpc_connections, "getbestblockhash", "getblockcount", "getconnectioncount")
             if best_hash.count(best_hash[0]) == len(rpc_connections):
                 return
             # Check that each peer has at least one connection
-            assert (all([len(x.getpeerinfo()) for x in rpc_connections]))
-            time.sleep(wait)
+            assert all(connection_count)
+            target = best_hash[block_count.index(max(block_count))]
+            for node, node_hash in zip(rpc_connections, best_hash):
+                # waitforblock treats a zero timeout as "wait forever"
+                timeout_ms = int(min(wait, stop_time - time.time()) * 1000)
+                if node_hash != target and timeout_ms > 0:
+                    node.waitforblock(target, timeout_ms)
         raise AssertionError("Block sync timed out after {}s:{}".format(
             timeout,
             "".join("\n  {!r}".format(b) for b in best_hash),
@@ -718,25 +734,42 @@ class BitcoinTestFramework(metaclass=BitcoinTestMetaClass):
         """
         Wait until everybody has the same transactions in their memory
         pools
+
+        There is no RPC to wait on for mempool changes, so the nodes are
+        polled with an interval growing from SYNC_POLL_INTERVAL up to `wait`.
         """
         rpc_connections = nodes or self.nodes
         timeout = int(timeout * self.options.timeout_factor)
         stop_time = time.time() + timeout
+        poll_interval = SYNC_POLL_INTERVAL
         while time.time() <= stop_time:
-            pool = [set(r.getrawmempool()) for r in rpc_connections]
+            mempools, connection_count = self._batch_per_node(rpc_connections, "getrawmempool", "getconnectioncount")
+            pool = [set(mempool) for mempool in mempools]
             if pool.count(pool[0]) == len(rpc_connections):
                 if flush_scheduler:
                     for r in rpc_connections:
                         r.syncwithvalidationinterfacequeue()
                 return
             # Check that each peer has at least one connection
-            assert (all([len(x.getpeerinfo()) for x in rpc_connections]))
-            time.sleep(wait)
+            assert all(connection_count)
+            time.sleep(min(poll_interval, wait))
+            poll_interval *= 2
         raise AssertionError("Mempool sync timed out after {}s:{}".format(
             timeout,
             "".join("\n  {!r}".format(m) for m in pool),
         ))
 
+    @staticmethod
+    def _batch_per_node(rpc_connections, *methods):
+        """Call each method on every node, with one round trip per node.
+
+        Returns one list of per-node results for every method."""
+        futures = []
+        for node in rpc_connections:
+            with RPCBatch(node) as batch:
+                futures.append([getattr(batch, method)() for method in methods])
+        return [[node_futures[i].result() for node_futures in futures] for i in range(len(methods))]
+
     def sync_all(self, nodes=None):
         self.sync_blocks(nodes)
         self.sync_mempools(nodes)
@@ -851,7 +884,7 @@ class BitcoinTestFramework(metaclass=BitcoinTestMetaClass):
         for i in range(self.num_nodes):
             self.log.debug("Copy cache directory {} to node {}".format(cache_node_dir, i))
             to_dir = get_datadir_path(self.options.tmpdir, i)
-            shutil.copytree(cache_node_dir, to_dir)
+            copy_datadir(cache_node_dir, to_dir)
             initialize_datadir(self.options.tmpdir, i, self.chain, self.disable_autoconnect)  # Overwrite port/rpcport in bitcoin.conf
 
     def _initialize_chain_clean(self):
@@ -25,6 +25,7 @@ import sys
 from pathlib import Path
 
 from .authproxy import (
+    AuthServiceProxyPool,
     JSONRPCException,
     serialization_fallback,
 )
@@ -36,6 +37,7 @@ from .util import (
     assert_not_equal,
     append_config,
     delete_cookie_file,
+    get_async_rpc_proxy,
     get_auth_cookie,
     get_rpc_proxy,
     rpc_url,
@@ -433,6 +435,19 @@ class TestNode():
             wallet_path = "wallet/{}".format(urllib.parse.quote(wallet_name))
             return self._rpc / wallet_path
 
+    def get_rpc_pool(self, size=8, wallet_name=None):
+        """Return a thread-safe RPC client with up to `size` connections to this node."""
+        assert self.rpc_connected and self._rpc, self._node_msg("RPC not connected")
+        url = self.url
+        if wallet_name is not None:
+            url += "/wallet/{}".format(urllib.parse.quote(wallet_name))
+        return AuthServiceProxyPool(url, size, timeout=self.rpc_timeout)
+
+    def get_async_rpc(self, **kwargs):
+        """Return an AsyncAuthServiceProxy connected to this node."""
+        assert self.rpc_connected, self._node_msg("RPC not connected")
+        return get_async_rpc_proxy(self.datadir_path, self.index, self.chain, self.rpchost, **kwargs)
+
     def version_is_at_least(self, ver):
         return self.version is None or self.version >= ver
 
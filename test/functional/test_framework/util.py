@@ -17,11 +17,15 @@ import platform
 import random
 import re
 import shlex
+import shutil
+import tempfile
 import time
 import types
+import unittest
+from unittest import mock
 
 from . import coverage
-from .authproxy import AuthServiceProxy, JSONRPCException
+from .authproxy import AsyncAuthServiceProxy, AuthServiceProxy, JSONRPCException
 from .descriptors import descsum_create
 from collections.abc import Callable
 from typing import Optional, Union
@@ -387,9 +391,13 @@ def ensure_for(*, duration, f, check_interval=0.2):
         time.sleep(check_interval)
 
 
-def wait_until_helper_internal(predicate, *, timeout=60, lock=None, timeout_factor=1.0, check_interval=0.05):
+def wait_until_helper_internal(predicate, *, timeout=60, lock=None, timeout_factor=1.0, check_interval=0.05, sleep=time.sleep):
     """Sleep until the predicate resolves to be True.
 
+    `sleep` is called with check_interval between evaluations of the
+    predicate. It may return early when the predicate is likely to have
+    changed.
+
     Warning: Note that this method is not recommended to be used in tests as it is
     not aware of the context of the test framework. Using the `wait_until()` members
     from `BitcoinTestFramework` or `P2PInterface` class ensures the timeout is
@@ -407,7 +415,7 @@ def wait_until_helper_internal(predicate, *, timeout=60, lock=None, timeout_fact
         else:
             if predicate():
                 return
-        time.sleep(check_interval)
+        sleep(check_interval)
 
     # Print the cause of the timeout
     predicate_source = "''''\n" + inspect.getsource(predicate) + "'''"
@@ -480,6 +488,12 @@ def get_rpc_proxy(url: str, node_number: int, *, timeout: Optional[int]=None, co
     return coverage.AuthServiceProxyWrapper(proxy, url, coverage_logfile)
 
 
+def get_async_rpc_proxy(datadir, i, chain, rpchost=None, **kwargs) -> AsyncAuthServiceProxy:
+    """Return an AsyncAuthServiceProxy for node i, authenticated with the
+    credentials from its bitcoin.conf or .cookie file (see get_auth_cookie)."""
+    return AsyncAuthServiceProxy(rpc_url(datadir, i, chain, rpchost), **kwargs)
+
+
 def p2p_port(n):
     assert n <= MAX_NODES
     return PORT_MIN + n + (MAX_NODES * PortSeed.n) % (PORT_RANGE - 1 - MAX_NODES)
@@ -577,6 +591,35 @@ def get_datadir_path(dirname, n):
     return pathlib.Path(dirname) / f"node{n}"
 
 
+# ioctl request number of FICLONE, from linux/fs.h
+FICLONE = 0x40049409
+
+
+def clone_file(src, dst):
+    """Copy src to dst. On Linux filesystems with reflink support (btrfs, xfs,
+    ...) the data blocks are shared copy-on-write instead of being copied."""
+    if platform.system() == "Linux":
+        import fcntl
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            try:
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            except OSError:
+                pass
+            else:
+                shutil.copystat(src, dst)
+                return dst
+    return shutil.copy2(src, dst)
+
+
+def copy_datadir(src, dst):
+    """Copy the datadir src to dst as cheaply as the filesystem allows.
+
+    Files are reflinked where supported and copied otherwise. They are never
+    hard-linked, as tests may modify any file of a datadir in place (e.g.
+    feature_blocksxor.py rewrites the block files)."""
+    shutil.copytree(src, dst, copy_function=clone_file)
+
+
 def get_temp_default_datadir(temp_dir: pathlib.Path) -> tuple[dict, pathlib.Path]:
     """Return os-specific environment variables that can be set to make the
     GetDefaultDataDir() function return a datadir path under the provided
@@ -715,3 +758,41 @@ def wallet_importprivkey(wallet_rpc, privkey, timestamp, *, label=""):
     }]
     import_res = wallet_rpc.importdescriptors(req)
     assert_equal(import_res[0]["success"], True)
+
+
+class TestFrameworkUtil(unittest.TestCase):
+    def test_copy_datadir(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            src = os.path.join(tmpdir, "src")
+            os.makedirs(os.path.join(src, "regtest", "blocks"))
+            files = {os.path.join("regtest", "blocks", f"blk0000{i}.dat"): bytes([i]) * 1000 for i in range(3)}
+            files["bitcoin.conf"] = b"regtest=1\n"
+            for name, data in files.items():
+                with open(os.path.join(src, name), "wb") as f:
+                    f.write(data)
+
+            def check_copy(dst):
+                for name, data in files.items():
+                    path = os.path.join(dst, name)
+                    self.assertNotEqual(os.stat(path).st_ino, os.stat(os.path.join(src, name)).st_ino)
+                    # Modifying a copy in place leaves the source untouched
+                    with open(path, "rb+") as f:
+                        self.assertEqual(f.read(), data)
+                        f.seek(0)
+                        f.write(b"\xff")
+                    with open(os.path.join(src, name), "rb") as f:
+                        self.assertEqual(f.read(), data)
+
+            copy_datadir(src, os.path.join(tmpdir, "dst"))
+            check_copy(os.path.join(tmpdir, "dst"))
+
+            # Filesystems without reflink support fall back to a plain copy
+            if platform.system() == "Linux":
+                import fcntl
+                with mock.patch.object(fcntl, "ioctl", side_effect=OSError(95, "Operation not supported")) as ioctl:
+                    copy_datadir(src, os.path.join(tmpdir, "fallback"))
+                    self.assertEqual(ioctl.call_count, len(files))
+            else:
+                copy_datadir(src, os.path.join(tmpdir, "fallback"))
+            check_copy(os.path.join(tmpdir, "fallback"))
+            self.assertEqual(clone_file(os.path.join(src, "bitcoin.conf"), os.path.join(tmpdir, "conf")), os.path.join(tmpdir, "conf"))
@@ -258,6 +258,20 @@ class EncryptedP2PState:
         enc_plaintext_len = self.peer['send_L'].crypt(len(contents).to_bytes(LENGTH_FIELD_LEN, 'little'))
         return enc_plaintext_len + aead_ciphertext
 
+    def v2_enc_packets(self, contents_list, aad=b'', ignore=False):
+        """Encrypt several BIP324 packets, equivalent to calling v2_enc_packet on each in turn.
+
+        The length fields of all packets are encrypted in one batch.
+
+        Returns:
+        list of bytes - encrypted packets
+        """
+        assert all(len(contents) <= 2**24 - 1 for contents in contents_list)
+        header = (ignore << IGNORE_BIT_POS).to_bytes(HEADER_LEN, 'little')
+        aead_ciphertexts = self.peer['send_P'].encrypt_many(aad, [header + contents for contents in contents_list])
+        enc_plaintext_lens = self.peer['send_L'].crypt_many([len(contents).to_bytes(LENGTH_FIELD_LEN, 'little') for contents in contents_list])
+        return [enc_len + ciphertext for enc_len, ciphertext in zip(enc_plaintext_lens, aead_ciphertexts)]
+
     def v2_receive_packet(self, response, aad=b''):
         """Decrypt a BIP324 packet
 
@@ -268,16 +282,16 @@ class EncryptedP2PState:
         if self.contents_len == -1:
             if len(response) < LENGTH_FIELD_LEN:
                 return 0, None
-            enc_contents_len = response[:LENGTH_FIELD_LEN]
+            enc_contents_len = bytes(response[:LENGTH_FIELD_LEN])
             self.contents_len = int.from_bytes(self.peer['recv_L'].crypt(enc_contents_len), 'little')
-        response = response[LENGTH_FIELD_LEN:]
-        if len(response) < HEADER_LEN + self.contents_len + CHACHA20POLY1305_EXPANSION:
+        # Only slice out the packet itself, response may hold many more
+        length = LENGTH_FIELD_LEN + HEADER_LEN + self.contents_len + CHACHA20POLY1305_EXPANSION
+        if len(response) < length:
             return 0, None
-        aead_ciphertext = response[:HEADER_LEN + self.contents_len + CHACHA20POLY1305_EXPANSION]
+        aead_ciphertext = bytes(response[LENGTH_FIELD_LEN:length])
         plaintext = self.peer['recv_P'].decrypt(aad, aead_ciphertext)
         if plaintext is None:
             return -1, None  # disconnect
         header = plaintext[:HEADER_LEN]
-        length = LENGTH_FIELD_LEN + HEADER_LEN + self.contents_len + CHACHA20POLY1305_EXPANSION
         self.contents_len = -1
         return length, None if (header[0] & (1 << IGNORE_BIT_POS)) else plaintext[HEADER_LEN:]
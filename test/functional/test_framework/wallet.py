@@ -19,6 +19,7 @@ from test_framework.address import (
     key_to_p2wpkh,
     output_key_to_p2tr,
 )
+from test_framework.authproxy import RPCBatch
 from test_framework.blocktools import COINBASE_MATURITY
 from test_framework.descriptors import descsum_create
 from test_framework.key import (
@@ -144,8 +145,10 @@ class MiniWallet:
             mempool = self._test_node.getrawmempool(verbose=True)
             # Sort tx by ancestor count. See BlockAssembler::SortForBlock in src/node/miner.cpp
             sorted_mempool = sorted(mempool.items(), key=lambda item: (item[1]["ancestorcount"], int(item[0], 16)))
-            for txid, _ in sorted_mempool:
-                self.scan_tx(self._test_node.getrawtransaction(txid=txid, verbose=True))
+            with RPCBatch(self._test_node) as batch:
+                txs = [batch.getrawtransaction(txid=txid, verbose=True) for txid, _ in sorted_mempool]
+            for tx in txs:
+                self.scan_tx(tx.result())
 
     def scan_tx(self, tx):
         """Scan the tx and adjust the internal list of owned utxos"""
@@ -13,11 +13,12 @@ For a description of arguments recognized by test scripts, see
 """
 
 import argparse
+import asyncio
 from collections import deque
-from concurrent import futures
 import configparser
 import csv
 import datetime
+import json
 import os
 import pathlib
 import platform
@@ -36,6 +37,10 @@ MIN_FREE_SPACE = 1.1 * 1024 * 1024 * 1024
 ADDITIONAL_SPACE_PER_JOB = 100 * 1024 * 1024
 # Minimum amount of space required for --nocleanup
 MIN_NO_CLEANUP_SPACE = 12 * 1024 * 1024 * 1024
+# Seconds between refreshes of the progress line (only with --ansi)
+PROGRESS_REFRESH_INTERVAL = 1
+# Maximum number of bytes of a test's output read to find its latest log line
+MAX_PROGRESS_LINE_LENGTH = 200
 
 # Formatting. Default colors to empty strings.
 DEFAULT, BOLD, GREEN, RED = ("", ""), ("", ""), ("", ""), ("", "")
@@ -411,6 +416,11 @@ def main():
     parser.add_argument("--nocleanup", dest="nocleanup", default=False, action="store_true",
                         help="Leave bitcoinds and test.* datadir on exit or error")
     parser.add_argument('--resultsfile', '-r', help='store test results (as CSV) to the provided file')
+    parser.add_argument('--shard', metavar='i/n', help='only run the i-th of n (1-based) deterministic partitions of the test list, balanced by the durations in --timings')
+    parser.add_argument('--timings', metavar='FILE', action='append', default=[], help='results file (as written by --resultsfile) of a previous run to take test durations from. Can be specified multiple times.')
+    parser.add_argument('--mergeresults', metavar='FILE', nargs='+', help='merge the results files of several shards into --resultsfile and exit')
+    parser.add_argument('--timingsdb', metavar='FILE', help='file in which test durations are recorded after each run and used to start the longest tests first. Default is test/functional_test_timings.json in the build directory.')
+    parser.add_argument('--noreorder', action='store_true', help='run the tests in list order instead of starting the longest (as per --timingsdb and --timings) first')
 
     args, unknown_args = parser.parse_known_args()
     fail_on_warn = args.ci
@@ -421,6 +431,11 @@ def main():
         GREEN = ("", "")
         RED = ("", "")
 
+    if args.mergeresults:
+        if not args.resultsfile:
+            parser.error("--mergeresults requires --resultsfile")
+        sys.exit(not merge_results(args.mergeresults, pathlib.Path(args.resultsfile)))
+
     # args to be passed on always start with two dashes; tests are the remaining unknown args
     tests = [arg for arg in unknown_args if arg[:2] != "--"]
     passon_args = [arg for arg in unknown_args if arg[:2] == "--"]
@@ -514,6 +529,18 @@ def main():
     if args.filter:
         test_list = deque(filter(re.compile(args.filter).search, test_list))
 
+    if args.shard:
+        match = re.fullmatch(r"(\d+)/(\d+)", args.shard)
+        if not match or not 1 <= int(match.group(1)) <= int(match.group(2)):
+            parser.error(f"invalid --shard value '{args.shard}', expected i/n with 1 <= i <= n")
+        shard_index, shard_count = int(match.group(1)), int(match.group(2))
+        durations = read_test_durations(args.timings)
+        test_list = deque(shard_test_list(test_list, shard_index, shard_count, durations))
+        if not test_list:
+            print(f"No tests assigned to shard {shard_index}/{shard_count}.")
+            sys.exit(0)
+        logging.debug(f"Running shard {shard_index}/{shard_count} with {len(test_list)} tests")
+
     if not test_list:
         print("No valid test scripts specified. Check that your test is in one "
               "of the test lists in test_runner.py, or run test_runner.py with no arguments to run all tests")
@@ -538,6 +565,12 @@ def main():
     if not args.keepcache:
         shutil.rmtree("%s/test/cache" % config["environment"]["BUILDDIR"], ignore_errors=True)
 
+    timings_db = args.timingsdb or os.path.join(config["environment"]["BUILDDIR"], "test", "functional_test_timings.json")
+    if not args.noreorder:
+        durations = load_timings_db(timings_db)
+        durations.update(read_test_durations(args.timings))
+        test_list = deque(order_by_duration(test_list, durations))
+
     run_tests(
         test_list=test_list,
         build_dir=config["environment"]["BUILDDIR"],
@@ -549,9 +582,10 @@ def main():
         failfast=args.failfast,
         use_term_control=args.ansi,
         results_filepath=results_filepath,
+        timings_db=timings_db,
     )
 
-def run_tests(*, test_list, build_dir, tmpdir, jobs=1, enable_coverage=False, args=None, combined_logs_len=0, failfast=False, use_term_control, results_filepath=None):
+def run_tests(*, test_list, build_dir, tmpdir, jobs=1, enable_coverage=False, args=None, combined_logs_len=0, failfast=False, use_term_control, results_filepath=None, timings_db=None):
     args = args or []
 
     # Warn if bitcoind is already running
@@ -651,6 +685,8 @@ def run_tests(*, test_list, build_dir, tmpdir, jobs=1, enable_coverage=False, ar
     print_results(test_results, max_len_name, runtime)
     if results_filepath:
         write_results(test_results, results_filepath, runtime)
+    if timings_db:
+        update_timings_db(timings_db, test_results)
 
     if coverage:
         coverage_passed = coverage.report_rpc_coverage()
@@ -708,13 +744,144 @@ def write_results(test_results, filepath, total_runtime):
             results_writer.writerow([test_result.name, test_result.status, str(test_result.time)])
         results_writer.writerow(['ALL', ("Passed" if all_passed else "Failed"), str(total_runtime)])
 
+def read_test_durations(filepaths):
+    """Read test durations from results files written by write_results().
+
+    Returns a dict of test name to duration in seconds, averaged over all
+    files a test appears in. Missing files are ignored."""
+    durations = {}
+    for filepath in filepaths:
+        if not os.path.isfile(filepath):
+            continue
+        with open(filepath, encoding="utf8") as results_file:
+            for row in csv.DictReader(results_file):
+                if row['test'] == 'ALL' or row['status'] == 'Skipped':
+                    continue
+                durations.setdefault(row['test'], []).append(int(row['duration(seconds)']))
+    return {test: sum(times) / len(times) for test, times in durations.items()}
+
+
+def shard_test_list(test_list, shard_index, shard_count, durations):
+    """Return the tests of the shard_index-th (1-based) of shard_count shards.
+
+    Tests are assigned longest first to the currently shortest shard, so that
+    shards finish at about the same time. Tests without a known duration are
+    assumed to take the median known duration. The assignment only depends on
+    the inputs, so every shard computes the same partition. The tests of the
+    shard keep their order in test_list."""
+    known = sorted(durations.values())
+    default_duration = known[len(known) // 2] if known else 1
+    loads = [0] * shard_count
+    assignment = {}
+    for test in sorted(test_list, key=lambda t: (-durations.get(t, default_duration), t)):
+        shard = loads.index(min(loads))
+        loads[shard] += durations.get(test, default_duration)
+        assignment[test] = shard
+    return [test for test in test_list if assignment[test] == shard_index - 1]
+
+
+def load_timings_db(filepath):
+    """Return the test durations recorded by update_timings_db(), if any."""
+    try:
+        with open(filepath, encoding="utf8") as timings_file:
+            return json.load(timings_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def update_timings_db(filepath, test_results):
+    """Record the durations of the tests that ran in the timings database.
+
+    Each entry is an exponential moving average over the runs, so a single
+    slow run does not reorder the suite. Only passed tests are recorded, as
+    skipped and failed (e.g. timed out) runs say little about the duration.
+
+    The file is replaced atomically through a uniquely named temporary file,
+    so runners sharing the database (e.g. shards run side by side) never see
+    or write a partial file."""
+    durations = load_timings_db(filepath)
+    for test_result in test_results:
+        if test_result.status != "Passed":
+            continue
+        previous = durations.get(test_result.name)
+        durations[test_result.name] = test_result.time if previous is None else (previous + test_result.time) / 2
+    with tempfile.NamedTemporaryFile("w", encoding="utf8", dir=os.path.dirname(os.path.abspath(filepath)),
+                                     prefix=os.path.basename(filepath), suffix=".tmp", delete=False) as timings_file:
+        json.dump(durations, timings_file, indent=1, sort_keys=True)
+    os.replace(timings_file.name, filepath)
+
+
+def order_by_duration(test_list, durations):
+    """Order tests longest first, so that the jobs finish at about the same time.
+
+    Starting the longest tests first and handing out the rest as jobs become
+    free is the longest-processing-time heuristic for packing tests onto the
+    jobs. Tests without a known duration are assumed to take the median known
+    duration. The sort is stable, so without any durations the list order is
+    kept."""
+    known = sorted(durations.get(test) for test in test_list if test in durations)
+    if not known:
+        return list(test_list)
+    default_duration = known[len(known) // 2]
+    return sorted(test_list, key=lambda test: -durations.get(test, default_duration))
+
+
+def merge_results(input_filepaths, output_filepath):
+    """Combine the results files of several shards into one report.
+
+    The ALL row reports the longest shard runtime, as shards run
+    concurrently. Returns whether all tests passed."""
+    test_results = []
+    runtime = 0
+    for filepath in input_filepaths:
+        with open(filepath, encoding="utf8") as results_file:
+            for row in csv.DictReader(results_file):
+                if row['test'] == 'ALL':
+                    runtime = max(runtime, int(row['duration(seconds)']))
+                else:
+                    test_results.append(TestResult(row['test'], row['status'], int(row['duration(seconds)'])))
+    if not test_results:
+        print("No test results found in {}".format(", ".join(input_filepaths)))
+        return False
+    max_len_name = len(max((test_result.name for test_result in test_results), key=len))
+    print_results(test_results, max_len_name, runtime)
+    write_results(test_results, output_filepath, runtime)
+    return all(test_result.was_successful for test_result in test_results)
+
+
+class TestJob:
+    """A test script running as a subprocess of the TestHandler."""
+    def __init__(self, name, argv, testdir):
+        self.name = name
+        self.argv = argv
+        self.testdir = testdir
+        self.start_time = time.time()
+        self.end_time = None
+        # The test writes its output directly to these files, so it never
+        # blocks on the runner, and memory use does not depend on how verbose
+        # a test is. They are opened in append mode, so that reading them
+        # (see last_line()) does not move the position the test writes at.
+        self.log_stdout = tempfile.TemporaryFile(mode='a+b')
+        self.log_stderr = tempfile.TemporaryFile(mode='a+b')
+
+    def last_line(self):
+        size = self.log_stdout.seek(0, os.SEEK_END)
+        self.log_stdout.seek(max(0, size - MAX_PROGRESS_LINE_LENGTH))
+        tail = self.log_stdout.read()
+        return tail.rstrip(b"\n").rsplit(b"\n", 1)[-1].decode('utf-8', 'replace').strip()
+
+
 class TestHandler:
     """
     Trigger the test scripts passed in via the list.
+
+    The tests run as asyncio subprocesses, so get_next() returns as soon as a
+    test exits. Their output is written to temporary files.
     """
     def __init__(self, *, num_tests_parallel, tests_dir, tmpdir, test_list, flags, use_term_control):
         assert num_tests_parallel >= 1
-        self.executor = futures.ThreadPoolExecutor(max_workers=num_tests_parallel)
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
         self.num_jobs = num_tests_parallel
         self.tests_dir = tests_dir
         self.tmpdir = tmpdir
@@ -722,78 +889,80 @@ class TestHandler:
         self.flags = flags
         self.jobs = {}
         self.use_term_control = use_term_control
+        self.progress_len = 0
 
     def done(self):
         return not (self.jobs or self.test_list)
 
     def get_next(self):
+        return self.loop.run_until_complete(self._get_next())
+
+    async def _get_next(self):
         while len(self.jobs) < self.num_jobs and self.test_list:
             # Add tests
             test = self.test_list.popleft()
             portseed = len(self.test_list)
             portseed_arg = ["--portseed={}".format(portseed)]
-            log_stdout = tempfile.SpooledTemporaryFile(max_size=2**16)
-            log_stderr = tempfile.SpooledTemporaryFile(max_size=2**16)
             test_argv = test.split()
             testdir = "{}/{}_{}".format(self.tmpdir, re.sub(".py$", "", test_argv[0]), portseed)
             tmpdir_arg = ["--tmpdir={}".format(testdir)]
-
-            def proc_wait(task):
-                task[2].wait()
-                return task
-
-            task = [
-                test,
-                time.time(),
-                subprocess.Popen(
-                    [sys.executable, self.tests_dir + test_argv[0]] + test_argv[1:] + self.flags + portseed_arg + tmpdir_arg,
-                    text=True,
-                    stdout=log_stdout,
-                    stderr=log_stderr,
-                ),
-                testdir,
-                log_stdout,
-                log_stderr,
-            ]
-            fut = self.executor.submit(proc_wait, task)
-            self.jobs[fut] = test
+            job = TestJob(test, [sys.executable, self.tests_dir + test_argv[0]] + test_argv[1:] + self.flags + portseed_arg + tmpdir_arg, testdir)
+            self.jobs[self.loop.create_task(self._run_test(job))] = job
         assert self.jobs  # Must not be empty here
 
         # Print remaining running jobs when all jobs have been started.
         if not self.test_list:
-            print("Remaining jobs: [{}]".format(", ".join(sorted(self.jobs.values()))))
+            print("Remaining jobs: [{}]".format(", ".join(sorted(job.name for job in self.jobs.values()))))
 
-        dot_count = 0
         while True:
-            # Return all procs that have finished, if any. Otherwise sleep until there is one.
-            procs = futures.wait(self.jobs.keys(), timeout=.5, return_when=futures.FIRST_COMPLETED)
-            self.jobs = {fut: self.jobs[fut] for fut in procs.not_done}
-            ret = []
-            for job in procs.done:
-                (name, start_time, proc, testdir, log_out, log_err) = job.result()
-
-                log_out.seek(0), log_err.seek(0)
-                [stdout, stderr] = [log_file.read().decode('utf-8') for log_file in (log_out, log_err)]
-                log_out.close(), log_err.close()
-                skip_reason = None
-                if proc.returncode == TEST_EXIT_PASSED and stderr == "":
-                    status = "Passed"
-                elif proc.returncode == TEST_EXIT_SKIPPED:
-                    status = "Skipped"
-                    skip_reason = re.search(r"Test Skipped: (.*)", stdout).group(1)
-                else:
-                    status = "Failed"
-
-                if self.use_term_control:
-                    clearline = '\r' + (' ' * dot_count) + '\r'
-                    print(clearline, end='', flush=True)
-                dot_count = 0
-                ret.append((TestResult(name, status, int(time.time() - start_time)), testdir, stdout, stderr, skip_reason))
-            if ret:
-                return ret
-            if self.use_term_control:
-                print('.', end='', flush=True)
-            dot_count += 1
+            # Wake up as soon as a test exits. With terminal control, also
+            # refresh the progress line periodically while waiting.
+            done, _ = await asyncio.wait(self.jobs.keys(),
+                                         timeout=PROGRESS_REFRESH_INTERVAL if self.use_term_control else None,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if done:
+                break
+            self._print_progress()
+
+        if self.use_term_control:
+            print('\r' + (' ' * self.progress_len) + '\r', end='', flush=True)
+            self.progress_len = 0
+        ret = []
+        for task in done:
+            job = self.jobs.pop(task)
+            returncode = task.result()
+
+            log_out, log_err = job.log_stdout, job.log_stderr
+            log_out.seek(0), log_err.seek(0)
+            [stdout, stderr] = [log_file.read().decode('utf-8') for log_file in (log_out, log_err)]
+            log_out.close(), log_err.close()
+            skip_reason = None
+            if returncode == TEST_EXIT_PASSED and stderr == "":
+                status = "Passed"
+            elif returncode == TEST_EXIT_SKIPPED:
+                status = "Skipped"
+                skip_reason = re.search(r"Test Skipped: (.*)", stdout).group(1)
+            else:
+                status = "Failed"
+
+            ret.append((TestResult(job.name, status, int(job.end_time - job.start_time)), job.testdir, stdout, stderr, skip_reason))
+        return ret
+
+    async def _run_test(self, job):
+        proc = await asyncio.create_subprocess_exec(*job.argv, stdout=job.log_stdout, stderr=job.log_stderr)
+        returncode = await proc.wait()
+        job.end_time = time.time()
+        return returncode
+
+    def _print_progress(self):
+        """Show the longest running test, its elapsed time and its latest log line."""
+        job = min(self.jobs.values(), key=lambda job: job.start_time)
+        line = "{} running | {} {} s | {}".format(
+            len(self.jobs), job.name, int(time.time() - job.start_time),
+            job.last_line())
+        line = line[:shutil.get_terminal_size()[0] - 1]
+        print('\r' + line.ljust(self.progress_len), end='', flush=True)
+        self.progress_len = len(line)
 
 
 class TestResult():
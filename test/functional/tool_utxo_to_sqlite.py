@@ -112,6 +112,13 @@ class UtxoToSqliteTest(BitcoinTestFramework):
         muhash_compact_serialized = node.gettxoutsetinfo('muhash')['muhash']
         assert_equal(muhash_sqlite, muhash_compact_serialized)
 
+        self.log.info('Verify the MuHash computed directly from the compact-serialized UTXO set')
+        utxo_to_muhash_path = os.path.join(base_dir, "contrib", "utxo-tools", "utxo_to_muhash.py")
+        for jobs in (1, 2):
+            result = subprocess.run([sys.executable, utxo_to_muhash_path, f"--jobs={jobs}", input_filename],
+                                    check=True, stdout=subprocess.PIPE, text=True)
+            assert_equal(result.stdout.strip(), muhash_compact_serialized)
+
 
 if __name__ == "__main__":
     UtxoToSqliteTest(__file__).main()